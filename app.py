@@ -4,9 +4,7 @@
 인증 후 탭별 UI를 로드합니다. (기능은 tabs/ 및 auth, sheets, photo_utils, config 모듈에 분리)
 """
 
-import gspread
 import streamlit as st
-from google.oauth2.service_account import Credentials
 
 from config import SPREADSHEET_NAME
 import auth
@@ -23,24 +21,17 @@ from tabs import (
 
 
 # ------------------------
-# 구글 시트 클라이언트
+# 구글 시트 클라이언트 (프로세스 공용 — 모든 세션이 같은 인증·핸들을 재사용, 스프레드시트는 캐시된 ID로 열기)
 # ------------------------
-scope = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive",
-]
-creds = Credentials.from_service_account_info(
-    st.secrets["gcp_service_account"],
-    scopes=scope,
-)
-client = gspread.authorize(creds)
+sheets.init(SPREADSHEET_NAME)
 
 # ------------------------
 # 인증 (비밀번호·세션)
 # ------------------------
-auth.init(client, SPREADSHEET_NAME)
+auth.init(SPREADSHEET_NAME)
 auth.check_password()
 auth.show_change_password_if_needed()
+auth.show_session_admin()
 
 if st.session_state.get("show_bookmark_hint"):
     st.info("💡 이 주소를 **북마크**해 두시면 30일 동안 비밀번호 없이 이용할 수 있습니다.")
@@ -49,8 +40,7 @@ if st.session_state.get("show_bookmark_hint"):
 # ------------------------
 # 시트 연결 (탭에서 데이터 로드)
 # ------------------------
-sheets.init(client, SPREADSHEET_NAME)
-sheets.get_sheet()  # 연결 검증 및 세션 캐시
+sheets.get_sheet()  # 연결 검증 (프로세스 공용 핸들)
 
 # ------------------------
 # 탭 UI (선택 탭을 세션·URL·단말별 저장으로 유지 — 다시 들어와도 마지막 탭 복원)
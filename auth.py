@@ -2,53 +2,65 @@
 """비밀번호·세션(URL 토큰·단말 지문) 인증."""
 
 import base64
+import functools
 import hashlib
 import json
 import secrets
+import threading
+import time
 from datetime import datetime, timedelta
 
 import streamlit as st
 from cryptography.fernet import Fernet
 
-from config import SESSION_DAYS, BUDGET_SPREADSHEET_NAME
-
-
-def init(client, spreadsheet_name: str):
-    """인증 모듈 초기화. app에서 client·스프레드시트 이름 설정."""
-    global _client, _spreadsheet_name
-    _client = client
+import sheets
+from config import (
+    BUDGET_CONFIG_TTL_SEC,
+    BUDGET_SPREADSHEET_NAME,
+    REVOCATION_TTL_SEC,
+    SESSION_DAYS,
+    SESSION_MISS_RELOAD_SEC,
+    SESSION_RECONCILE_SEC,
+    SESSION_TOKEN_MODE,
+    SESSIONS_COMPACT_ROWS,
+    SESSIONS_LOCK_SEC,
+)
+
+
+def init(spreadsheet_name: str):
+    """인증 모듈 초기화. app에서 스프레드시트 이름 설정. (클라이언트·핸들은 sheets 공용 연결 사용)"""
+    global _spreadsheet_name
     _spreadsheet_name = spreadsheet_name
 
 
 def _get_fernet():
-    """Secrets의 encryption_key로 Fernet 인스턴스 생성."""
+    """Secrets의 encryption_key로 만든 Fernet 인스턴스 (프로세스 공용, 키가 바뀌면 새로 만듦)."""
     raw = st.secrets.get("encryption_key")
     if not raw:
         raise ValueError("Secrets에 encryption_key를 설정해 주세요. (Streamlit Cloud: 설정 → Secrets)")
+    return _fernet_for(raw)
+
+
+@functools.lru_cache(maxsize=4)
+def _fernet_for(raw: str) -> Fernet:
     key = base64.urlsafe_b64encode(hashlib.sha256(raw.encode()).digest())
     return Fernet(key)
 
 
 def _get_config_worksheet():
-    """출석용 스프레드시트 안의 'config' 시트 반환. 없으면 생성."""
-    import gspread
-    sheet = _client.open(_spreadsheet_name)
-    try:
-        return sheet.worksheet("config")
-    except gspread.exceptions.WorksheetNotFound:
-        sheet.add_worksheet(title="config", rows=2, cols=2)
-        return sheet.worksheet("config")
+    """출석용 스프레드시트 안의 'config' 시트 반환 (공용 핸들). 없으면 생성."""
+    return sheets.open_worksheet(
+        _spreadsheet_name, "config",
+        on_missing=lambda sheet: sheet.add_worksheet(title="config", rows=2, cols=2),
+    )
 
 
 def _get_budget_config_worksheet():
-    """예산청구 전용 스프레드시트 안의 'config' 시트 반환. 없으면 생성. (결재/조회 비밀번호, 결재자 정보). 최소 6행 3열 보장."""
-    import gspread
-    sheet = _client.open(BUDGET_SPREADSHEET_NAME)
-    try:
-        ws = sheet.worksheet("config")
-    except gspread.exceptions.WorksheetNotFound:
-        sheet.add_worksheet(title="config", rows=6, cols=3)
-        return sheet.worksheet("config")
+    """예산청구 전용 스프레드시트 안의 'config' 시트 반환 (공용 핸들). 없으면 생성. (결재/조회 비밀번호, 결재자 정보). 최소 6행 3열 보장."""
+    ws = sheets.open_worksheet(
+        BUDGET_SPREADSHEET_NAME, "config",
+        on_missing=lambda sheet: sheet.add_worksheet(title="config", rows=6, cols=3),
+    )
     if ws.row_count < 6:
         ws.add_rows(6 - ws.row_count)
     if ws.col_count < 3:
@@ -74,103 +86,134 @@ def set_stored_password(plain_password: str):
     _get_config_worksheet().update_acell("A1", enc)
 
 
+class _BudgetConfig:
+    """예산청구 config 시트(B1:C5) 값 (프로세스 공용). B1:C5 한 번 읽기로 채우고 BUDGET_CONFIG_TTL_SEC 동안 재사용.
+    이 프로세스의 설정 변경은 시트에 쓴 뒤 여기에도 바로 반영 (write-through). 읽기 실패는 캐시하지 않음.
+    값: 연도(B5), 결재 비밀번호(B1), 조회 비밀번호(C1), 결재자 부서·이름·직책(B2:B4). 비밀번호는 복호화한 값."""
+
+    FIELDS = ("year", "approval_password", "view_password", "부서", "이름", "직책")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = None
+        self._loaded_at = 0.0
+        self.loads = 0
+        self.hits = 0
+
+    @staticmethod
+    def _read() -> dict:
+        rows = _get_budget_config_worksheet().get("B1:C5")
+        rows = [list(r) for r in (rows or [])] + [[] for _ in range(5)]
+
+        def cell(r, c):
+            return str((rows[r][c] if len(rows[r]) > c else None) or "").strip()
+
+        def decrypt(enc):
+            if not enc:
+                return None
+            try:
+                return _get_fernet().decrypt(enc.encode()).decode()
+            except Exception:
+                return None
+
+        return {
+            "year": cell(4, 0) or None,
+            "approval_password": decrypt(cell(0, 0)),
+            "view_password": decrypt(cell(0, 1)),
+            "부서": cell(1, 0),
+            "이름": cell(2, 0),
+            "직책": cell(3, 0),
+        }
+
+    def values(self) -> dict:
+        with self._lock:
+            if self._values is not None and time.monotonic() - self._loaded_at < BUDGET_CONFIG_TTL_SEC:
+                self.hits += 1
+                return dict(self._values)
+        values = self._read()
+        with self._lock:
+            self._values = values
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+            return dict(values)
+
+    def update(self, **changes):
+        """시트에 쓴 값을 캐시에도 반영. 캐시가 비어 있으면 다음 읽기 때 시트에서."""
+        with self._lock:
+            if self._values is not None:
+                self._values.update(changes)
+
+    def clear(self):
+        with self._lock:
+            self._values = {f: None if f in ("year", "approval_password", "view_password") else "" for f in self.FIELDS}
+            self._loaded_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached": self._values is not None, "loads": self.loads, "hits": self.hits}
+
+
+@st.cache_resource(show_spinner=False)
+def _budget_config() -> _BudgetConfig:
+    """프로세스 공용 예산청구 설정."""
+    return _BudgetConfig()
+
+
 def _get_approval_config_year():
-    """결재 설정이 저장된 연도. B5. 없거나 현재 연도와 다르면 None (매년 1월 1일 리셋)."""
+    """결재 설정이 저장된 연도. B5. 없으면 None (현재 연도와 다르면 설정 전체를 리셋된 것으로 봄)."""
     try:
-        ws = _get_budget_config_worksheet()
-        y = ws.acell("B5").value
-        if not y:
-            return None
-        return str(y).strip()
+        return _budget_config().values()["year"]
     except Exception:
         return None
 
 
 def get_budget_config():
-    """예산 조회/결재 설정을 한 번의 시트 읽기로 반환. B1:B5, C1 사용.
+    """예산 조회/결재 설정 (B1:B5, C1). 캐시된 설정 사용, 만료 시 B1:C5 한 번만 읽음.
     반환: {"year_ok": bool, "approval_password": str|None, "view_password": str|None, "approver_info": dict|None}
     """
     try:
-        ws = _get_budget_config_worksheet()
-        # B1:B5, C1 한 번에 읽기 (B1~B5가 1열, C1은 2열 첫 행)
-        rows = ws.get("B1:C5")
-        if not rows or len(rows) < 5:
-            return {"year_ok": False, "approval_password": None, "view_password": None, "approver_info": None}
-        current_year = str(datetime.now().year)
-        year_val = (rows[4][0] if len(rows[4]) > 0 else None) or ""
-        year_ok = str(year_val).strip() == current_year
-        if not year_ok:
-            return {"year_ok": False, "approval_password": None, "view_password": None, "approver_info": None}
-        approval_pw = None
-        view_pw = None
-        fernet = _get_fernet()
-        b1_enc = (rows[0][0] if len(rows[0]) > 0 else None) or ""
-        if b1_enc and str(b1_enc).strip():
-            try:
-                approval_pw = fernet.decrypt(str(b1_enc).strip().encode()).decode()
-            except Exception:
-                pass
-        c1_enc = (rows[0][1] if len(rows[0]) > 1 else None) or ""
-        if c1_enc and str(c1_enc).strip():
-            try:
-                view_pw = fernet.decrypt(str(c1_enc).strip().encode()).decode()
-            except Exception:
-                pass
-        dept = (rows[1][0] if len(rows[1]) > 0 else None) or ""
-        name = (rows[2][0] if len(rows[2]) > 0 else None) or ""
-        title = (rows[3][0] if len(rows[3]) > 0 else None) or ""
-        dept, name, title = str(dept).strip(), str(name).strip(), str(title).strip()
-        approver_info = {"부서": dept, "이름": name, "직책": title} if (dept or name or title) else None
-        return {"year_ok": True, "approval_password": approval_pw, "view_password": view_pw, "approver_info": approver_info}
+        values = _budget_config().values()
     except Exception:
+        values = None
+    if not values or values["year"] != str(datetime.now().year):
         return {"year_ok": False, "approval_password": None, "view_password": None, "approver_info": None}
+    dept, name, title = values["부서"], values["이름"], values["직책"]
+    approver_info = {"부서": dept, "이름": name, "직책": title} if (dept or name or title) else None
+    return {
+        "year_ok": True,
+        "approval_password": values["approval_password"],
+        "view_password": values["view_password"],
+        "approver_info": approver_info,
+    }
 
 
 def get_approval_password():
     """결재(승인)용 비밀번호. B1. 저장 연도가 현재 연도가 아니면 None(리셋)."""
-    try:
-        current_year = str(datetime.now().year)
-        if _get_approval_config_year() != current_year:
-            return None
-        ws = _get_budget_config_worksheet()
-        enc = ws.acell("B1").value
-        if not enc or not enc.strip():
-            return None
-        return _get_fernet().decrypt(enc.strip().encode()).decode()
-    except Exception:
-        return None
+    return get_budget_config()["approval_password"]
 
 
 def set_approval_password(plain_password: str):
     """결재 비밀번호를 B1에 암호화 저장, B5에 현재 연도 저장."""
     enc = _get_fernet().encrypt(plain_password.encode()).decode()
+    year = str(datetime.now().year)
     ws = _get_budget_config_worksheet()
     ws.update_acell("B1", enc)
-    ws.update_acell("B5", str(datetime.now().year))
+    ws.update_acell("B5", year)
+    _budget_config().update(approval_password=plain_password, year=year)
 
 
 def get_approver_info():
     """결재자 정보 (부서, 이름, 직책). B2,B3,B4. 저장 연도가 현재가 아니면 None."""
-    try:
-        current_year = str(datetime.now().year)
-        if _get_approval_config_year() != current_year:
-            return None
-        ws = _get_budget_config_worksheet()
-        dept = (ws.acell("B2").value or "").strip()
-        name = (ws.acell("B3").value or "").strip()
-        title = (ws.acell("B4").value or "").strip()
-        if not dept and not name and not title:
-            return None
-        return {"부서": dept, "이름": name, "직책": title}
-    except Exception:
-        return None
+    return get_budget_config()["approver_info"]
 
 
 def set_approver_info(dept: str, name: str, title: str):
     """결재자 정보를 B2,B3,B4에 저장, B5에 현재 연도 저장."""
     ws = _get_budget_config_worksheet()
     dept_s, name_s, title_s = (dept or "").strip(), (name or "").strip(), (title or "").strip()
-    ws.update("B2:B5", [[dept_s], [name_s], [title_s], [str(datetime.now().year)]])
+    year = str(datetime.now().year)
+    ws.update("B2:B5", [[dept_s], [name_s], [title_s], [year]])
+    _budget_config().update(부서=dept_s, 이름=name_s, 직책=title_s, year=year)
 
 
 def check_approval_password(plain_password: str) -> bool:
@@ -183,30 +226,20 @@ def check_approval_password(plain_password: str) -> bool:
 
 def get_view_password():
     """조회용 비밀번호. C1. 저장 연도가 현재 연도가 아니면 None."""
-    try:
-        current_year = str(datetime.now().year)
-        if _get_approval_config_year() != current_year:
-            return None
-        ws = _get_budget_config_worksheet()
-        enc = ws.acell("C1").value
-        if not enc or not enc.strip():
-            return None
-        return _get_fernet().decrypt(enc.strip().encode()).decode()
-    except Exception:
-        return None
+    return get_budget_config()["view_password"]
 
 
 def set_view_password(plain_password: str):
     """조회 비밀번호를 C1에 암호화 저장."""
     enc = _get_fernet().encrypt(plain_password.encode()).decode()
     _get_budget_config_worksheet().update_acell("C1", enc)
+    _budget_config().update(view_password=plain_password)
 
 
 def check_view_or_approval_password(plain_password: str) -> bool:
     """입력한 비밀번호가 조회 비밀번호 또는 결재 비밀번호와 일치하면 True."""
-    view_pw = get_view_password()
-    approval_pw = get_approval_password()
-    return check_view_or_approval_password_given(plain_password, view_pw, approval_pw)
+    config = get_budget_config()
+    return check_view_or_approval_password_given(plain_password, config["view_password"], config["approval_password"])
 
 
 def check_view_or_approval_password_given(plain_password: str, view_password: str | None, approval_password: str | None) -> bool:
@@ -221,8 +254,11 @@ def check_view_or_approval_password_given(plain_password: str, view_password: st
 
 
 def get_fingerprint_hash() -> str | None:
-    """현재 요청의 단말(브라우저) 식별용 해시. 단말별 기본값 저장/로드에 사용."""
-    return _get_fingerprint_hash()
+    """현재 요청의 단말(브라우저) 식별용 해시. 단말별 기본값 저장/로드에 사용.
+    세션 동안 요청 헤더가 바뀌지 않으므로 세션당 한 번만 계산."""
+    if "auth_fingerprint_hash" not in st.session_state:
+        st.session_state["auth_fingerprint_hash"] = _get_fingerprint_hash()
+    return st.session_state["auth_fingerprint_hash"]
 
 
 def clear_budget_approval_config():
@@ -230,58 +266,250 @@ def clear_budget_approval_config():
     try:
         ws = _get_budget_config_worksheet()
         ws.batch_clear(["B1:B5", "C1"])
+        _budget_config().clear()
     except Exception:
         pass
 
 
+def get_budget_config_stats() -> dict:
+    """예산청구 설정 캐시 통계 (캐시 여부, 시트 읽기 횟수, 캐시에서 답한 횟수)."""
+    return _budget_config().stats()
+
+
 def _get_sessions_worksheet():
-    """'sessions' 시트 반환. 없으면 생성."""
-    import gspread
-    sheet = _client.open(_spreadsheet_name)
-    try:
-        return sheet.worksheet("sessions")
-    except gspread.exceptions.WorksheetNotFound:
-        sheet.add_worksheet(title="sessions", rows=2, cols=3)
-        ws = sheet.worksheet("sessions")
+    """'sessions' 시트 반환 (공용 핸들). 없으면 생성."""
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="sessions", rows=2, cols=3)
         ws.update("A1:C1", [["sid", "exp", "typ"]])
         return ws
 
+    return sheets.open_worksheet(_spreadsheet_name, "sessions", on_missing=_create)
+
+
+# sessions 시트 정리 잠금 셀 (sid|exp|typ 오른쪽)
+SESSIONS_LOCK_CELL = "D1"
+
 
 def _hash_session_id(session_id: str) -> str:
     return hashlib.sha256(session_id.encode()).hexdigest()
 
 
+class _SessionRegistry:
+    """sessions 시트의 유효 세션·단말 해시 → 만료 시각 (프로세스 공용).
+    시트는 처음 한 번 읽고, 이후 확인은 메모리에서 (시트 읽기 없음). 로그인 때 추가하는 행은 바로 반영.
+    다른 곳에서 바뀐 내용(다른 프로세스의 로그인, 지운 행)은 SESSION_RECONCILE_SEC 마다 백그라운드로 다시 읽어 맞춤.
+    모르는 해시는 마지막으로 읽은 지 SESSION_MISS_RELOAD_SEC 이 지났을 때만 바로 다시 읽음."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 정리(시트 다시 쓰기) 중에는 이 프로세스의 행 추가를 기다리게 함
+        self._exp = None  # (종류 "s"/"f", 해시) -> 만료 시각 (여러 행이면 가장 늦은 것)
+        self._loaded_at = 0.0
+        self._reconciling = False
+        self._compacting = False
+        self.loads = 0
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+        self.compacted_rows = 0
+
+    def _read(self) -> dict:
+        rows = _get_sessions_worksheet().get_all_values()
+        now = datetime.now().timestamp()
+        exp, stale = {}, 0
+        for row in rows[1:]:
+            try:
+                ts = int(row[1])
+            except (ValueError, TypeError, IndexError):
+                stale += 1
+                continue
+            if ts < now:
+                stale += 1
+            if not row[0]:
+                continue
+            typ = row[2] if len(row) >= 3 and row[2] else "s"
+            key = (typ, row[0])
+            exp[key] = max(ts, exp.get(key, ts))
+        # 전체 행 수가 아니라 정리로 지울 행(만료·깨진 행) 수로 판단: 살아 있는 세션이 많아도 매번 다시 쓰지 않음
+        if stale > SESSIONS_COMPACT_ROWS:
+            self._compact_in_background()
+        return exp
+
+    def _reload(self):
+        """시트를 다시 읽어 맞춤. 재시작·오래된 목록에서 여러 세션이 동시에 부르면 한 번만 읽고 나머지는 그 결과를 기다림."""
+        sheets.single_flight("sessions", self._load)
+
+    def _load(self):
+        exp = self._read()
+        with self._lock:
+            self._exp = exp
+            self._loaded_at = time.time()
+            self.loads += 1
+
+    def _reconcile_in_background(self):
+        with self._lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+
+        def run():
+            try:
+                self._reload()
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._reconciling = False
+
+        threading.Thread(target=run, name="sessions-reconcile", daemon=True).start()
+
+    def is_valid(self, typ: str, h: str) -> bool:
+        exp = self.expiry(typ, h)
+        return exp is not None and exp >= datetime.now().timestamp()
+
+    def expiry(self, typ: str, h: str) -> int | None:
+        """해시의 만료 시각. 모르면 None."""
+        with self._lock:
+            loaded = self._exp is not None
+            age = time.time() - self._loaded_at
+        if not loaded or (age >= SESSION_MISS_RELOAD_SEC and not self._known(typ, h)):
+            self._reload()
+        elif age >= SESSION_RECONCILE_SEC:
+            self._reconcile_in_background()
+        with self._lock:
+            exp = self._exp.get((typ, h))
+            if exp is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return exp
+
+    def _known(self, typ: str, h: str) -> bool:
+        with self._lock:
+            return (typ, h) in self._exp
+
+    def add(self, typ: str, h: str, exp_ts: float):
+        """시트에 행을 추가하고 메모리에도 바로 반영."""
+        with self._write_lock:
+            _get_sessions_worksheet().append_row([h, str(int(exp_ts)), typ])
+        with self._lock:
+            if self._exp is not None:
+                key = (typ, h)
+                self._exp[key] = max(int(exp_ts), self._exp.get(key, 0))
+
+    def compact(self) -> dict:
+        """만료된 행을 뺀 sessions 시트를 범위 쓰기 한 번으로 다시 씀 (남는 아래 행은 빈 값).
+        다른 프로세스와 겹치지 않도록 잠금 셀(SESSIONS_LOCK_CELL)에 만료 시각이 있는 표시를 남기고, 남이 잡고 있으면 건너뜀.
+        반환: {"removed": 지운 행 수, "kept": 남긴 행 수, "bytes_saved": 지운 셀 글자 수} 또는 {"skipped": True}."""
+        ws = _get_sessions_worksheet()
+        now = datetime.now().timestamp()
+        mark = f"{secrets.token_hex(4)}:{int(now + SESSIONS_LOCK_SEC)}"
+        with self._write_lock:
+            if not sheets.claim_lock_cell(ws, SESSIONS_LOCK_CELL, mark, now):
+                return {"skipped": True}
+            try:
+                rows = ws.get_all_values()
+                header, body = (rows[0] if rows else ["sid", "exp", "typ"]), rows[1:]
+                keep, removed_bytes = [], 0
+                for row in body:
+                    try:
+                        alive = int(row[1]) >= now
+                    except (ValueError, TypeError, IndexError):
+                        alive = False
+                    if alive:
+                        keep.append((list(row) + ["", "", ""])[:3])
+                    else:
+                        removed_bytes += sum(len(str(v)) for v in row[:3])
+                removed = len(body) - len(keep)
+                if removed:
+                    out = [header[:3]] + keep + [["", "", ""]] * removed
+                    ws.update(f"A1:C{len(out)}", out)
+            finally:
+                ws.update_acell(SESSIONS_LOCK_CELL, "")
+        self._reload_from(keep)
+        with self._lock:
+            self.compactions += 1
+            self.compacted_rows += removed
+        return {"removed": removed, "kept": len(keep), "bytes_saved": removed_bytes}
+
+    def _reload_from(self, rows: list):
+        exp = {}
+        for h, ts, typ in rows:
+            key = (typ or "s", h)
+            exp[key] = max(int(ts), exp.get(key, int(ts)))
+        with self._lock:
+            self._exp = exp
+            self._loaded_at = time.time()
+
+    def _compact_in_background(self):
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._compacting = False
+
+        threading.Thread(target=run, name="sessions-compact", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._exp) if self._exp is not None else None,
+                "age_sec": round(time.time() - self._loaded_at, 1) if self._exp is not None else None,
+                "loads": self.loads,
+                "hits": self.hits,
+                "misses": self.misses,
+                "compactions": self.compactions,
+                "compacted_rows": self.compacted_rows,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _sessions() -> _SessionRegistry:
+    """프로세스 공용 세션 목록."""
+    return _SessionRegistry()
+
+
+def compact_sessions() -> dict:
+    """sessions 시트에서 만료된 행 정리. 만료된 행이 SESSIONS_COMPACT_ROWS 개를 넘으면 읽을 때 자동으로도 실행됨."""
+    return _sessions().compact()
+
+
+def get_session_registry_stats() -> dict:
+    """세션 목록 통계 (항목 수, 마지막으로 읽은 뒤 지난 초, 시트 읽기 횟수, 메모리에서 찾은·못 찾은 수)."""
+    return _sessions().stats()
+
+
 def _add_session_to_sheet(session_id: str, exp_ts: float):
-    ws = _get_sessions_worksheet()
-    ws.append_row([_hash_session_id(session_id), str(int(exp_ts)), "s"])
+    _sessions().add("s", _hash_session_id(session_id), exp_ts)
 
 
 def _is_session_valid_in_sheet(session_id: str, exp_ts: float) -> bool:
     if datetime.now().timestamp() >= exp_ts:
         return False
     try:
-        ws = _get_sessions_worksheet()
-        rows = ws.get_all_values()
-        if not rows or len(rows) < 2:
-            return False
-        h = _hash_session_id(session_id)
-        now_ts = int(datetime.now().timestamp())
-        for row in rows[1:]:
-            if len(row) >= 2 and row[0] == h and (len(row) < 3 or row[2] in ("", "s")):
-                try:
-                    return int(row[1]) >= now_ts
-                except (ValueError, TypeError):
-                    return False
-        return False
+        return _sessions().is_valid("s", _hash_session_id(session_id))
     except Exception:
         return False
 
 
+def _request_headers():
+    headers = getattr(st.context, "headers", None) or {}
+    if not headers and hasattr(st, "request") and hasattr(st.request, "headers"):
+        headers = getattr(st.request, "headers", None) or {}
+    return headers
+
+
 def _get_fingerprint_hash() -> str | None:
     try:
-        headers = getattr(st.context, "headers", None) or {}
-        if not headers and hasattr(st, "request") and hasattr(st.request, "headers"):
-            headers = getattr(st.request, "headers", None) or {}
+        headers = _request_headers()
         header_lower = {}
         for k, v in getattr(headers, "items", lambda: [])():
             header_lower[str(k).lower()] = v
@@ -298,34 +526,26 @@ def _get_fingerprint_hash() -> str | None:
 
 
 def _add_fingerprint_to_sheet(fp_hash: str, exp_ts: float):
-    ws = _get_sessions_worksheet()
-    ws.append_row([fp_hash, str(int(exp_ts)), "f"])
+    _sessions().add("f", fp_hash, exp_ts)
 
 
 def _is_fingerprint_valid_in_sheet(fp_hash: str) -> bool:
     try:
-        ws = _get_sessions_worksheet()
-        rows = ws.get_all_values()
-        if not rows or len(rows) < 2:
+        exp = _sessions().expiry("f", fp_hash)
+        if exp is None or exp < datetime.now().timestamp():
             return False
-        now_ts = datetime.now().timestamp()
-        for row in rows[1:]:
-            if len(row) >= 3 and row[2] == "f" and row[0] == fp_hash:
-                try:
-                    return int(row[1]) >= now_ts
-                except (ValueError, TypeError):
-                    return False
-        return False
+        return _revocations().allows(fp_hash, exp - SESSION_DAYS * 86400)
     except Exception:
         return False
 
 
 def _create_session_token(session_id: str, exp_ts: float) -> str:
-    payload = json.dumps({"id": session_id, "exp": exp_ts})
+    payload = json.dumps({"id": session_id, "exp": exp_ts, "iat": int(datetime.now().timestamp())})
     return _get_fernet().encrypt(payload.encode()).decode()
 
 
 def _validate_session_token(token_value: str):
+    """URL 토큰 복호화 → (세션 id, 만료 시각, 발급 시각). 발급 시각이 없는 예전 토큰은 만료 - SESSION_DAYS."""
     if not token_value or not token_value.strip():
         return None
     try:
@@ -334,11 +554,130 @@ def _validate_session_token(token_value: str):
         sid, exp = data.get("id"), data.get("exp")
         if sid is None or exp is None:
             return None
-        return (sid, float(exp))
+        iat = data.get("iat")
+        return (sid, float(exp), float(iat) if iat is not None else float(exp) - SESSION_DAYS * 86400)
     except Exception:
         return None
 
 
+def _is_token_valid(session_id: str, exp_ts: float, iat: float) -> bool:
+    """URL 토큰 확인. stateless 면 암호화된 내용(만료·발급 시각)과 해제 목록만 봄 (시트 읽기 없음).
+    sheet 면 세션 목록에 있는지도 확인."""
+    if datetime.now().timestamp() >= exp_ts:
+        return False
+    if not _revocations().allows(_hash_session_id(session_id), iat):
+        return False
+    if SESSION_TOKEN_MODE == "stateless":
+        return True
+    return _is_session_valid_in_sheet(session_id, exp_ts)
+
+
+# ------------------------
+# 접속 해제 목록 (config 시트 셀 하나)
+# ------------------------
+# 값: {"nb": 이 시각 전에 발급된 토큰·단말은 모두 무효, "h": {해시 앞 16자: 이 시각 전에 발급된 것만 무효}} (JSON, 해시 순)
+# 해제 뒤 같은 브라우저에서 비밀번호로 다시 로그인하면 새로 발급되므로 통과. 항목은 해제 전 발급분이 모두 만료되면(SESSION_DAYS 뒤) 뺌
+REVOCATION_CELL = "B1"
+REVOCATION_PREFIX_LEN = 16
+
+
+class _Revocations:
+    """해제한 세션·단말 목록 (프로세스 공용). REVOCATION_TTL_SEC 동안은 셀을 다시 읽지 않음.
+    이 프로세스에서 해제하면 바로 반영, 다른 프로세스에서 해제한 것은 TTL 안에 반영."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+        self._hashes = {}
+        self._loaded_at = None
+        self.loads = 0
+
+    @staticmethod
+    def _parse(raw) -> tuple[float, dict]:
+        try:
+            data = json.loads(raw) if raw else {}
+            return float(data.get("nb", 0)), {k: int(v) for k, v in dict(data.get("h", {})).items()}
+        except (ValueError, TypeError, AttributeError):
+            return 0.0, {}
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at < REVOCATION_TTL_SEC:
+                return
+        not_before, hashes = self._parse(_get_config_worksheet().acell(REVOCATION_CELL).value)
+        with self._lock:
+            self._not_before, self._hashes = not_before, hashes
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def allows(self, h: str, issued_at: float) -> bool:
+        self._ensure_fresh()
+        with self._lock:
+            return issued_at >= max(self._not_before, self._hashes.get(h[:REVOCATION_PREFIX_LEN], 0))
+
+    def revoke(self, hashes: list[str] | None = None, not_before: float | None = None):
+        """해시들을 지금 시각으로 해제하거나 not_before 를 올림. 셀을 새로 읽어 합친 뒤 해제 전 발급분이 모두 만료된 항목은 빼고 다시 씀."""
+        ws = _get_config_worksheet()
+        cur_nb, cur = self._parse(ws.acell(REVOCATION_CELL).value)
+        now = datetime.now().timestamp()
+        nb = max(cur_nb, not_before or 0)
+        merged = {k: v for k, v in cur.items() if v + SESSION_DAYS * 86400 >= now}
+        for h in hashes or []:
+            merged[h[:REVOCATION_PREFIX_LEN]] = int(now)
+        ws.update_acell(REVOCATION_CELL, json.dumps({"nb": int(nb), "h": dict(sorted(merged.items()))}, separators=(",", ":")))
+        with self._lock:
+            self._not_before, self._hashes = nb, merged
+            self._loaded_at = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"not_before": self._not_before, "revoked": len(self._hashes), "loads": self.loads}
+
+
+@st.cache_resource(show_spinner=False)
+def _revocations() -> _Revocations:
+    """프로세스 공용 접속 해제 목록."""
+    return _Revocations()
+
+
+def _issue_session(exp_ts: float):
+    """새 세션 토큰을 URL 에 넣고 세션·단말 행 추가."""
+    session_id = secrets.token_urlsafe(32)
+    _add_session_to_sheet(session_id, exp_ts)
+    st.query_params["session"] = _create_session_token(session_id, exp_ts)
+    st.session_state["auth_session_id"] = session_id
+    fp_hash = get_fingerprint_hash()
+    if fp_hash:
+        _add_fingerprint_to_sheet(fp_hash, exp_ts)
+
+
+def revoke_current_device():
+    """이 브라우저의 URL 토큰과 단말 지문을 해제하고 로그아웃. 지금까지 발급된 것만 막으므로 비밀번호로 다시 로그인하면 사용 가능."""
+    hashes = []
+    sid = st.session_state.get("auth_session_id")
+    if sid:
+        hashes.append(_hash_session_id(sid))
+    fp_hash = get_fingerprint_hash()
+    if fp_hash:
+        hashes.append(fp_hash)
+    _revocations().revoke(hashes)
+    for key in ("authenticated", "auth_session_id"):
+        st.session_state.pop(key, None)
+    st.query_params.pop("session", None)
+
+
+def revoke_all_sessions():
+    """지금까지 발급한 모든 URL 토큰·단말 지문 해제. 이 브라우저는 새 토큰을 받아 계속 사용."""
+    now = int(datetime.now().timestamp())
+    _revocations().revoke(not_before=now)
+    _issue_session((datetime.now() + timedelta(days=SESSION_DAYS)).timestamp())
+
+
+def get_revocation_stats() -> dict:
+    """접속 해제 목록 통계 (일괄 해제 기준 시각, 해제된 항목 수, 셀 읽기 횟수)."""
+    return _revocations().stats()
+
+
 def check_password():
     """진입 비밀번호 확인. URL 세션·단말 지문 유효하면 생략. 실패 시 st.stop()."""
     if st.session_state.get("authenticated"):
@@ -351,14 +690,15 @@ def check_password():
             try:
                 parsed = _validate_session_token(session_token)
                 if parsed:
-                    session_id, exp_ts = parsed
-                    if _is_session_valid_in_sheet(session_id, exp_ts):
+                    session_id, exp_ts, iat = parsed
+                    if _is_token_valid(session_id, exp_ts, iat):
                         st.session_state.authenticated = True
+                        st.session_state["auth_session_id"] = session_id
                         st.rerun()
             except Exception:
                 pass
 
-        fp_hash = _get_fingerprint_hash()
+        fp_hash = get_fingerprint_hash()
         if fp_hash and _is_fingerprint_valid_in_sheet(fp_hash):
             st.session_state.authenticated = True
             st.rerun()
@@ -390,14 +730,7 @@ def check_password():
             if is_first_run:
                 st.session_state.must_change_password = True
             try:
-                exp_ts = (datetime.now() + timedelta(days=SESSION_DAYS)).timestamp()
-                session_id = secrets.token_urlsafe(32)
-                _add_session_to_sheet(session_id, exp_ts)
-                token = _create_session_token(session_id, exp_ts)
-                st.query_params["session"] = token
-                fp_hash = _get_fingerprint_hash()
-                if fp_hash:
-                    _add_fingerprint_to_sheet(fp_hash, exp_ts)
+                _issue_session((datetime.now() + timedelta(days=SESSION_DAYS)).timestamp())
                 st.session_state.show_bookmark_hint = True
             except Exception:
                 pass
@@ -429,3 +762,30 @@ def show_change_password_if_needed():
             except Exception as e:
                 st.error(f"저장 실패: {e}")
     st.stop()
+
+
+def show_session_admin():
+    """사이드바: 접속 관리 (이 단말 로그아웃, 모든 단말 접속 해제). 진입 비밀번호 확인 후 실행."""
+    with st.sidebar.expander("🔑 접속 관리", expanded=False):
+        st.caption("북마크한 주소·기억된 단말의 자동 접속을 해제합니다. 진입 비밀번호를 다시 입력해 주세요.")
+        pw = st.text_input("진입 비밀번호", type="password", key="session_admin_pw")
+        col1, col2 = st.columns(2)
+        logout = col1.button("이 단말 로그아웃", key="session_admin_logout")
+        revoke_all = col2.button("모든 단말 해제", key="session_admin_revoke_all")
+        if not (logout or revoke_all):
+            return
+        expected = get_stored_password() or st.secrets.get("default_password")
+        if not pw or pw != expected:
+            st.error("비밀번호가 올바르지 않습니다.")
+            return
+        try:
+            if logout:
+                revoke_current_device()
+            else:
+                revoke_all_sessions()
+                st.session_state.show_bookmark_hint = True
+        except Exception as e:
+            st.error(f"처리 실패: {e}")
+            return
+        st.session_state.pop("session_admin_pw", None)
+        st.rerun()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""인증 hot path 마이크로 벤치마크.
+
+rerun 한 번에 도는 인증 관련 계산을 예전 방식과 지금 방식으로 비교:
+- Fernet: 예전에는 암호화·복호화마다 Secrets 읽기 + SHA-256 + Fernet 생성, 지금은 프로세스 공용 인스턴스
+- 단말 지문: 예전에는 부를 때마다 요청 헤더를 훑어 SHA-256, 지금은 세션당 한 번 계산한 값
+
+구글 시트·Streamlit 서버 없이 돌도록 Secrets·요청 헤더·세션 상태를 흉내 냄.
+실행: python bench_auth.py [rerun 횟수]
+"""
+
+import base64
+import hashlib
+import sys
+import time
+import types
+
+from cryptography.fernet import Fernet
+
+import auth
+
+# 한 rerun 에서 부르는 횟수 (예산청구 탭 기준: 입금계좌·청구자 기본값, 학년·반 저장, 설정 복호화 2개)
+FINGERPRINT_CALLS_PER_RERUN = 4
+DECRYPT_CALLS_PER_RERUN = 2
+
+SECRETS = {"encryption_key": "bench-encryption-key"}
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1",
+    "Accept-Language": "ko-KR,ko;q=0.9,en-US;q=0.8",
+    "Sec-CH-UA": '"Chromium";v="124", "Google Chrome";v="124", "Not-A.Brand";v="99"',
+    "Sec-CH-UA-Platform": '"iOS"',
+    "Accept": "text/html,application/xhtml+xml",
+    "Cookie": "x" * 400,
+}
+
+
+def _legacy_get_fernet():
+    """예전 방식: 부를 때마다 키 해시 + Fernet 생성."""
+    raw = SECRETS.get("encryption_key")
+    key = base64.urlsafe_b64encode(hashlib.sha256(raw.encode()).digest())
+    return Fernet(key)
+
+
+def _legacy_fingerprint():
+    """예전 방식: 부를 때마다 헤더를 훑어 해시."""
+    return auth._get_fingerprint_hash()
+
+
+def _rerun(get_fernet, fingerprint, token):
+    for _ in range(FINGERPRINT_CALLS_PER_RERUN):
+        fingerprint()
+    for _ in range(DECRYPT_CALLS_PER_RERUN):
+        get_fernet().decrypt(token)
+
+
+def _time(fn, reruns: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reruns):
+        fn()
+    return (time.perf_counter() - t0) / reruns
+
+
+def main(reruns: int = 20000):
+    # Secrets·세션 상태(한 세션)·요청 헤더 대신
+    auth.st = types.SimpleNamespace(secrets=SECRETS, session_state={})
+    auth._request_headers = lambda: HEADERS
+
+    token = _legacy_get_fernet().encrypt(b'{"id": "x", "exp": 0}')
+    assert auth._get_fernet().decrypt(token) == _legacy_get_fernet().decrypt(token)
+    assert auth.get_fingerprint_hash() == _legacy_fingerprint()
+
+    parts = [
+        ("Fernet 얻기", lambda: _legacy_get_fernet(), lambda: auth._get_fernet()),
+        ("단말 지문", _legacy_fingerprint, auth.get_fingerprint_hash),
+        (
+            f"rerun (지문 {FINGERPRINT_CALLS_PER_RERUN} + 복호화 {DECRYPT_CALLS_PER_RERUN})",
+            lambda: _rerun(_legacy_get_fernet, _legacy_fingerprint, token),
+            lambda: _rerun(auth._get_fernet, auth.get_fingerprint_hash, token),
+        ),
+    ]
+    print(f"{'항목':<28} {'예전 µs':>9} {'지금 µs':>9} {'절약 µs':>9} {'배':>6}")
+    for label, legacy, new in parts:
+        old_t = min(_time(legacy, reruns) for _ in range(3))
+        new_t = min(_time(new, reruns) for _ in range(3))
+        print(f"{label:<28} {old_t * 1e6:>9.2f} {new_t * 1e6:>9.2f} {(old_t - new_t) * 1e6:>9.2f} {old_t / new_t:>6.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
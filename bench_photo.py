@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""사진 인코딩 마이크로 벤치마크.
+
+1) 예전 반복 인코딩 vs photo_utils 의 draft 디코드 + 최대 두 번 인코딩
+2) 저장 코덱 비교: 같은 화질(PSNR)에서 JPEG 과 WebP 의 크기, 셀 상한 안에서 얻는 해상도
+
+예시 사진은 저장소에 없으므로 폰 카메라 크기의 합성 이미지를 만들어 씀.
+실행: python bench_photo.py [반복 횟수]
+"""
+
+import base64
+import io
+import random
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+import photo_utils
+from config import PHOTO_B64_MAX
+
+
+def _legacy_image_to_base64_for_sheet(image_bytes: bytes) -> str:
+    """예전 방식: 원본 해상도로 디코드 후 맞을 때까지 최대 6번 리사이즈·인코딩."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    out = io.BytesIO()
+    max_side = 320
+    quality = 72
+    for _ in range(6):
+        w, h = img.size
+        if max(w, h) > max_side:
+            ratio = max_side / max(w, h)
+            img = img.resize((int(w * ratio), int(h * ratio)), Image.Resampling.LANCZOS)
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+        b64 = base64.b64encode(out.getvalue()).decode("ascii")
+        if len(b64) <= PHOTO_B64_MAX:
+            return b64
+        out.seek(0)
+        out.truncate(0)
+        max_side = int(max_side * 0.8)
+        quality = max(50, quality - 8)
+    b64 = base64.b64encode(out.getvalue()).decode("ascii")
+    return b64[:PHOTO_B64_MAX]
+
+
+def _legacy_evidence_to_base64(img) -> str:
+    """예전 예산 증빙 방식: 잘라낸 크기 그대로 화질 85, 넘으면 위 반복 인코딩."""
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85, optimize=True)
+    b64 = base64.b64encode(out.getvalue()).decode("ascii")
+    if len(b64) > PHOTO_B64_MAX:
+        b64 = _legacy_image_to_base64_for_sheet(out.getvalue())
+    return b64
+
+
+def _synthetic_receipt(size, seed) -> "Image.Image":
+    """흰 바탕에 글자 줄 같은 짧은 막대가 빽빽한 영수증 비슷한 이미지 (자르기 화면에서 나온 PIL 이미지 가정)."""
+    rnd = random.Random(seed)
+    w, h = size
+    img = Image.new("RGB", (w, h), (250, 250, 246))
+    draw = ImageDraw.Draw(img)
+    for y in range(20, h - 20, 22):
+        x = 20
+        while x < w - 40:
+            cw = rnd.randrange(6, 14)
+            draw.rectangle((x, y, x + cw, y + 12), fill=(30, 30, 30))
+            x += cw + rnd.randrange(3, 12)
+    return img
+
+
+def _synthetic_photo(size, seed, noise, fmt="JPEG") -> bytes:
+    """그라데이션 + 도형 + 잡음으로 사진 비슷한 이미지. noise 가 클수록 압축이 어려움."""
+    rnd = random.Random(seed)
+    w, h = size
+    img = Image.linear_gradient("L").resize((w, h)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rnd.randrange(w), rnd.randrange(h)
+        r = rnd.randrange(w // 20, w // 4)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rnd.randrange(256) for _ in range(3)))
+    img = img.filter(ImageFilter.GaussianBlur(2))
+    if noise:
+        grain = Image.effect_noise((w, h), noise).convert("RGB")
+        img = Image.blend(img, grain, 0.25)
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=92) if fmt == "JPEG" else img.save(out, format=fmt)
+    return out.getvalue()
+
+
+SAMPLES = [
+    ("폰 사진 12MP (보통)", (4032, 3024), 40, "JPEG"),
+    ("폰 사진 12MP (잡음 많음)", (4032, 3024), 120, "JPEG"),
+    ("세로 사진 3MP", (1536, 2048), 60, "JPEG"),
+    ("캡처 PNG", (1170, 2532), 0, "PNG"),
+]
+
+
+def _count_saves(fn, *args):
+    """fn 실행 중 Image.save 호출 수와 걸린 시간(초)."""
+    calls = [0]
+    orig = Image.Image.save
+
+    def counting_save(self, *a, **kw):
+        calls[0] += 1
+        return orig(self, *a, **kw)
+
+    Image.Image.save = counting_save
+    try:
+        t0 = time.perf_counter()
+        result = fn(*args)
+        return result, calls[0], time.perf_counter() - t0
+    finally:
+        Image.Image.save = orig
+
+
+def _psnr(a: "Image.Image", b: "Image.Image") -> float:
+    x = np.asarray(a.convert("RGB"), dtype=np.float64)
+    y = np.asarray(b.convert("RGB"), dtype=np.float64)
+    mse = float(np.mean((x - y) ** 2))
+    return 99.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def _codec_point(img, fmt: str, quality: int):
+    data = photo_utils.encode_image(img, quality, fmt)
+    return len(data), _psnr(img, Image.open(io.BytesIO(data)))
+
+
+def _codec_comparison():
+    """JPEG 화질 85 와 같은 PSNR 이상을 내는 가장 낮은 WebP 화질을 찾아 크기 비교, 그리고 셀 상한 안 결과 해상도."""
+    if photo_utils.photo_format() != "WEBP" and not photo_utils.features.check("webp"):
+        print("이 Pillow 는 WebP 를 지원하지 않아 코덱 비교를 건너뜀")
+        return
+    print()
+    print(f"{'샘플':<22} {'JPEG85 bytes':>12} {'PSNR':>6} {'WebP q':>6} {'WebP bytes':>10} {'PSNR':>6} {'비율':>5}")
+    samples = [
+        ("영수증 600x800", _synthetic_receipt((600, 800), 7)),
+        ("영수증 900x1200", _synthetic_receipt((900, 1200), 9)),
+        ("사진 600x800", Image.open(io.BytesIO(_synthetic_photo((600, 800), 3, 40))).convert("RGB")),
+        ("사진 600x800 (잡음)", Image.open(io.BytesIO(_synthetic_photo((600, 800), 4, 150))).convert("RGB")),
+    ]
+    for label, img in samples:
+        j_bytes, j_psnr = _codec_point(img, "JPEG", 85)
+        w_q, w_bytes, w_psnr = None, None, None
+        for q in range(30, 101, 5):
+            size, psnr = _codec_point(img, "WEBP", q)
+            if psnr >= j_psnr:
+                w_q, w_bytes, w_psnr = q, size, psnr
+                break
+        if w_q is None:
+            print(f"{label:<22} {j_bytes:>12} {j_psnr:>6.1f} {'-':>6} {'-':>10} {'-':>6} {'-':>5}")
+        else:
+            webp_q = max(1, w_q - photo_utils.WEBP_QUALITY_OFFSET)  # encode_image 는 JPEG 기준 화질을 받음
+            print(f"{label:<22} {j_bytes:>12} {j_psnr:>6.1f} {webp_q:>6} {w_bytes:>10} {w_psnr:>6.1f} {w_bytes / j_bytes:>5.2f}")
+    print()
+    print(f"{'증빙 (셀 상한 안)':<22} {'코덱':<6} {'base64':>8} {'결과 크기':>10}")
+    orig = photo_utils.photo_format
+    try:
+        for label, size in (("영수증 1280x1700", (1280, 1700)),):
+            img = _synthetic_receipt(size, seed=3)
+            for fmt in ("JPEG", "WEBP"):
+                photo_utils.photo_format = lambda f=fmt: f
+                b64 = photo_utils.encode_image_for_sheet(img, max_side=None, quality=85)
+                print(f"{label:<22} {fmt:<6} {len(b64):>8} {_dims(b64):>10}")
+    finally:
+        photo_utils.photo_format = orig
+
+
+def _dims(b64: str) -> str:
+    try:
+        w, h = Image.open(io.BytesIO(base64.b64decode(b64))).size
+        return f"{w}x{h}"
+    except Exception:
+        return "깨짐"
+
+
+def main(repeat: int = 3):
+    print(f"{'샘플':<22} {'방식':<6} {'ms':>8} {'인코딩':>6} {'base64':>8} {'결과 크기':>10}")
+    for label, size, noise, fmt in SAMPLES:
+        data = _synthetic_photo(size, seed=len(label), noise=noise, fmt=fmt)
+        for name, fn in (("예전", _legacy_image_to_base64_for_sheet), ("새", lambda b: photo_utils.image_to_base64_for_sheet(b, ""))):
+            best = None
+            for _ in range(repeat):
+                b64, saves, sec = _count_saves(fn, data)
+                best = sec if best is None else min(best, sec)
+            print(f"{label:<22} {name:<6} {best * 1000:>8.1f} {saves:>6} {len(b64):>8} {_dims(b64):>10}")
+    for label, size in (("영수증 증빙 900x1200", (900, 1200)), ("영수증 증빙 1280x1700", (1280, 1700))):
+        img = _synthetic_receipt(size, seed=size[0])
+        for name, fn in (("예전", _legacy_evidence_to_base64), ("새", lambda i: photo_utils.encode_image_for_sheet(i, max_side=None, quality=85))):
+            best = None
+            for _ in range(repeat):
+                b64, saves, sec = _count_saves(fn, img)
+                best = sec if best is None else min(best, sec)
+            print(f"{label:<22} {name:<6} {best * 1000:>8.1f} {saves:>6} {len(b64):>8} {_dims(b64):>10}")
+    _codec_comparison()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
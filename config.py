@@ -4,14 +4,54 @@
 # 구글 시트
 SPREADSHEET_NAME = "middle1_2026_weekly_db"  # 출석·학생·새신자 등
 BUDGET_SPREADSHEET_NAME = "middle1_2026_budget"  # 예산청구 전용 (결재 비밀번호 config 포함)
+# 스프레드시트 이름 → ID 캐시 파일 (최초 1회 Drive 검색 후 저장, 이후 ID로 바로 열기).
+# Secrets의 [spreadsheet_ids] 에 "이름" = "ID" 로 지정하면 그 값을 우선 사용.
+SPREADSHEET_ID_CACHE_FILE = ".streamlit/spreadsheet_ids.json"
+# Sheets API 호출 한도 (서비스 계정 기준 분당 요청 수). 모든 세션의 읽기·쓰기가 이 안에서 나눠 씀
+SHEETS_REQUESTS_PER_MINUTE = 60
+# 429/5xx 응답 시 최대 시도 횟수 (지수 백오프 + 지터)
+SHEETS_MAX_ATTEMPTS = 5
+
+# 단말별 마지막 탭·학년·반(user_prefs) 쓰기를 모아 두는 시간(초). 그 사이 바뀐 값은 마지막 값 하나로 합쳐 씀
+PREFS_WRITE_DELAY_SEC = 5
+# 이 일수 넘게 접속하지 않은 단말의 user_prefs 행은 정리 때 삭제
+PREFS_KEEP_DAYS = 180
+# user_prefs 정리 잠금 유효 시간(초), 잠근 뒤 다른 프로세스의 진행 중 쓰기가 끝나길 기다리는 시간(초)
+PREFS_LOCK_SEC = 120
+PREFS_LOCK_SETTLE_SEC = 10
 
 # 인증 (default_password는 .streamlit/secrets.toml 또는 Cloud Secrets에 설정, Git에 넣지 말 것)
 SESSION_DAYS = 30
+# sessions 시트를 메모리 목록과 다시 맞추는 간격(초), 모르는 세션이 들어왔을 때 바로 다시 읽는 최소 간격(초)
+SESSION_RECONCILE_SEC = 600
+SESSION_MISS_RELOAD_SEC = 60
+# sessions 시트의 만료(정리로 지울) 행이 이보다 많으면 읽을 때 정리를 백그라운드로 실행. 정리 잠금 유효 시간(초)
+SESSIONS_COMPACT_ROWS = 500
+SESSIONS_LOCK_SEC = 120
+# URL 토큰 확인 방식: "stateless" (암호화된 만료·발급 시각 + 해제 목록만 확인, 시트 읽기 없음) 또는 "sheet" (sessions 목록도 확인)
+SESSION_TOKEN_MODE = "stateless"
+# 접속 해제 목록(config 시트 B1)을 다시 읽는 간격(초). 다른 프로세스에서 해제한 것은 이 시간 안에 반영
+REVOCATION_TTL_SEC = 300
+
+# 예산청구 설정(결재·조회 비밀번호, 결재자 정보)을 다시 읽는 간격(초). 이 프로세스에서 바꾼 값은 바로 반영
+BUDGET_CONFIG_TTL_SEC = 60
 
 # 시트 셀/이미지 제한
 SHEET_CELL_MAX = 50000
 PHOTO_B64_MAX = 48000
+# 예산 증빙: 'evidence_blobs' 시트 여러 행에 PHOTO_B64_MAX 씩 나눠 저장 (청구 행 셀에는 목록만)
+EVIDENCE_MAX_SIDE = 2000
+EVIDENCE_B64_MAX = 8 * PHOTO_B64_MAX
+
+# 사진·증빙 저장 코덱: "webp" (같은 bytes 로 더 선명) 또는 "jpeg". 예전 JPEG 저장분도 그대로 읽힘
+PHOTO_CODEC = "webp"
 
 # 사진 저장 고정 크기 (비율 3:4)
 PHOTO_WIDTH = 84
 PHOTO_HEIGHT = 112
+
+# 목록 화면 사진 썸네일 캐시 상한 (디코드한 이미지 bytes 기준)
+THUMB_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# 사진 자르기·인코딩 작업 스레드 수 (프로세스 공용)
+PHOTO_WORKERS = 2
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""예산 증빙 저장소: 셀 하나(SHEET_CELL_MAX)에 들지 않는 고해상도 증빙을 'evidence_blobs' 시트 여러 행에 나눠 저장.
+청구 행의 증빙 셀에는 목록("blob:<해시>:<시작 행>:<조각 수>")만 두므로 예산청구 목록을 읽을 때 증빙 데이터는 받지 않음.
+조각은 상세보기(_render_detail_view)에서 그 청구의 것만 values.batchGet 한 번으로 받아 다시 합침."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import streamlit as st
+from gspread.utils import a1_to_rowcol, absolute_range_name
+
+import sheets
+from config import PHOTO_B64_MAX
+
+EVIDENCE_REF_PREFIX = "blob:"
+EVIDENCE_SHEET = "evidence_blobs"
+# 조각 하나의 base64 길이 (셀 하나에 들어감)
+EVIDENCE_CHUNK_CHARS = PHOTO_B64_MAX
+# 다시 합친 증빙을 들고 있을 개수 (프로세스 공용)
+EVIDENCE_CACHE_MAX = 16
+
+
+def evidence_hash(b64: str) -> str:
+    """증빙 base64 내용 해시 (다시 합친 뒤 확인용)."""
+    return hashlib.sha256(b64.encode("ascii")).hexdigest()[:24]
+
+
+def is_evidence_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith(EVIDENCE_REF_PREFIX)
+
+
+def _parse_ref(value: str):
+    """증빙 목록 → (해시, 시작 행, 조각 수). 형식이 맞지 않으면 None."""
+    try:
+        h, start, count = value[len(EVIDENCE_REF_PREFIX):].split(":")
+        return h, int(start), int(count)
+    except ValueError:
+        return None
+
+
+class _EvidenceStore:
+    """다시 합친 증빙 (해시 → base64) LRU. evidence_blobs 시트는 행을 추가만 하므로 목록의 행 번호가 바뀌지 않음."""
+
+    def __init__(self, max_items: int):
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self.max_items = max_items
+        self.stored = 0
+        self.fetch_count = 0
+        self.fetched_chunks = 0
+        self.corrupt = 0
+        self.discarded = 0
+
+    def _remember(self, h: str, b64: str):
+        self._data[h] = b64
+        self._data.move_to_end(h)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def put_many(self, evidences: list[str]) -> list[str]:
+        """증빙 base64 들을 조각내 append 한 번으로 저장하고, 청구 행 셀에 쓸 목록 반환."""
+        rows, pending = [], []
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for b64 in evidences:
+            h = evidence_hash(b64)
+            chunks = [b64[i:i + EVIDENCE_CHUNK_CHARS] for i in range(0, len(b64), EVIDENCE_CHUNK_CHARS)]
+            pending.append((h, len(rows), len(chunks)))
+            rows.extend([h, n, c, now] for n, c in enumerate(chunks, start=1))
+        if not rows:
+            return []
+        resp = sheets.get_evidence_blobs_ws().append_rows(rows)
+        updated = (resp or {}).get("updates", {}).get("updatedRange", "")
+        if "!" not in updated:
+            raise RuntimeError("증빙 저장 위치를 확인할 수 없습니다.")
+        start = a1_to_rowcol(updated.split("!")[-1].split(":")[0])[0]
+        with self._lock:
+            for b64, (h, _, _) in zip(evidences, pending):
+                self._remember(h, b64)
+            self.stored += len(evidences)
+        return [f"{EVIDENCE_REF_PREFIX}{h}:{start + offset}:{count}" for h, offset, count in pending]
+
+    def get_many(self, refs: list[str]) -> dict:
+        """목록 → base64. 캐시에 없는 증빙의 조각은 values.batchGet 한 번으로 (범위마다 서버에서 같이) 받음.
+        해시가 맞지 않는(행이 지워졌거나 옮겨진) 증빙은 빼고 반환."""
+        parsed = {r: p for r in dict.fromkeys(refs) if (p := _parse_ref(r))}
+        out = {}
+        with self._lock:
+            for r, (h, _, _) in parsed.items():
+                if h in self._data:
+                    self._data.move_to_end(h)
+                    out[r] = self._data[h]
+        missing = [(r, p) for r, p in parsed.items() if r not in out]
+        if not missing:
+            return out
+        ranges = [absolute_range_name(EVIDENCE_SHEET, f"A{start}:C{start + count - 1}") for _, (_, start, count) in missing]
+        resp = sheets.get_budget_sheet().values_batch_get(ranges)
+        with self._lock:
+            self.fetch_count += 1
+            for (r, (h, _, count)), vr in zip(missing, resp.get("valueRanges", [])):
+                values = vr.get("values") or []
+                self.fetched_chunks += len(values)
+                if len(values) != count or any(len(v) < 3 or v[0] != h for v in values):
+                    self.corrupt += 1
+                    continue
+                b64 = "".join(v[2] for v in sorted(values, key=lambda v: int(v[1])))
+                if evidence_hash(b64) != h:
+                    self.corrupt += 1
+                    continue
+                self._remember(h, b64)
+                out[r] = b64
+        return out
+
+    def discard(self, refs: list[str]):
+        """청구 행 저장에 실패한 증빙의 조각 셀을 비움. 행을 지우면 다른 증빙 목록의 행 번호가 밀리므로 값만 지움."""
+        parsed = [p for r in refs if is_evidence_ref(r) and (p := _parse_ref(r))]
+        if not parsed:
+            return
+        ranges = [absolute_range_name(EVIDENCE_SHEET, f"A{start}:D{start + count - 1}") for _, start, count in parsed]
+        sheets.get_budget_sheet().values_batch_clear(body={"ranges": ranges})
+        with self._lock:
+            for h, _, _ in parsed:
+                self._data.pop(h, None)
+            self.discarded += len(parsed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_memory": len(self._data),
+                "stored": self.stored,
+                "fetch_count": self.fetch_count,
+                "fetched_chunks": self.fetched_chunks,
+                "corrupt": self.corrupt,
+                "discarded": self.discarded,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _store() -> _EvidenceStore:
+    """프로세스 공용 증빙 저장소."""
+    return _EvidenceStore(EVIDENCE_CACHE_MAX)
+
+
+def store_evidences(evidences: list[str]) -> list[str]:
+    """증빙 base64 목록을 저장하고 청구 행 증빙 셀에 쓸 목록 반환. 빈 값은 빼고 저장."""
+    return _store().put_many([b64 for b64 in evidences if b64])
+
+
+def discard_evidences(refs: list[str]):
+    """store_evidences 로 저장했지만 청구 행에 쓰지 못한 증빙 조각 정리."""
+    _store().discard(refs)
+
+
+def load_evidences(values) -> list[str]:
+    """청구 행 증빙 셀 값들 → 보여줄 base64 목록 (셀 순서). 예전 방식(셀에 base64 그대로)은 그대로 씀."""
+    values = [v for v in values if isinstance(v, str) and v]
+    fetched = _store().get_many([v for v in values if is_evidence_ref(v)])
+    return [fetched.get(v, "") if is_evidence_ref(v) else v for v in values]
+
+
+def get_evidence_store_stats() -> dict:
+    """증빙 저장소 통계 (메모리에 둔 증빙 수, 저장·받기 횟수, 받은 조각 수, 깨진 증빙 수, 정리한 증빙 수)."""
+    return _store().stats()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""사진 처리 작업 풀: 업로드 사진 자르기·리사이즈·인코딩을 스크립트 스레드 밖(프로세스 공용 스레드 풀)에서 처리.
+결과는 (업로드 해시, 자르기 영역) 으로 캐시해서 st_cropper 를 끌 때 도는 rerun 이 같은 영역이면 다시 계산하지 않음.
+PIL 의 디코드·리사이즈·인코딩은 GIL 을 풀어 두므로 스레드로도 다른 세션의 스크립트를 막지 않음."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import streamlit as st
+
+from config import EVIDENCE_B64_MAX, EVIDENCE_MAX_SIDE, PHOTO_WORKERS
+from photo_utils import encode_image_for_sheet, image_to_base64_for_sheet, open_image, open_image_for_crop, resize_photo_to_final
+
+# 끝난 작업 결과를 들고 있을 개수, 자르기 화면용으로 열어 둔 업로드 이미지 개수
+JOB_CACHE_MAX = 64
+OPENED_CACHE_MAX = 8
+# 화면을 그릴 때 미리보기 결과를 기다리는 최대 시간(초). 넘으면 "처리 중" 으로 두고 다음 rerun 에 다시 봄
+PREVIEW_WAIT_SEC = 1.5
+
+
+def upload_hash(image_bytes: bytes) -> str:
+    """업로드 이미지 내용 해시 (작업 캐시 키)."""
+    return hashlib.sha256(image_bytes).hexdigest()[:24]
+
+
+def _box_tuple(box) -> tuple:
+    return tuple(int(box.get(k, 0)) for k in ("left", "top", "width", "height"))
+
+
+def _crop(img, box: tuple):
+    left, top, width, height = box
+    return img.crop((left, top, left + max(1, width), top + max(1, height)))
+
+
+class _PhotoJobs:
+    """작업 키 → Future. 같은 업로드·같은 종류의 새 작업이 들어오면 아직 시작 안 한 이전 작업은 취소 (끌기 중 쌓이는 작업 정리)."""
+
+    def __init__(self, workers: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo-job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # 작업 키 -> Future
+        self._latest = {}  # (종류, 업로드 해시) -> 마지막 작업 키
+        self._opened = OrderedDict()  # 업로드 해시 -> 자르기 화면용 PIL 이미지
+        self.submitted = 0
+        self.reused = 0
+        self.cancelled = 0
+
+    def opened(self, image_bytes: bytes):
+        h = upload_hash(image_bytes)
+        with self._lock:
+            img = self._opened.get(h)
+            if img is not None:
+                self._opened.move_to_end(h)
+                return img
+        img = open_image_for_crop(image_bytes)
+        img.load()  # 작업 스레드들이 같이 crop 하므로 미리 디코드
+        with self._lock:
+            self._opened[h] = img
+            while len(self._opened) > OPENED_CACHE_MAX:
+                self._opened.popitem(last=False)
+        return img
+
+    def submit(self, kind: str, h: str, detail: str, fn, *args) -> str:
+        key = f"{kind}:{h}:{detail}"
+        with self._lock:
+            fut = self._jobs.get(key)
+            if fut is not None and not fut.cancelled():
+                self._jobs.move_to_end(key)
+                self.reused += 1
+                return key
+            prev = self._latest.get((kind, h))
+            if prev and prev != key:
+                prev_fut = self._jobs.get(prev)
+                if prev_fut is not None and prev_fut.cancel():
+                    del self._jobs[prev]
+                    self.cancelled += 1
+            self._jobs[key] = self._pool.submit(fn, *args)
+            self._latest[(kind, h)] = key
+            self.submitted += 1
+            while len(self._jobs) > JOB_CACHE_MAX:
+                old_key, old = next(iter(self._jobs.items()))
+                if not old.done():
+                    break
+                del self._jobs[old_key]
+                if self._latest.get(tuple(old_key.split(":")[:2])) == old_key:
+                    del self._latest[tuple(old_key.split(":")[:2])]
+        return key
+
+    def future(self, key: str):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "jobs": len(self._jobs),
+                "pending": sum(1 for f in self._jobs.values() if not f.done()),
+                "opened": len(self._opened),
+                "submitted": self.submitted,
+                "reused": self.reused,
+                "cancelled": self.cancelled,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _jobs() -> _PhotoJobs:
+    """프로세스 공용 사진 작업 풀."""
+    return _PhotoJobs(PHOTO_WORKERS)
+
+
+def open_for_crop(image_bytes: bytes):
+    """자르기 화면(st_cropper)에 넘길 이미지. 같은 업로드는 다시 디코드하지 않음."""
+    return _jobs().opened(image_bytes)
+
+
+def _final_photo(image_bytes: bytes, box: tuple) -> bytes:
+    return resize_photo_to_final(_crop(open_for_crop(image_bytes), box))
+
+
+def _evidence(image_bytes: bytes, box: tuple) -> str:
+    """영역은 자르기 화면 이미지(CROP_MAX_SIDE 로 draft 디코드) 기준이므로, EVIDENCE_MAX_SIDE 로 다시 디코드한 원본에 비율을 맞춰 자름."""
+    try:
+        shown = open_for_crop(image_bytes)
+        src = open_image(image_bytes, EVIDENCE_MAX_SIDE)
+        rx, ry = src.width / shown.width, src.height / shown.height
+        left, top, width, height = box
+        src_box = (round(left * rx), round(top * ry), round(width * rx), round(height * ry))
+        return encode_image_for_sheet(_crop(src, src_box), max_side=EVIDENCE_MAX_SIDE, quality=85, max_b64=EVIDENCE_B64_MAX)
+    except Exception:
+        return ""
+
+
+def submit_crop(image_bytes: bytes, box) -> str:
+    """st_cropper(return_type="box") 영역을 잘라 PHOTO_WIDTH×PHOTO_HEIGHT JPEG bytes 로 만드는 작업. 작업 키 반환."""
+    b = _box_tuple(box)
+    return _jobs().submit("final", upload_hash(image_bytes), ",".join(map(str, b)), _final_photo, image_bytes, b)
+
+
+def submit_evidence(image_bytes: bytes, box) -> str:
+    """예산 증빙: 영역을 잘라 EVIDENCE_B64_MAX 안에 드는 고해상도 base64 로 만드는 작업 (저장은 evidence_store 가 조각내서). 작업 키 반환."""
+    b = _box_tuple(box)
+    return _jobs().submit("evidence", upload_hash(image_bytes), ",".join(map(str, b)), _evidence, image_bytes, b)
+
+
+def submit_sheet_encode(image_bytes: bytes, mime_type: str) -> str:
+    """자르지 않은 업로드를 시트 저장용 base64 로 만드는 작업 (image_to_base64_for_sheet). 작업 키 반환."""
+    return _jobs().submit("sheet", upload_hash(image_bytes), "", image_to_base64_for_sheet, image_bytes, mime_type)
+
+
+def poll(key: str):
+    """작업 결과. 아직 안 끝났으면 None."""
+    fut = _jobs().future(key)
+    if fut is None or not fut.done() or fut.cancelled():
+        return None
+    return fut.result()
+
+
+def wait(key: str, timeout: float | None = None):
+    """작업이 끝날 때까지 (최대 timeout 초) 기다려 결과 반환. 시간 안에 안 끝나거나 없는 작업이면 None."""
+    fut = _jobs().future(key)
+    if fut is None:
+        return None
+    try:
+        return fut.result(timeout=timeout)
+    except FutureTimeoutError:
+        return None
+
+
+def get_photo_job_stats() -> dict:
+    """사진 작업 풀 통계 (캐시된 작업·대기 중·재사용·취소 수)."""
+    return _jobs().stats()
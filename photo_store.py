@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""사진 저장소: 학생·새신자 사진을 'photos' 시트에 내용 해시로 한 번만 저장하고, 명단 행에는 짧은 참조("photo:<해시>")만 둠.
+명단(students, new_believers)을 읽을 때 사진 base64 를 함께 받지 않도록 하고, 사진은 보고 있는 반의 것만 한 번에 받음."""
+
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+import streamlit as st
+from gspread.utils import a1_to_rowcol, absolute_range_name, rowcol_to_a1
+
+import sheets
+from config import THUMB_CACHE_MAX_BYTES
+from photo_utils import compose_contact_sheet
+
+PHOTO_REF_PREFIX = "photo:"
+PHOTO_COLUMNS = ("사진", "사진URL")
+# 모르는 해시를 요청받았을 때 해시 열을 다시 읽는 최소 간격(초)
+INDEX_RELOAD_MIN_SEC = 60
+
+# 사진 모아보기 한 줄 칸 수, 캐시해 둘 모아보기(반·목록) 수
+CONTACT_SHEET_COLUMNS = 8
+CONTACT_SHEET_MAX_SCOPES = 32
+
+# 목록 화면용 사진: 디코드한 bytes. st.image 에 bytes 로 넘기면 내용이 같을 때 늘 같은 미디어 URL 로 보냄
+Thumbnail = namedtuple("Thumbnail", ["data"])
+# 사진 모아보기: 줄마다 사진을 합친 이미지 bytes 목록, 한 줄 칸 수 (칸 순서는 load_contact_sheet 에 넘긴 값 순서)
+ContactSheet = namedtuple("ContactSheet", ["rows", "columns"])
+
+
+def photo_hash(b64: str) -> str:
+    """base64 사진 내용 해시 (참조 키)."""
+    return hashlib.sha256(b64.encode("ascii")).hexdigest()[:24]
+
+
+def is_photo_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith(PHOTO_REF_PREFIX)
+
+
+def is_inline_photo(value) -> bool:
+    """명단 셀에 base64 사진이 그대로 들어 있는지 (예전 저장 방식)."""
+    return isinstance(value, str) and len(value) > 100 and not value.startswith(("http", PHOTO_REF_PREFIX))
+
+
+class _PhotoStore:
+    """photos 시트의 해시 → 행 번호 색인 (프로세스 공용). photos 시트는 행을 추가만 하므로 행 번호가 바뀌지 않음.
+    받은 사진 base64 는 들고 있지 않음 (메모리는 bytes 상한이 있는 썸네일 캐시만 씀)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = None  # 해시 -> 시트 행 번호 (처음 필요할 때 해시 열만 읽음)
+        self._index_loaded_at = 0.0
+        self.stored = 0
+        self.fetch_count = 0
+        self.fetched_photos = 0
+
+    def _load_index(self):
+        hashes = sheets.get_photos_ws().col_values(1)
+        self._rows = {h: i for i, h in enumerate(hashes[1:], start=2) if h}
+        self._index_loaded_at = time.time()
+
+    def put_many(self, photos: list[str]) -> list[str]:
+        """base64 사진들을 저장하고 참조 목록 반환. 이미 있는 내용은 다시 저장하지 않음 (append 한 번)."""
+        refs = []
+        with self._lock:
+            if self._rows is None:
+                self._load_index()
+            new_rows = {}
+            for b64 in photos:
+                h = photo_hash(b64)
+                refs.append(PHOTO_REF_PREFIX + h)
+                if h not in self._rows and h not in new_rows:
+                    new_rows[h] = [h, b64, datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
+            if new_rows:
+                resp = sheets.get_photos_ws().append_rows(list(new_rows.values()))
+                updated = (resp or {}).get("updates", {}).get("updatedRange", "")
+                if "!" in updated:
+                    start = a1_to_rowcol(updated.split("!")[-1].split(":")[0])[0]
+                    for i, h in enumerate(new_rows):
+                        self._rows[h] = start + i
+                else:
+                    self._rows = None  # 위치를 모르면 다음에 해시 열을 다시 읽음
+                self.stored += len(new_rows)
+        return refs
+
+    def get_many(self, hashes: list[str]) -> dict:
+        """해시 → base64. values.batchGet 한 번으로 받음 (캐시는 호출하는 쪽의 썸네일 캐시)."""
+        with self._lock:
+            wanted = list(dict.fromkeys(hashes))
+            if not wanted:
+                return {}
+            unknown = self._rows is None or any(h not in self._rows for h in wanted)
+            if unknown and (self._rows is None or time.time() - self._index_loaded_at >= INDEX_RELOAD_MIN_SEC):
+                self._load_index()
+            rows = [(h, self._rows[h]) for h in wanted if h in self._rows]
+        out = {}
+        if rows:
+            ranges = [absolute_range_name("photos", f"B{row}") for _, row in rows]
+            resp = sheets.get_sheet().values_batch_get(ranges)
+            for (h, _), vr in zip(rows, resp.get("valueRanges", [])):
+                values = vr.get("values") or [[""]]
+                if values[0] and values[0][0]:
+                    out[h] = values[0][0]
+            with self._lock:
+                self.fetch_count += 1
+                self.fetched_photos += len(rows)
+        return out
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "indexed": len(self._rows) if self._rows is not None else None,
+                "stored": self.stored,
+                "fetch_count": self.fetch_count,
+                "fetched_photos": self.fetched_photos,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _store() -> _PhotoStore:
+    """프로세스 공용 사진 저장소."""
+    return _PhotoStore()
+
+
+def _photo_key(value):
+    """명단 사진 셀 값 → 사진 해시. 사진이 아니면 None."""
+    if is_photo_ref(value):
+        return value[len(PHOTO_REF_PREFIX):]
+    if is_inline_photo(value):
+        return photo_hash(value)
+    return None
+
+
+class _ThumbCache:
+    """사진 해시 → Thumbnail LRU (프로세스 공용). 들고 있는 bytes 합이 max_bytes 를 넘으면 오래 안 쓴 것부터 버림.
+    같은 해시는 내용이 같으므로 무효화가 필요 없음."""
+
+    def __init__(self, max_bytes: int):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._size = 0
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.decodes = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(thumb: Thumbnail) -> int:
+        return len(thumb.data)
+
+    def get(self, h: str):
+        with self._lock:
+            thumb = self._items.get(h)
+            if thumb is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(h)
+            self.hits += 1
+            return thumb
+
+    def put(self, h: str, b64: str):
+        """base64 를 디코드해 넣고 Thumbnail 반환. 디코드 실패면 None."""
+        try:
+            raw = base64.b64decode(b64)
+        except Exception:
+            return None
+        thumb = Thumbnail(raw)
+        size = self._entry_size(thumb)
+        with self._lock:
+            self.decodes += 1
+            if h in self._items:
+                self._size -= self._entry_size(self._items.pop(h))
+            if size > self.max_bytes:
+                return thumb
+            self._items[h] = thumb
+            self._size += size
+            while self._size > self.max_bytes:
+                _, old = self._items.popitem(last=False)
+                self._size -= self._entry_size(old)
+                self.evictions += 1
+        return thumb
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "decodes": self.decodes,
+                "evictions": self.evictions,
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def _thumbs() -> _ThumbCache:
+    """프로세스 공용 썸네일 캐시."""
+    return _ThumbCache(THUMB_CACHE_MAX_BYTES)
+
+
+def store_photo(b64: str) -> str:
+    """base64 사진을 저장소에 넣고 명단 셀에 쓸 참조 반환. 빈 값·이미 참조인 값은 그대로."""
+    if not b64 or is_photo_ref(b64):
+        return b64 or ""
+    return _store().put_many([b64])[0]
+
+
+def load_photos(values) -> dict:
+    """명단 사진 셀 값들 → {셀 값: Thumbnail}. 썸네일 캐시에 있으면 받기·디코드 없이 바로 씀.
+    없는 참조만 한 번의 batchGet 으로 받고, 예전 base64 값은 바로 디코드."""
+    cache = _thumbs()
+    out = {}
+    missing = {}  # 해시 -> 셀 값
+    for v in dict.fromkeys(v for v in values if isinstance(v, str) and v):
+        h = _photo_key(v)
+        if h is None:
+            continue
+        thumb = cache.get(h)
+        if thumb is not None:
+            out[v] = thumb
+        else:
+            missing[h] = v
+    refs = [h for h, v in missing.items() if is_photo_ref(v)]
+    fetched = _store().get_many(refs) if refs else {}
+    for h, v in missing.items():
+        b64 = fetched.get(h) if is_photo_ref(v) else v
+        thumb = cache.put(h, b64) if b64 else None
+        if thumb is not None:
+            out[v] = thumb
+    return out
+
+
+class _ContactSheets:
+    """모아보기 범위(반 등) → (칸 구성 해시, ContactSheet). 범위마다 최근 구성 하나만 두고, 범위 수는 LRU 로 제한."""
+
+    def __init__(self, max_scopes: int):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.max_scopes = max_scopes
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, scope: str, values) -> ContactSheet:
+        # 칸마다 사진 해시 (사진이 없으면 ""). 카드와 칸을 순서로 맞추므로 같은 사진이 여러 번 나와도 칸을 따로 둠
+        slots = [(_photo_key(v) or "") if isinstance(v, str) and v else "" for v in values]
+        set_hash = hashlib.sha256("\n".join(slots).encode("ascii")).hexdigest()[:24]
+        with self._lock:
+            cached = self._items.get(scope)
+            if cached is not None and cached[0] == set_hash:
+                self._items.move_to_end(scope)
+                self.hits += 1
+                return cached[1]
+        thumbs = load_photos(values)
+        sheet = ContactSheet(
+            compose_contact_sheet(
+                [thumbs[v].data if isinstance(v, str) and v in thumbs else None for v in values], CONTACT_SHEET_COLUMNS
+            ),
+            CONTACT_SHEET_COLUMNS,
+        )
+        with self._lock:
+            self.builds += 1
+            self._items[scope] = (set_hash, sheet)
+            self._items.move_to_end(scope)
+            while len(self._items) > self.max_scopes:
+                self._items.popitem(last=False)
+        return sheet
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"scopes": len(self._items), "hits": self.hits, "builds": self.builds}
+
+
+@st.cache_resource(show_spinner=False)
+def _contact_sheets() -> _ContactSheets:
+    """프로세스 공용 사진 모아보기 캐시."""
+    return _ContactSheets(CONTACT_SHEET_MAX_SCOPES)
+
+
+def load_contact_sheet(scope: str, values) -> ContactSheet:
+    """명단 사진 셀 값들(카드 순서)을 줄마다 스프라이트 한 장으로 합친 모아보기. scope(반 등)와 칸 구성이 같으면 다시 만들지 않음."""
+    return _contact_sheets().get(scope, values)
+
+
+def count_inline_photos(records) -> int:
+    """레코드 중 사진 base64 가 셀에 그대로 들어 있는 행 수."""
+    return sum(1 for r in records if any(is_inline_photo(r.get(c)) for c in PHOTO_COLUMNS))
+
+
+def migrate_inline_photos() -> dict:
+    """students·new_believers 시트의 사진 셀 base64 를 저장소로 옮기고 셀에는 참조만 남김.
+    시트마다 읽기 1회 + 사진 추가 1회 + 셀 수정 1회. {"students": 옮긴 셀 수, "new_believers": ...}"""
+    moved = {}
+    for title, get_ws in (("students", sheets.get_students_ws), ("new_believers", sheets.get_new_believers_ws)):
+        ws = get_ws()
+        values = ws.get_all_values()
+        if not values:
+            moved[title] = 0
+            continue
+        header = values[0]
+        cols = [header.index(c) for c in PHOTO_COLUMNS if c in header]
+        cells = [
+            (row_no, col, row[col])
+            for row_no, row in enumerate(values[1:], start=2)
+            for col in cols
+            if col < len(row) and is_inline_photo(row[col])
+        ]
+        if cells:
+            refs = _store().put_many([b64 for _, _, b64 in cells])
+            sheets.get_sheet().values_batch_update({
+                "valueInputOption": "RAW",
+                "data": [
+                    {"range": absolute_range_name(title, rowcol_to_a1(row_no, col + 1)), "values": [[ref]]}
+                    for (row_no, col, _), ref in zip(cells, refs)
+                ],
+            })
+            sheets.invalidate_sheets_cache(title, source="photo_migration")
+        moved[title] = len(cells)
+    return moved
+
+
+def get_photo_store_stats() -> dict:
+    """사진 저장소 통계 (색인된 사진 수, 저장·받기 횟수)."""
+    return _store().stats()
+
+
+def get_thumbnail_cache_stats() -> dict:
+    """썸네일 캐시 통계 (항목 수, 메모리 크기, 적중률, 디코드·축출 횟수, 모아보기 재사용·생성 횟수)."""
+    stats = _thumbs().stats()
+    stats["contact_sheets"] = _contact_sheets().stats()
+    return stats
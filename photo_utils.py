@@ -1,55 +1,170 @@
 # -*- coding: utf-8 -*-
-"""사진 리사이즈·base64 인코딩 (시트 저장용)."""
+"""사진 리사이즈·base64 인코딩 (시트 저장용). 저장 코덱은 config.PHOTO_CODEC (WebP, 안 되면 JPEG)."""
 
 import base64
 import io
 
-from PIL import Image
+from PIL import Image, ImageOps, features
 
-from config import PHOTO_B64_MAX, PHOTO_HEIGHT, PHOTO_WIDTH
+from config import PHOTO_B64_MAX, PHOTO_CODEC, PHOTO_HEIGHT, PHOTO_WIDTH
+
+# 시트 저장용 인코딩 기본값: 긴 변 최대 길이, 첫 인코딩 화질
+SHEET_MAX_SIDE = 320
+SHEET_QUALITY = 72
+# 시험 인코딩 최대 픽셀 수: 더 큰 이미지는 이 크기로 줄여 한 번 인코딩해 보고 그 결과로 최종 크기를 정함
+TRIAL_MAX_PIXELS = 80_000
+# 변 길이를 s 배 하면 인코딩 크기는 대략 s ** 지수 배. 줄일 때는 덜 줄고 키울 때는 더 커진다고 잡아 상한을 넘지 않게 함
+# (글자 많은 영수증은 1 근처, 사진은 2 이상)
+SHRINK_EXPONENT = 1.6
+GROW_EXPONENT = 2.5
+# 줄여서 다시 인코딩할 때 화질을 한 단계(QUALITY_STEP) 낮추고, 그만큼 크기가 QUALITY_STEP_SIZE 배로 준다고 봄
+QUALITY_STEP = 12
+QUALITY_STEP_SIZE = 0.9
+MIN_QUALITY = 50
+# 예측 여유 (상한의 90% 를 목표로)
+SIZE_MARGIN = 0.9
+# 자르기 화면용 디코드 최대 길이 (최종 사진은 PHOTO_WIDTH×PHOTO_HEIGHT)
+CROP_MAX_SIDE = 1280
+
+# 매직 바이트 → MIME (RIFF....WEBP 는 image_mime 에서 따로 봄)
+_MAGIC_MIMES = ((b"\xff\xd8\xff", "image/jpeg"), (b"\x89PNG\r\n\x1a\n", "image/png"), (b"GIF8", "image/gif"))
+# 화질 값은 JPEG 기준. WebP 는 이만큼 낮춰야 같은 PSNR (bench_photo.py 코덱 비교 참고)
+WEBP_QUALITY_OFFSET = 30
+
+
+def photo_format() -> str:
+    """저장에 쓸 PIL 포맷 이름. PHOTO_CODEC 이 webp 여도 Pillow 가 WebP 를 못 쓰면 JPEG."""
+    if str(PHOTO_CODEC).lower() == "webp" and features.check("webp"):
+        return "WEBP"
+    return "JPEG"
+
+
+def encode_image(img: "Image.Image", quality: int, fmt: str | None = None) -> bytes:
+    """PIL 이미지를 저장 코덱(fmt 생략 시 photo_format())으로 인코딩. quality 는 JPEG 기준 값."""
+    fmt = fmt or photo_format()
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        img.save(out, format="WEBP", quality=max(1, quality - WEBP_QUALITY_OFFSET), method=4)
+    else:
+        img.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def image_mime(data: bytes) -> str:
+    """이미지 bytes 앞부분(매직 바이트)으로 MIME 판별. 모르면 image/jpeg (예전 저장분은 모두 JPEG)."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    for magic, mime in _MAGIC_MIMES:
+        if data.startswith(magic):
+            return mime
+    return "image/jpeg"
+
+
+def b64_image_mime(b64: str) -> str:
+    """base64 사진 문자열의 MIME. 앞 16자(12 bytes)만 디코드해서 봄."""
+    try:
+        return image_mime(base64.b64decode(b64[:16]))
+    except Exception:
+        return "image/jpeg"
+
+
+def image_data_uri(b64: str) -> str:
+    """base64 사진 → data URI (형식은 내용으로 판별)."""
+    return f"data:{b64_image_mime(b64)};base64,{b64}"
 
 
 def resize_photo_to_final(pil_img: "Image.Image") -> bytes:
-    """PIL 이미지를 고정 크기(3:4)로 리사이즈해 JPEG bytes 반환."""
+    """PIL 이미지를 고정 크기(3:4)로 리사이즈해 저장 코덱 bytes 반환."""
     if pil_img is None:
         return b""
     try:
         if pil_img.mode in ("RGBA", "P"):
             pil_img = pil_img.convert("RGB")
         img = pil_img.resize((PHOTO_WIDTH, PHOTO_HEIGHT), Image.Resampling.LANCZOS)
-        out = io.BytesIO()
-        img.save(out, format="JPEG", quality=85, optimize=True)
-        return out.getvalue()
+        return encode_image(img, 85)
     except Exception:
         return b""
 
 
+def open_image(image_bytes: bytes, max_side: int | None = None) -> "Image.Image":
+    """이미지 bytes 를 PIL 이미지로 엶. JPEG 는 draft 로 max_side 근처까지 줄여서 디코드 (폰 사진 12MP 를 통째로 풀지 않음)."""
+    img = Image.open(io.BytesIO(image_bytes))
+    if max_side and img.format == "JPEG":
+        img.draft("RGB", (max_side, max_side))
+    if img.mode in ("RGBA", "P"):
+        img = img.convert("RGB")
+    return img
+
+
+def open_image_for_crop(image_bytes: bytes) -> "Image.Image":
+    """자르기 화면(st_cropper)에 넘길 이미지. 화면 표시·최종 저장 크기보다 큰 해상도는 디코드하지 않음."""
+    return open_image(image_bytes, CROP_MAX_SIDE)
+
+
+def _scaled(img: "Image.Image", scale: float) -> "Image.Image":
+    if scale >= 1:
+        return img
+    w, h = img.size
+    return img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.Resampling.LANCZOS)
+
+
+def encode_image_for_sheet(
+    img: "Image.Image", max_side: int | None = SHEET_MAX_SIDE, quality: int = SHEET_QUALITY, max_b64: int = PHOTO_B64_MAX
+) -> str:
+    """PIL 이미지를 max_b64(기본 PHOTO_B64_MAX, 셀 하나) 안에 드는 저장 코덱 base64 로. 인코딩은 최대 두 번.
+    큰 이미지는 TRIAL_MAX_PIXELS 크기로 한 번 인코딩해 보고, 그 크기로 상한에 맞는 최종 크기를 정해 원본에서 다시 인코딩함.
+    키운 결과가 상한을 넘으면 시험 결과를 씀."""
+    limit = max_b64 * 3 // 4  # base64 로 늘어나기 전 bytes 상한
+    w, h = img.size
+    scale = min(1.0, max_side / max(w, h)) if max_side else 1.0
+    trial_pixels = TRIAL_MAX_PIXELS * max_b64 / PHOTO_B64_MAX  # 상한이 크면 시험 크기도 같은 비율로
+    trial_scale = min(scale, (trial_pixels / (w * h)) ** 0.5)
+    data = encode_image(_scaled(img, trial_scale), quality)
+    room = limit * SIZE_MARGIN / len(data)
+    if room < 1:
+        lower = max(MIN_QUALITY, quality - QUALITY_STEP)
+        if lower < quality:
+            room /= QUALITY_STEP_SIZE
+        data = encode_image(_scaled(img, min(scale, trial_scale * room ** (1 / SHRINK_EXPONENT))), lower)
+    elif trial_scale < scale:
+        grown = encode_image(_scaled(img, min(scale, trial_scale * room ** (1 / GROW_EXPONENT))), quality)
+        if len(grown) <= limit:
+            data = grown
+    b64 = base64.b64encode(data).decode("ascii")
+    return b64[:max_b64] if len(b64) > max_b64 else b64
+
+
 def image_to_base64_for_sheet(image_bytes: bytes, mime_type: str) -> str:
     """이미지를 리사이즈·압축해 시트 한 셀에 들어가는 base64 문자열로 반환."""
     if not image_bytes:
         return ""
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        if img.mode in ("RGBA", "P"):
-            img = img.convert("RGB")
-        out = io.BytesIO()
-        max_side = 320
-        quality = 72
-        for _ in range(6):
-            w, h = img.size
-            if max(w, h) > max_side:
-                ratio = max_side / max(w, h)
-                new_size = (int(w * ratio), int(h * ratio))
-                img = img.resize(new_size, Image.Resampling.LANCZOS)
-            img.save(out, format="JPEG", quality=quality, optimize=True)
-            b64 = base64.b64encode(out.getvalue()).decode("ascii")
-            if len(b64) <= PHOTO_B64_MAX:
-                return b64
-            out.seek(0)
-            out.truncate(0)
-            max_side = int(max_side * 0.8)
-            quality = max(50, quality - 8)
-        b64 = base64.b64encode(out.getvalue()).decode("ascii")
-        return b64[:PHOTO_B64_MAX] if len(b64) > PHOTO_B64_MAX else b64
+        return encode_image_for_sheet(open_image(image_bytes, SHEET_MAX_SIDE))
     except Exception:
         return ""
+
+
+def compose_contact_sheet(images: list, columns: int) -> list[bytes]:
+    """사진 bytes 목록을 한 줄에 columns 칸(PHOTO_WIDTH×PHOTO_HEIGHT)씩 합친 줄 이미지(저장 코덱) 목록으로 반환.
+    i번째 사진은 i // columns 번째 줄의 i % columns 칸. 마지막 줄도 columns 칸 너비이고, 비었거나 읽을 수 없는 사진 칸은 회색으로 둠."""
+    return [_compose_contact_row(images[i:i + columns], columns) for i in range(0, len(images), columns)]
+
+
+def _compose_contact_row(images: list, columns: int) -> bytes:
+    sheet = Image.new("RGB", (PHOTO_WIDTH * columns, PHOTO_HEIGHT), (240, 242, 246))
+    for i, raw in enumerate(images):
+        if not raw:
+            continue
+        try:
+            img = Image.open(io.BytesIO(raw))
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            if img.size != (PHOTO_WIDTH, PHOTO_HEIGHT):
+                # 예전 방식으로 저장된 사진은 크기·비율이 달라 3:4 로 잘라 맞춤
+                img = ImageOps.fit(img, (PHOTO_WIDTH, PHOTO_HEIGHT), Image.Resampling.LANCZOS)
+        except Exception:
+            continue
+        sheet.paste(img, (i * PHOTO_WIDTH, 0))
+    return encode_image(sheet, 85)
@@ -1,138 +1,1135 @@
 # -*- coding: utf-8 -*-
 """구글 시트 연결 및 워크시트 getter (세션·캐시 활용)."""
 
+import atexit
+import contextvars
+import hashlib
+import json
+import os
+import random
+import secrets
+import threading
 import time
-from datetime import datetime
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
 
 import gspread
 import pandas as pd
 import streamlit as st
-
-from config import SPREADSHEET_NAME, BUDGET_SPREADSHEET_NAME
+from google.auth.transport.requests import Request
+from google.oauth2.service_account import Credentials
+from gspread.http_client import HTTPClient
+from gspread.utils import a1_to_rowcol, absolute_range_name, fill_gaps, numericise_all, rowcol_to_a1, to_records
+
+from config import (
+    BUDGET_SPREADSHEET_NAME,
+    PREFS_KEEP_DAYS,
+    PREFS_LOCK_SEC,
+    PREFS_LOCK_SETTLE_SEC,
+    PREFS_WRITE_DELAY_SEC,
+    SHEETS_MAX_ATTEMPTS,
+    SHEETS_REQUESTS_PER_MINUTE,
+    SPREADSHEET_ID_CACHE_FILE,
+    SPREADSHEET_NAME,
+)
+
+
+SHEETS_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive",
+]
+# 액세스 토큰 만료 이 시간(초) 전이면 미리 갱신
+TOKEN_REFRESH_MARGIN_SEC = 300
 
 
-def init(client, spreadsheet_name: str = None):
+def init(spreadsheet_name: str = None):
     """시트 모듈 초기화."""
-    global _client, _spreadsheet_name
-    _client = client
+    global _spreadsheet_name
     _spreadsheet_name = spreadsheet_name or SPREADSHEET_NAME
 
 
 # ------------------------
-# 시트 연결 (세션 캐시)
+# 스프레드시트 이름 → ID 캐시 (Drive 검색은 최초 1회 또는 ID 무효 시에만)
 # ------------------------
-def _is_retryable_api_error(e):
-    """429(한도) 또는 5xx(서버 오류)면 재시도 대상."""
-    if not isinstance(e, gspread.exceptions.APIError):
-        return False
-    resp = getattr(e, "response", None)
-    code = getattr(resp, "status_code", None) if resp else None
+def _spreadsheet_id_cache_path() -> Path:
+    return Path(__file__).resolve().parent / SPREADSHEET_ID_CACHE_FILE
+
+
+def _load_spreadsheet_ids() -> dict:
+    """저장된 이름→ID 매핑. Secrets [spreadsheet_ids] 값이 파일보다 우선."""
+    ids = {}
+    try:
+        with open(_spreadsheet_id_cache_path(), encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            ids.update({str(k): str(v) for k, v in data.items() if v})
+    except (OSError, ValueError):
+        pass
+    try:
+        configured = st.secrets.get("spreadsheet_ids") or {}
+        ids.update({str(k): str(v) for k, v in dict(configured).items() if v})
+    except Exception:
+        pass
+    return ids
+
+
+def _save_spreadsheet_ids(ids: dict):
+    """이름→ID 매핑을 파일에 저장. 쓰기 불가 환경이면 무시 (프로세스 메모리에는 유지)."""
+    path = _spreadsheet_id_cache_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(ids, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+# ------------------------
+# API 호출 조절 (분당 한도 토큰 버킷 + 우선순위 + 429/5xx 지수 백오프)
+# ------------------------
+PRIORITY_WRITE = 0  # 사용자 저장 (가장 먼저)
+PRIORITY_READ = 1  # 화면 표시용 읽기
+PRIORITY_BACKGROUND = 2  # 백그라운드 갱신
+_PRIORITY_NAMES = {PRIORITY_WRITE: "write", PRIORITY_READ: "read", PRIORITY_BACKGROUND: "background"}
+# 우선순위별로 남겨 둘 토큰 비율 (읽기는 쓰기 몫을, 백그라운드는 읽기·쓰기 몫을 남기고 가져감)
+_PRIORITY_RESERVE = {PRIORITY_WRITE: 0.0, PRIORITY_READ: 0.1, PRIORITY_BACKGROUND: 0.4}
+
+_api_priority = contextvars.ContextVar("sheets_api_priority", default=None)
+
+
+@contextmanager
+def api_priority(priority: int):
+    """블록 안의 시트 API 호출 우선순위 지정. 지정하지 않으면 GET 은 읽기, 그 외는 쓰기."""
+    token = _api_priority.set(priority)
+    try:
+        yield
+    finally:
+        _api_priority.reset(token)
+
+
+def _api_error_code(e):
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return code
+
+
+def _is_retryable_code(code) -> bool:
+    """429(한도) 또는 5xx(서버 오류)."""
     return code == 429 or (isinstance(code, int) and 500 <= code < 600)
 
 
-def _retry_sheet_call(fn, max_attempts=3, sleep_sec=6):
-    """시트 API 호출을 일시 오류 시 재시도."""
-    last_err = None
-    for attempt in range(max_attempts):
+class ApiGovernor:
+    """프로세스 공용 시트 API 호출 조절기. 모든 읽기·쓰기가 같은 토큰 버킷(분당 한도)에서 토큰을 받아 호출하고,
+    429(모든 요청)·5xx(idempotent 요청만)는 지수 백오프(지터 포함)로 재시도한다. 429 가 나면 버킷을 비워 다른 세션도 함께 늦춘다.
+    낮은 우선순위는 예약분을 남겨 두고, 더 높은 우선순위가 기다리는 동안에는 토큰을 가져가지 않는다."""
+
+    def __init__(self, per_minute: int, max_attempts: int = SHEETS_MAX_ATTEMPTS, backoff_base: float = 1.0, backoff_max: float = 32.0):
+        self.per_minute = per_minute
+        self._rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = {p: 0 for p in _PRIORITY_NAMES}
+        self._max_attempts = max_attempts
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._recent = deque()  # 최근 60초 호출 시각
+        self.calls = {name: 0 for name in _PRIORITY_NAMES.values()}
+        self.throttled = 0
+        self.throttled_sec = 0.0
+        self.retries = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.failures = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.per_minute), self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, priority: int):
+        """토큰 1개를 받을 때까지 대기."""
+        need = self.per_minute * _PRIORITY_RESERVE[priority] + 1.0
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    ahead = any(self._waiting[p] for p in self._waiting if p < priority)
+                    if not ahead and self._tokens >= need:
+                        self._tokens -= 1.0
+                        break
+                    wait = 0.05 if ahead else (need - self._tokens) / self._rate
+                    self._cond.wait(timeout=min(max(wait, 0.05), 1.0))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+            waited = time.monotonic() - start
+            if waited > 0.01:
+                self.throttled += 1
+                self.throttled_sec += waited
+            self._recent.append(time.monotonic())
+            self.calls[_PRIORITY_NAMES[priority]] += 1
+
+    def _penalize(self):
+        """429: 남은 토큰을 비워 모든 세션이 채워질 때까지 기다리게 함."""
+        with self._cond:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+    def call(self, method: str, fn, idempotent: bool | None = None):
+        """fn() 을 한도 안에서 실행. 429 는 재시도 (서버가 처리하지 않은 요청).
+        5xx 는 idempotent 요청만 재시도 (append 등은 서버가 이미 반영했을 수 있어 중복 행이 생김). 그 외 오류는 그대로 올림.
+        idempotent 를 주지 않으면 GET 만 idempotent 로 봄."""
+        if idempotent is None:
+            idempotent = str(method).upper() == "GET"
+        priority = _api_priority.get()
+        if priority is None:
+            priority = PRIORITY_READ if str(method).upper() == "GET" else PRIORITY_WRITE
+        for attempt in range(self._max_attempts):
+            self.acquire(priority)
+            try:
+                return fn()
+            except gspread.exceptions.APIError as e:
+                code = _api_error_code(e)
+                retryable = code == 429 or (idempotent and _is_retryable_code(code))
+                with self._cond:
+                    if code == 429:
+                        self.rate_limited += 1
+                    elif _is_retryable_code(code):
+                        self.server_errors += 1
+                    if not retryable or attempt == self._max_attempts - 1:
+                        self.failures += 1
+                        raise
+                    self.retries += 1
+                if code == 429:
+                    self._penalize()
+                delay = min(self._backoff_max, self._backoff_base * 2 ** attempt)
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+    def stats(self) -> dict:
+        """호출 수·대기·재시도 통계와 최근 1분 호출 수(남은 한도)."""
+        with self._cond:
+            self._refill()
+            cutoff = time.monotonic() - 60
+            while self._recent and self._recent[0] < cutoff:
+                self._recent.popleft()
+            return {
+                "per_minute": self.per_minute,
+                "tokens": round(self._tokens, 1),
+                "calls_last_minute": len(self._recent),
+                "headroom": self.per_minute - len(self._recent),
+                "calls": dict(self.calls),
+                "throttled": self.throttled,
+                "throttled_sec": round(self.throttled_sec, 1),
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "server_errors": self.server_errors,
+                "failures": self.failures,
+            }
+
+
+_governor = ApiGovernor(SHEETS_REQUESTS_PER_MINUTE)
+
+
+# 같은 요청을 다시 보내도 결과가 같은 POST (값 쓰기·지우기·읽기). append·구조 변경(batchUpdate) 등은 여기 없음
+_IDEMPOTENT_POST_SUFFIXES = ("/values:batchUpdate", "/values:batchClear", ":clear", "/values:batchGet", "/values:batchGetByDataFilter")
+
+
+def _is_idempotent_request(method: str, endpoint: str) -> bool:
+    method = str(method).upper()
+    if method in ("GET", "PUT"):
+        return True
+    path = str(endpoint).split("?", 1)[0]
+    return method == "POST" and path.endswith(_IDEMPOTENT_POST_SUFFIXES)
+
+
+class _GovernedHTTPClient(HTTPClient):
+    """gspread 의 모든 HTTP 요청(시트·Drive)을 공용 조절기를 거쳐 보냄."""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        return _governor.call(
+            method,
+            lambda: super(_GovernedHTTPClient, self).request(method, endpoint, *args, **kwargs),
+            idempotent=_is_idempotent_request(method, endpoint),
+        )
+
+
+def get_api_stats() -> dict:
+    """시트 API 호출 통계 (우선순위별 호출 수, 최근 1분 호출 수·남은 한도, 대기·재시도·429 횟수)."""
+    return _governor.stats()
+
+
+# ------------------------
+# 프로세스 공용 연결 (모든 세션이 공유)
+# ------------------------
+class SheetsConnection:
+    """인증된 gspread 클라이언트 1개와 스프레드시트·워크시트 핸들을 프로세스 단위로 보관.
+
+    세션마다 토큰 발급·Drive 이름 검색을 반복하지 않도록 st.cache_resource 로 한 번만 생성한다.
+    스프레드시트는 캐시된 ID로 open_by_key 하고, ID가 무효(404/403)일 때만 이름으로 다시 찾는다.
+    """
+
+    def __init__(self, service_account_info: dict, spreadsheet_ids: dict | None = None):
+        self._creds = Credentials.from_service_account_info(service_account_info, scopes=SHEETS_SCOPES)
+        self._client = gspread.authorize(self._creds, http_client=_GovernedHTTPClient)
+        self._lock = threading.RLock()
+        self._ids = dict(spreadsheet_ids or {})  # 스프레드시트 이름 -> ID
+        self._spreadsheets = {}  # 스프레드시트 이름 -> Spreadsheet
+        self._worksheets = {}  # (스프레드시트 id, 시트 이름) -> Worksheet
+        self._worksheets_loaded = set()  # 워크시트 목록을 한 번에 받아 둔 스프레드시트 id
+        self.created_at = time.time()
+        self.name_lookup_count = 0
+        self.stale_id_count = 0
+        self.token_refreshed_at = None
+        self.token_refresh_count = 0
+        self.open_count = 0
+        self.error_count = 0
+        self.last_error = None
+
+    @property
+    def client(self):
+        """토큰을 필요 시 갱신한 뒤 gspread 클라이언트 반환."""
+        self.refresh_token_if_needed()
+        return self._client
+
+    def _token_fresh(self) -> bool:
+        if not self._creds.token:
+            return False
+        expiry = getattr(self._creds, "expiry", None)
+        return expiry is None or (expiry - datetime.utcnow()).total_seconds() > TOKEN_REFRESH_MARGIN_SEC
+
+    def refresh_token_if_needed(self, force: bool = False):
+        """토큰이 없거나 만료 임박(TOKEN_REFRESH_MARGIN_SEC 이내)이면 미리 갱신. 요청 도중 401 재발급 지연 방지."""
+        if not force and self._token_fresh():
+            return
+        with self._lock:
+            if not force and self._token_fresh():
+                return
+            try:
+                self._creds.refresh(Request())
+                self.token_refreshed_at = time.time()
+                self.token_refresh_count += 1
+            except Exception as e:
+                self.error_count += 1
+                self.last_error = f"token: {e}"
+                raise
+
+    def spreadsheet(self, name: str):
+        """이름에 해당하는 스프레드시트 핸들. 프로세스에서 처음 한 번만 연다 (ID가 있으면 open_by_key)."""
+        sh = self._spreadsheets.get(name)
+        if sh is not None:
+            return sh
+        client = self.client
+        with self._lock:
+            sh = self._spreadsheets.get(name)
+            if sh is None:
+                try:
+                    sh = self._open(client, name)
+                except Exception as e:
+                    self.error_count += 1
+                    self.last_error = f"open {name}: {e}"
+                    raise
+                self.open_count += 1
+                self._spreadsheets[name] = sh
+            return sh
+
+    def _open(self, client, name: str):
+        """캐시된 ID로 열기. ID가 없거나 무효면 Drive 이름 검색 후 ID 저장."""
+        sid = self._ids.get(name)
+        if sid:
+            try:
+                return client.open_by_key(sid)
+            except (gspread.exceptions.SpreadsheetNotFound, PermissionError):
+                # 삭제·공유 해제 등으로 ID가 무효 → 이름으로 다시 찾음
+                self.stale_id_count += 1
+                self._ids.pop(name, None)
+        sh = client.open(name)
+        self.name_lookup_count += 1
+        self._ids[name] = sh.id
+        _save_spreadsheet_ids(self._ids)
+        return sh
+
+    def spreadsheet_id(self, name: str) -> str:
+        """스프레드시트 ID (열려 있지 않으면 연다)."""
+        return self.spreadsheet(name).id
+
+    def worksheet(self, spreadsheet, title: str, on_missing=None):
+        """스프레드시트의 워크시트 핸들 (캐시). 없으면 on_missing(spreadsheet)로 생성, on_missing 없으면 WorksheetNotFound.
+        스프레드시트마다 워크시트 목록(메타데이터)을 한 번에 받아 두어, 시트마다 메타데이터를 다시 읽지 않음."""
+        key = (spreadsheet.id, title)
+        ws = self._worksheets.get(key)
+        if ws is not None:
+            return ws
+        self.refresh_token_if_needed()
+        with self._lock:
+            ws = self._worksheets.get(key)
+            if ws is not None:
+                return ws
+            if spreadsheet.id not in self._worksheets_loaded:
+                for w in spreadsheet.worksheets():
+                    self._worksheets.setdefault((spreadsheet.id, w.title), w)
+                self._worksheets_loaded.add(spreadsheet.id)
+                ws = self._worksheets.get(key)
+            if ws is None:
+                try:
+                    # 목록을 받은 뒤 다른 곳에서 추가됐을 수 있으므로 한 번 더 확인
+                    ws = spreadsheet.worksheet(title)
+                except gspread.exceptions.WorksheetNotFound:
+                    if on_missing is None:
+                        raise
+                    ws = on_missing(spreadsheet)
+                self._worksheets[key] = ws
+            return ws
+
+    def has_worksheet(self, spreadsheet, title: str) -> bool:
+        """워크시트 존재 여부 (캐시된 목록 기준)."""
         try:
-            return fn()
-        except gspread.exceptions.APIError as e:
-            last_err = e
-            if _is_retryable_api_error(e) and attempt < max_attempts - 1:
-                time.sleep(sleep_sec)
-                continue
-            raise
-    if last_err is not None:
-        raise last_err
-    return None
+            self.worksheet(spreadsheet, title)
+            return True
+        except gspread.exceptions.WorksheetNotFound:
+            return False
+
+    def forget(self, name: str = None):
+        """핸들 캐시 비우기. name 지정 시 해당 스프레드시트(와 그 워크시트)만."""
+        with self._lock:
+            if name is None:
+                self._spreadsheets.clear()
+                self._worksheets.clear()
+                return
+            sh = self._spreadsheets.pop(name, None)
+            if sh is not None:
+                for key in [k for k in self._worksheets if k[0] == sh.id]:
+                    del self._worksheets[key]
+                self._worksheets_loaded.discard(sh.id)
+
+    def stats(self) -> dict:
+        """연결 상태·경과 시간 통계."""
+        now = time.time()
+        expiry = getattr(self._creds, "expiry", None)
+        expires_in = (expiry - datetime.utcnow()).total_seconds() if expiry is not None else None
+        return {
+            "healthy": bool(self._creds.token) and (expires_in is None or expires_in > 0) and self.last_error is None,
+            "age_sec": int(now - self.created_at),
+            "token_age_sec": int(now - self.token_refreshed_at) if self.token_refreshed_at else None,
+            "token_expires_in_sec": int(expires_in) if expires_in is not None else None,
+            "token_refresh_count": self.token_refresh_count,
+            "open_count": self.open_count,
+            "name_lookup_count": self.name_lookup_count,
+            "stale_id_count": self.stale_id_count,
+            "spreadsheets": sorted(self._spreadsheets),
+            "worksheets": len(self._worksheets),
+            "error_count": self.error_count,
+            "last_error": self.last_error,
+        }
+
+
+@st.cache_resource(show_spinner=False)
+def get_connection() -> SheetsConnection:
+    """프로세스 공용 시트 연결. 모든 세션이 같은 클라이언트·핸들을 사용."""
+    return SheetsConnection(dict(st.secrets["gcp_service_account"]), _load_spreadsheet_ids())
+
+
+def get_connection_stats() -> dict:
+    """공용 연결의 상태 통계 (healthy, age_sec, token_expires_in_sec 등)."""
+    return get_connection().stats()
 
 
+# ------------------------
+# 시트 연결
+# ------------------------
 def get_sheet():
-    """세션당 한 번만 시트를 열어 반환. 429 시 잠시 대기 후 1회 재시도."""
-    if "sheet" not in st.session_state:
-        last_err = None
-        for attempt in range(2):
-            try:
-                st.session_state.sheet = _client.open(_spreadsheet_name)
-                last_err = None
-                break
-            except gspread.exceptions.APIError as e:
-                last_err = e
-                resp = getattr(e, "response", None)
-                if resp is not None and getattr(resp, "status_code", None) == 429 and attempt == 0:
-                    time.sleep(8)
-                    continue
-                break
-        if last_err is not None:
-            st.error(
-                "구글 시트에 연결할 수 없습니다. "
-                "시트 이름이 맞는지, **서비스 계정 이메일**에 해당 스프레드시트 공유가 되어 있는지 확인해 주세요. "
-                "읽기 한도(429)가 나온 경우 잠시 후 다시 시도해 보세요."
-            )
-            st.stop()
-    return st.session_state.sheet
+    """공용 연결에서 출석용 스프레드시트 반환 (프로세스당 한 번만 열기). 429·5xx 재시도는 API 조절기가 처리."""
+    try:
+        return get_connection().spreadsheet(_spreadsheet_name)
+    except Exception:
+        pass
+    st.error(
+        "구글 시트에 연결할 수 없습니다. "
+        "시트 이름이 맞는지, **서비스 계정 이메일**에 해당 스프레드시트 공유가 되어 있는지 확인해 주세요. "
+        "읽기 한도(429)가 나온 경우 잠시 후 다시 시도해 보세요."
+    )
+    st.stop()
 
 
 def get_budget_sheet():
-    """예산청구 전용 스프레드시트. 세션당 한 번만 열어 반환. 429 시 잠시 대기 후 1회 재시도."""
-    if "budget_sheet" not in st.session_state:
-        last_err = None
-        for attempt in range(2):
+    """예산청구 전용 스프레드시트. 공용 연결에서 프로세스당 한 번만 열어 반환. 429·5xx 재시도는 API 조절기가 처리."""
+    try:
+        return get_connection().spreadsheet(BUDGET_SPREADSHEET_NAME)
+    except gspread.exceptions.SpreadsheetNotFound:
+        st.error(
+            f"**예산청구용 스프레드시트를 찾을 수 없습니다.**\n\n"
+            f"다음을 확인해 주세요:\n"
+            f"1. 구글 드라이브에 **이름이 `{BUDGET_SPREADSHEET_NAME}` 인** 스프레드시트를 만드세요.\n"
+            f"2. 해당 스프레드시트를 **편집 권한**으로 **서비스 계정 이메일**과 공유하세요.\n"
+            f"   (서비스 계정 이메일은 GCP/Secrets 설정에서 확인할 수 있습니다.)"
+        )
+        st.stop()
+    except Exception:
+        pass
+    st.error(
+        "예산청구용 구글 시트에 연결할 수 없습니다. "
+        "시트 이름이 맞는지, **서비스 계정 이메일**에 해당 스프레드시트 공유가 되어 있는지 확인해 주세요."
+    )
+    st.stop()
+
+
+def _open_ws(title: str, on_missing=None, budget: bool = False):
+    """공용 연결에서 워크시트 핸들 반환 (프로세스 캐시). budget=True면 예산청구 스프레드시트."""
+    sheet = get_budget_sheet() if budget else get_sheet()
+    return get_connection().worksheet(sheet, title, on_missing=on_missing)
+
+
+def open_worksheet(spreadsheet_name: str, title: str, on_missing=None):
+    """스프레드시트 이름으로 공용 워크시트 핸들 반환. (auth 등 화면 오류 처리를 직접 하는 곳용)
+    오류 시 st.stop() 하지 않고 예외를 그대로 올림."""
+    conn = get_connection()
+    return conn.worksheet(conn.spreadsheet(spreadsheet_name), title, on_missing=on_missing)
+
+
+def lock_cell_held(value, now: float) -> bool:
+    """잠금 셀 값("<표시>:<만료 시각>")이 아직 유효한지."""
+    try:
+        return int(str(value or "").rsplit(":", 1)[-1]) > now
+    except ValueError:
+        return False
+
+
+def claim_lock_cell(ws, cell: str, mark: str, now: float) -> bool:
+    """잠금 셀이 비었거나 만료됐으면 mark 를 쓰고, 다시 읽어 내 것인지 확인. (다른 프로세스와 동시에 시트를 다시 쓰지 않도록)"""
+    col = a1_to_rowcol(cell)[1]
+    if ws.col_count < col:
+        ws.add_cols(col - ws.col_count)
+    if lock_cell_held(ws.acell(cell).value, now):
+        return False
+    ws.update_acell(cell, mark)
+    return (ws.acell(cell).value or "") == mark
+
+
+# ------------------------
+# 캐시 의존성 (getter가 읽는 워크시트 선언 → 쓰기 후 해당 시트 캐시만 무효화)
+# ------------------------
+_CACHE_DEPENDENCIES = {}  # 워크시트 이름 -> [그 시트를 읽는 캐시 getter]
+_eviction_stats = defaultdict(lambda: {"writes": 0, "evictions": 0})
+_eviction_lock = threading.Lock()
+
+
+def _reads(*worksheets: str):
+    """캐시 getter가 읽는 워크시트 선언. invalidate_sheets_cache(시트) 시 그 시트를 읽는 getter 캐시만 비움."""
+    def deco(fn):
+        for ws_name in worksheets:
+            _CACHE_DEPENDENCIES.setdefault(ws_name, []).append(fn)
+        return fn
+    return deco
+
+
+# ------------------------
+# 동시 캐시 미스 합치기 (single-flight)
+# ------------------------
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _SingleFlight:
+    """같은 키의 동시 호출을 하나로 합침. 처음 호출한 쪽만 fn 을 실행하고,
+    그동안 들어온 호출은 기다렸다가 같은 결과(또는 같은 예외)를 받음."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> 진행 중인 _Flight
+        self._stats = defaultdict(lambda: {"fetches": 0, "coalesced": 0})
+
+    def do(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._stats[key]["fetches"] += 1
+            else:
+                self._stats[key]["coalesced"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        """키별 실제 읽기 수(fetches)와 합쳐져 생략된 중복 읽기 수(coalesced)."""
+        with self._lock:
+            return {k: dict(v) for k, v in self._stats.items()}
+
+
+_single_flight = _SingleFlight()
+
+
+def single_flight(key, fn):
+    """같은 키로 동시에 부른 fn 을 한 번만 실행 (다른 모듈의 시트 읽기용). 통계는 get_single_flight_stats 에 같이 나옴."""
+    return _single_flight.do(key, fn)
+
+
+def get_single_flight_stats() -> dict:
+    """동시 캐시 미스 합치기 통계. {키: {"fetches": 실제 읽기, "coalesced": 생략된 중복 읽기}}"""
+    return _single_flight.stats()
+
+
+# ------------------------
+# 주요 시트 스냅샷 (students, class, attendance, new_believers 를 values:batchGet 한 번으로 읽기)
+# ------------------------
+SHEET_CACHE_TTL = 300  # 초. 지나면 이전 값을 바로 보여 주고 백그라운드에서 다시 읽음 (stale-while-revalidate)
+SHEET_CACHE_HARD_TTL = 1800  # 초. 이보다 오래된 값은 보여 주지 않고 기다려서 다시 읽음
+SNAPSHOT_WORKSHEETS = ("students", "class", "attendance", "new_believers")
+# 만료 시 요청이 없어도 함께 다시 읽는 시트. students 전체(사진·연락처 포함)는 최근에 요청된 경우에만 함께 읽음
+SNAPSHOT_EAGER_WORKSHEETS = ("class", "attendance", "new_believers")
+# 학년·반 선택, 출석 체크 등 대부분 화면이 쓰는 학생 열
+ROSTER_COLUMNS = ("학년", "반", "이름")
+# 출석 시트 증분 동기화: 갱신 시 마지막 N행을 다시 받아 체크섬 비교 (행 삭제·이동 감지)
+ATTENDANCE_TAIL_ROWS = 20
+# 시트에서 직접 고친 내용(중간 행 수정 등)까지 반영되도록 이 주기(초)마다 한 번은 전체 다시 읽기
+ATTENDANCE_FULL_RELOAD_SEC = 3600
+
+
+def _values_to_records(values: list) -> list[dict]:
+    """시트 값(2차원 리스트)을 get_all_records() 와 같은 규칙으로 레코드 리스트로 변환. (1행 헤더, 숫자 변환, 빈칸은 '')"""
+    if not values or not values[0]:
+        return []
+    values = fill_gaps(values)
+    keys = values[0]
+    dupes = [k for k in set(keys) if keys.count(k) > 1]
+    if dupes:
+        raise gspread.exceptions.GSpreadException(f"the header row in the worksheet contains duplicates: {dupes}")
+    return to_records(keys, [numericise_all(row) for row in values[1:]])
+
+
+def _row_key(row) -> tuple:
+    """비교용 행 정규화 (문자열화, 끝의 빈 칸 제거). API는 끝 빈 칸을 생략해 돌려주므로 이에 맞춤."""
+    cells = ["" if v is None else str(v) for v in row]
+    while cells and cells[-1] == "":
+        cells.pop()
+    return tuple(cells)
+
+
+def _rows_checksum(rows) -> str:
+    h = hashlib.sha1()
+    for row in rows:
+        h.update("\x1f".join(_row_key(row)).encode("utf-8"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+class _AttendanceSync:
+    """출석 시트 증분 동기화. 출석 시트는 행이 추가만 되므로, 마지막으로 동기화한 행 수와 끝부분 체크섬을 기억해
+    갱신 시에는 A{n+1} 이후의 새 행만 받아 메모리 레코드에 덧붙인다.
+    끝부분 체크섬이 달라졌으면(행 삭제로 위치가 밀림) 그때만 전체를 다시 읽는다."""
+
+    def __init__(self, tail_rows: int = ATTENDANCE_TAIL_ROWS, full_reload_sec: float = ATTENDANCE_FULL_RELOAD_SEC):
+        self._tail_rows = tail_rows
+        self._full_reload_sec = full_reload_sec
+        self._lock = threading.Lock()
+        self._values = []  # 헤더 포함 원본 행 (시트 1행 = index 0)
+        self._records = []
+        self._tail_sum = None
+        self._full_at = 0.0
+        self.full_count = 0
+        self.incremental_count = 0
+        self.rows_fetched = 0
+        self.mismatch_count = 0
+
+    def can_increment(self) -> bool:
+        with self._lock:
+            return bool(self._values) and time.time() - self._full_at < self._full_reload_sec
+
+    def _width(self) -> int:
+        return max(6, len(self._values[0]) if self._values else 0)
+
+    def refresh_ranges(self) -> tuple[int, list[str]]:
+        """(현재 동기화 행 수, [끝부분 확인 범위, 새 행 범위]). A1 표기."""
+        with self._lock:
+            n = len(self._values)
+            last_col = rowcol_to_a1(1, self._width()).rstrip("0123456789")
+        tail_start = max(1, n - self._tail_rows + 1)
+        return n, [
+            absolute_range_name("attendance", f"A{tail_start}:{last_col}{n}"),
+            absolute_range_name("attendance", f"A{n + 1}:{last_col}"),
+        ]
+
+    def apply(self, n: int, tail_values: list, new_values: list) -> bool:
+        """증분 결과 반영. 끝부분이 기억과 다르면 False (전체 다시 읽기 필요)."""
+        with self._lock:
+            if len(self._values) != n:
+                # 다른 요청이 이미 반영함
+                return True
+            tail_start = max(1, n - self._tail_rows + 1)
+            expected = self._values[tail_start - 1:n]
+            if _rows_checksum(tail_values) != _rows_checksum(expected) or len(tail_values) != len(expected):
+                self.mismatch_count += 1
+                return False
+            if new_values:
+                header = self._values[0]
+                self._values.extend(new_values)
+                self._records.extend(_values_to_records([header] + new_values))
+                self.rows_fetched += len(new_values)
+                self._tail_sum = _rows_checksum(self._values[-self._tail_rows:])
+            self.incremental_count += 1
+            return True
+
+    def reset(self, values: list):
+        """전체 읽은 값으로 초기화."""
+        records = _values_to_records(values)
+        with self._lock:
+            self._values = [list(r) for r in values]
+            self._records = records
+            self._tail_sum = _rows_checksum(self._values[-self._tail_rows:])
+            self._full_at = time.time()
+            self.full_count += 1
+            self.rows_fetched += len(values)
+
+    def header(self) -> list:
+        """출석 시트 헤더 (동기화 전이면 빈 리스트)."""
+        with self._lock:
+            return list(self._values[0]) if self._values else []
+
+    def write_through(self, cell_updates: list, appended_start: int | None = None, appended_rows: list | None = None) -> bool:
+        """저장한 내용을 메모리에 바로 반영 (다시 읽지 않음). cell_updates 는 [(시트 행 번호, 열 index, 값)].
+        덧붙인 행 위치가 기억한 끝과 이어지지 않으면 False (다음 갱신 때 증분으로 받도록).
+        이미 내준 레코드 dict·색인이 반쯤 바뀐 값을 보지 않도록, 바뀌는 행만 새로 만든 목록을 한 번에 바꿔 끼움."""
+        with self._lock:
+            if not self._values:
+                return False
+            header = self._values[0]
+            values, records = list(self._values), list(self._records)
+            for row_no, col, value in cell_updates:
+                row = list(values[row_no - 1])
+                if len(row) <= col:
+                    row.extend([""] * (col + 1 - len(row)))
+                row[col] = str(value)
+                values[row_no - 1] = row
+                records[row_no - 2] = {**records[row_no - 2], header[col]: numericise_all([str(value)])[0]}
+            ok = True
+            if appended_rows:
+                if appended_start == len(values) + 1:
+                    rows = [[str(v) for v in r] for r in appended_rows]
+                    values.extend(rows)
+                    records.extend(_values_to_records([header] + rows))
+                else:
+                    ok = False
+            self._values, self._records = values, records
+            self._tail_sum = _rows_checksum(values[-self._tail_rows:])
+            return ok
+
+    def mark_stale(self):
+        """행 위치가 바뀌는 쓰기(행 삭제) 후 호출. 다음 갱신 때 전체를 다시 읽음."""
+        with self._lock:
+            self._full_at = 0.0
+
+    def records(self) -> list[dict]:
+        with self._lock:
+            return list(self._records)
+
+    def row_count(self) -> int:
+        """동기화된 시트 행 수 (헤더 포함)."""
+        with self._lock:
+            return len(self._values)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rows": len(self._values),
+                "tail_checksum": self._tail_sum,
+                "full_count": self.full_count,
+                "incremental_count": self.incremental_count,
+                "rows_fetched": self.rows_fetched,
+                "mismatch_count": self.mismatch_count,
+            }
+
+
+class AttendanceIndex:
+    """출석 레코드 색인. 데이터 버전(다시 읽기·저장 반영)마다 한 번 만들어, 렌더링 때마다 전체 표를 거르지 않게 함.
+    (날짜, 학년, 반) -> 행 위치·시트 행 번호, (학년, 반, 이름) -> 출석한 주(W-SUN) 집합. 값은 문자열·공백 제거 후 비교."""
+
+    def __init__(self, records: list[dict]):
+        self.records = records
+        self._rows = {}  # (날짜, 학년, 반) -> [(레코드 위치, 시트 행 번호)]
+        self._present = {}  # (날짜, 학년, 반) -> 출석한 이름 set
+        self._weeks = {}  # (학년, 반, 이름) -> {연도: 출석한 주 set}
+        periods = {}  # 날짜 문자열 -> (연도, 주) (같은 날짜는 한 번만 변환)
+        for pos, rec in enumerate(records):
+            d, g, c, name = (_index_key(rec.get(k, "")) for k in ("날짜", "학년", "반", "이름"))
+            self._rows.setdefault((d, g, c), []).append((pos, pos + 2))
+            if _index_key(rec.get("출석상태", "")) != "출석":
+                continue
+            self._present.setdefault((d, g, c), set()).add(name)
+            if d not in periods:
+                ts = pd.to_datetime(d, errors="coerce")
+                periods[d] = None if pd.isna(ts) else (ts.year, ts.to_period("W-SUN"))
+            if periods[d] is not None:
+                year, week = periods[d]
+                self._weeks.setdefault((g, c, name), {}).setdefault(year, set()).add(week)
+
+    def rows(self, date_str: str, grade, class_name) -> list[tuple[int, int]]:
+        """(날짜, 학년, 반) 행들의 [(레코드 위치, 시트 행 번호)]."""
+        return list(self._rows.get((_index_key(date_str), _index_key(grade), _index_key(class_name)), ()))
+
+    def attended_names(self, date_str: str, grade, class_name) -> set:
+        """(날짜, 학년, 반)에 출석으로 기록된 이름들."""
+        return set(self._present.get((_index_key(date_str), _index_key(grade), _index_key(class_name)), ()))
+
+    def attended_weeks(self, grade, class_name, name, year: int | None = None) -> set:
+        """학생이 출석한 주(W-SUN Period) 집합. year 를 주면 그 해 날짜만."""
+        by_year = self._weeks.get((_index_key(grade), _index_key(class_name), _index_key(name)), {})
+        if year is not None:
+            return set(by_year.get(year, ()))
+        return set().union(*by_year.values()) if by_year else set()
+
+
+def _index_key(value) -> str:
+    return str(value).strip()
+
+
+def _col_letter(col: int) -> str:
+    """1-based 열 번호 → 열 문자 (1 → A)."""
+    return rowcol_to_a1(1, col).rstrip("0123456789")
+
+
+def _entry_title(key) -> str:
+    """스냅샷 항목 키(시트 이름 또는 (시트 이름, 열 목록)) → 시트 이름."""
+    return key[0] if isinstance(key, tuple) else key
+
+
+class _SheetSnapshot:
+    """주요 시트 값을 프로세스 공용으로 보관. 만료(ttl)된 시트들을 한 번의 batchGet 으로 함께 다시 읽어
+    모든 getter가 같은 시점의 데이터를 보게 함. 시트별로 무효화할 수 있어, 쓰기 후에는 바뀐 시트만 다시 읽음.
+    항목 키는 시트 이름, 또는 일부 열만 읽는 (시트 이름, 열 목록) — 헤더로 열 위치를 찾아 그 열 범위만 받음.
+    ttl 이 지난 값은 hard_ttl 까지는 그대로 보여 주고 백그라운드 스레드가 다시 읽음 (화면이 멈추지 않게).
+    다시 읽기가 한도·서버 오류로 실패하면 가지고 있던 값을 계속 보여 줌."""
+
+    def __init__(self, conn: SheetsConnection, spreadsheet_name: str, ttl: float, hard_ttl: float):
+        self._conn = conn
+        self._spreadsheet_name = spreadsheet_name
+        self._ttl = ttl
+        self._hard_ttl = hard_ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # 백그라운드 갱신·저장 전 동기화가 동시에 출석 동기화를 건드리지 않게
+        self._refreshing = False
+        self.stale_served = 0
+        self.background_refreshes = 0
+        self.background_failures = 0
+        self.last_refresh_error = None
+        self._records = {}  # 항목 키 -> 레코드 리스트 (시트가 없으면 None)
+        self._frames = {}  # 항목 키 -> DataFrame (시트가 없으면 None)
+        self._loaded_at = {}  # 항목 키 -> 마지막으로 읽은 시각
+        self._requested_at = {}  # 항목 키 -> 마지막으로 요청된 시각 (만료 시 함께 읽을지 판단)
+        self._projections = set()  # 요청된 적 있는 (시트 이름, 열 목록)
+        self._headers = {}  # 시트 이름 -> 헤더 행 (열 위치 찾기용)
+        self.load_count = 0
+        self._attendance_version = 0  # 출석 값이 바뀔 때마다 증가 (색인 재생성 기준)
+        self._attendance_index = None
+        self._attendance_index_version = -1
+        self.attendance = _AttendanceSync()
+
+    def _stale_titles(self, key=None) -> list:
+        """만료된 항목 중 이번에 함께 읽을 것: key 자신, 항상 읽는 시트, 최근(hard_ttl 안)에 요청된 항목."""
+        now = time.time()
+        with self._lock:
+            entries = list(SNAPSHOT_WORKSHEETS) + sorted(self._projections)
+            return [
+                k for k in entries
+                if now - self._loaded_at.get(k, 0.0) >= self._ttl
+                and (k == key or k in SNAPSHOT_EAGER_WORKSHEETS or now - self._requested_at.get(k, 0.0) < self._hard_ttl)
+            ]
+
+    def _ensure(self, title: str):
+        """title 이 만료됐으면, 만료된 시트 전부를 한 번에 다시 읽음.
+        ttl~hard_ttl 사이면 기다리지 않고 백그라운드 갱신만 시작. 다른 세션이 이미 읽는 중이면 그 결과를 기다려 같이 씀.
+        합류한 읽기가 title 을 포함하지 않았으면(다른 시트용 읽기, 그 뒤 무효화 등) 이 호출이 직접 읽을 때까지 반복."""
+        while True:
+            with self._lock:
+                loaded_at = self._loaded_at.get(title)
+                has_data = title in self._frames
+            age = None if loaded_at is None else time.time() - loaded_at
+            if age is not None and age < self._ttl:
+                return
+            if age is not None and age < self._hard_ttl and has_data:
+                self._refresh_in_background()
+                return
+            stale = self._stale_titles(title)
+            led = []
+
+            def load():
+                led.append(True)
+                self._load(stale)
+
             try:
-                st.session_state.budget_sheet = _client.open(BUDGET_SPREADSHEET_NAME)
-                last_err = None
-                break
-            except gspread.exceptions.SpreadsheetNotFound:
-                last_err = None
-                st.error(
-                    f"**예산청구용 스프레드시트를 찾을 수 없습니다.**\n\n"
-                    f"다음을 확인해 주세요:\n"
-                    f"1. 구글 드라이브에 **이름이 `{BUDGET_SPREADSHEET_NAME}` 인** 스프레드시트를 만드세요.\n"
-                    f"2. 해당 스프레드시트를 **편집 권한**으로 **서비스 계정 이메일**과 공유하세요.\n"
-                    f"   (서비스 계정 이메일은 GCP/Secrets 설정에서 확인할 수 있습니다.)"
-                )
-                st.stop()
+                _single_flight.do(f"snapshot:{self._spreadsheet_name}", load)
             except gspread.exceptions.APIError as e:
-                last_err = e
-                resp = getattr(e, "response", None)
-                if resp is not None and getattr(resp, "status_code", None) == 429 and attempt == 0:
-                    time.sleep(8)
-                    continue
-                break
-        if last_err is not None:
-            st.error(
-                "예산청구용 구글 시트에 연결할 수 없습니다. "
-                "시트 이름이 맞는지, **서비스 계정 이메일**에 해당 스프레드시트 공유가 되어 있는지 확인해 주세요."
-            )
-            st.stop()
-    return st.session_state.budget_sheet
+                if not (has_data and _is_retryable_code(_api_error_code(e))):
+                    raise
+                # 한도 초과 등: 오류 화면 대신 가지고 있던 값
+                with self._lock:
+                    self.stale_served += 1
+                    self.last_refresh_error = str(e)
+                return
+            if led:
+                return
+
+    def _refresh_in_background(self):
+        """만료된 시트를 백그라운드 스레드에서 다시 읽음 (이미 진행 중이면 생략). 낮은 우선순위로 API 한도를 씀."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self.stale_served += 1
+
+        def run():
+            try:
+                stale = self._stale_titles()
+                if stale:
+                    with api_priority(PRIORITY_BACKGROUND):
+                        _single_flight.do(f"snapshot:{self._spreadsheet_name}", lambda: self._load(stale))
+                with self._lock:
+                    self.background_refreshes += 1
+            except Exception as e:
+                with self._lock:
+                    self.background_failures += 1
+                    self.last_refresh_error = str(e)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="sheets-snapshot-refresh", daemon=True).start()
+
+    def _load(self, wanted: list[str]):
+        with self._load_lock:
+            self._fetch(wanted)
+
+    def _read_header(self, sheet, title: str) -> list:
+        resp = sheet.values_batch_get([absolute_range_name(title, "1:1")])
+        values = resp.get("valueRanges", [{}])[0].get("values", [])
+        header = values[0] if values else []
+        self._headers[title] = header
+        return header
+
+    def _projection_ranges(self, sheet, key) -> tuple[list, list, list]:
+        """(헤더 확인 범위 + 열 범위들, 읽을 열 이름, 기준 헤더). 헤더를 모르면 1행만 먼저 읽음."""
+        title, columns = key
+        header = self._headers.get(title)
+        if header is None:
+            header = self._read_header(sheet, title)
+        idx = [header.index(c) for c in columns if c in header]
+        ranges = [absolute_range_name(title, "1:1")]
+        ranges += [absolute_range_name(title, f"{_col_letter(i + 1)}2:{_col_letter(i + 1)}") for i in idx]
+        return ranges, [header[i] for i in idx], header
+
+    def _fetch_projection(self, sheet, key) -> list[dict]:
+        """열 범위만 따로 다시 읽기 (헤더가 바뀌어 열 위치가 달라졌을 때)."""
+        ranges, names, _ = self._projection_ranges(sheet, key)
+        resp = sheet.values_batch_get(ranges)
+        return _columns_to_records(names, resp.get("valueRanges", [])[1:])
+
+    def _fetch(self, wanted: list):
+        sheet = self._conn.spreadsheet(self._spreadsheet_name)
+        present = [k for k in wanted if self._conn.has_worksheet(sheet, _entry_title(k))]
+        titles = [k for k in present if not isinstance(k, tuple)]
+        projections = [k for k in present if isinstance(k, tuple)]
+        # 출석은 이미 받아 둔 게 있으면 끝부분 확인 범위 + 새 행 범위만 요청
+        att_incremental = "attendance" in titles and self.attendance.can_increment()
+        full_titles = [t for t in titles if not (att_incremental and t == "attendance")]
+        ranges = [absolute_range_name(t) for t in full_titles]
+        if att_incremental:
+            att_n, att_ranges = self.attendance.refresh_ranges()
+            ranges += att_ranges
+        proj_specs = []
+        for key in projections:
+            proj_ranges, names, used_header = self._projection_ranges(sheet, key)
+            proj_specs.append((key, len(ranges), len(proj_ranges), names, used_header))
+            ranges += proj_ranges
+        resp = sheet.values_batch_get(ranges) if ranges else {}
+        value_ranges = resp.get("valueRanges", [])
+        records = {t: None for t in wanted}
+        columns = {}
+        for t, vr in zip(full_titles, value_ranges):
+            values = vr.get("values", [])
+            self._headers[t] = list(values[0]) if values else []
+            if t == "attendance":
+                self.attendance.reset(values)
+            else:
+                records[t] = _values_to_records(values)
+        for key, start, count, names, used_header in proj_specs:
+            header_vr = value_ranges[start].get("values", [])
+            header = header_vr[0] if header_vr else []
+            if _row_key(header) != _row_key(used_header):
+                # 헤더가 바뀜(열 추가 등) → 새 헤더로 열 위치를 다시 잡아 이 항목만 다시 읽음
+                self._headers[key[0]] = header
+                records[key] = self._fetch_projection(sheet, key)
+                names = [c for c in key[1] if c in header]
+            else:
+                records[key] = _columns_to_records(names, value_ranges[start + 1:start + count])
+            columns[key] = names
+        if att_incremental:
+            tail_vr, new_vr = value_ranges[len(full_titles):len(full_titles) + 2]
+            if not self.attendance.apply(att_n, tail_vr.get("values", []), new_vr.get("values", [])):
+                # 끝부분이 달라짐(행 삭제 등) → 출석 시트만 전체 다시 읽기
+                full = sheet.values_batch_get([absolute_range_name("attendance")])
+                self.attendance.reset(full.get("valueRanges", [{}])[0].get("values", []))
+        if "attendance" in titles:
+            records["attendance"] = self.attendance.records()
+        frames = {
+            k: (pd.DataFrame(r, columns=columns[k]) if k in columns else pd.DataFrame(r)) if r is not None else None
+            for k, r in records.items()
+        }
+        now = time.time()
+        with self._lock:
+            self._records.update(records)
+            self._frames.update(frames)
+            for t in wanted:
+                self._loaded_at[t] = now
+            if "attendance" in records:
+                self._attendance_version += 1
+            self.load_count += 1
+
+    def _mark_requested(self, key):
+        with self._lock:
+            self._requested_at[key] = time.time()
+            if isinstance(key, tuple):
+                self._projections.add(key)
+
+    def frame(self, key):
+        """항목 DataFrame 복사본. 시트가 없으면 None.
+        열 목록 항목은 같은 시트 전체를 최근(ttl 안)에 읽어 두었으면 거기서 열만 골라 줌 (API 호출 없음)."""
+        self._mark_requested(key)
+        if isinstance(key, tuple):
+            with self._lock:
+                wide = self._frames.get(key[0])
+                fresh = time.time() - self._loaded_at.get(key[0], 0.0) < self._ttl
+            if wide is not None and fresh:
+                return wide[[c for c in key[1] if c in wide.columns]].copy()
+        self._ensure(key)
+        with self._lock:
+            df = self._frames.get(key)
+        return df.copy() if df is not None else None
+
+    def records(self, title: str):
+        """시트 레코드 리스트 복사본. 시트가 없으면 None."""
+        self._mark_requested(title)
+        self._ensure(title)
+        with self._lock:
+            recs = self._records.get(title)
+        return [dict(r) for r in recs] if recs is not None else None
+
+    def refresh_attendance(self):
+        """출석 시트를 지금 동기화 (가능하면 증분). 행 위치를 기준으로 쓰기 전에 호출."""
+        self._load(["attendance"])
+
+    def attendance_written(self):
+        """출석 메모리 값이 바뀐 뒤(write-through) DataFrame 만 다시 만듦. API 호출 없음."""
+        records = self.attendance.records()
+        frame = pd.DataFrame(records)
+        with self._lock:
+            self._records["attendance"] = records
+            self._frames["attendance"] = frame
+            self._attendance_version += 1
+
+    def attendance_index(self) -> AttendanceIndex:
+        """현재 출석 데이터의 색인. 데이터 버전이 같으면 만들어 둔 것을 재사용."""
+        self._ensure("attendance")
+        with self._lock:
+            if self._attendance_index is not None and self._attendance_index_version == self._attendance_version:
+                return self._attendance_index
+            version = self._attendance_version
+            records = self._records.get("attendance") or []
+        index = AttendanceIndex(records)
+        with self._lock:
+            if version == self._attendance_version:
+                self._attendance_index = index
+                self._attendance_index_version = version
+        return index
+
+    def stats(self) -> dict:
+        """스냅샷 갱신 통계 (시트별 경과 시간, 이전 값 제공·백그라운드 갱신 횟수 등)."""
+        now = time.time()
+        with self._lock:
+            return {
+                "age_sec": {t: int(now - at) for t, at in self._loaded_at.items()},
+                "load_count": self.load_count,
+                "stale_served": self.stale_served,
+                "background_refreshes": self.background_refreshes,
+                "background_failures": self.background_failures,
+                "refreshing": self._refreshing,
+                "last_refresh_error": self.last_refresh_error,
+            }
+
+    def invalidate(self, title: str) -> int:
+        """시트 하나(와 그 시트의 열 목록 항목)를 만료 처리. 실제로 캐시돼 있던 항목 수 반환."""
+        with self._lock:
+            keys = [k for k in self._loaded_at if _entry_title(k) == title]
+            for k in keys:
+                self._loaded_at.pop(k, None)
+        return len(keys)
+
 
+def _columns_to_records(names: list, column_ranges: list) -> list[dict]:
+    """열 범위별 batchGet 결과(각 행이 [값] 또는 [])를 레코드 리스트로. 규칙은 _values_to_records 와 같음."""
+    if not names:
+        return []
+    columns = [[(row[0] if row else "") for row in vr.get("values", [])] for vr in column_ranges]
+    n = max((len(c) for c in columns), default=0)
+    rows = [[c[j] if j < len(c) else "" for c in columns] for j in range(n)]
+    return _values_to_records([list(names)] + rows)
 
-@st.cache_data(ttl=300)
-def get_students_data():
-    """학생 시트 데이터 캐시 (5분). API 읽기 한도 절약. 일시 오류 시 재시도."""
-    sheet = get_sheet()
 
-    def _fetch():
-        return pd.DataFrame(sheet.worksheet("students").get_all_records())
+@st.cache_resource(show_spinner=False)
+def _snapshot() -> _SheetSnapshot:
+    """프로세스 공용 스냅샷 (5분 뒤 백그라운드 갱신, 30분 넘은 값은 기다려서 다시 읽음)."""
+    return _SheetSnapshot(get_connection(), _spreadsheet_name, SHEET_CACHE_TTL, SHEET_CACHE_HARD_TTL)
 
-    return _retry_sheet_call(_fetch)
 
+@_reads("students")
+def get_students_data(columns=None):
+    """학생 시트 데이터 (스냅샷, 5분). 다른 주요 시트와 한 번에 읽음. 일시 오류 시 재시도.
+    columns 를 주면 그 열만 (예: ROSTER_COLUMNS). 헤더로 열 위치를 찾아 열 범위만 받고 전체 명단과 따로 캐시.
+    시트에 없는 열은 결과에서 빠짐."""
+    df = _snapshot().frame(("students", tuple(columns)) if columns else "students")
+    if df is None:
+        raise gspread.exceptions.WorksheetNotFound("students")
+    return df
 
-@st.cache_data(ttl=300)
+
+@_reads("attendance")
 def get_attendance_data():
-    """출석 시트 데이터 캐시 (5분). API 읽기 한도 절약. 일시 오류 시 재시도."""
-    def _fetch():
-        return pd.DataFrame(get_attendance_ws().get_all_records())
-    return _retry_sheet_call(_fetch)
+    """출석 시트 데이터 (스냅샷, 5분). 다른 주요 시트와 한 번에 읽음. 일시 오류 시 재시도."""
+    df = _snapshot().frame("attendance")
+    if df is None:
+        raise gspread.exceptions.WorksheetNotFound("attendance")
+    return df
 
 
-@st.cache_data(ttl=300)
+@_reads("new_believers")
 def get_new_believers_data():
-    """새신자 시트 데이터 캐시 (5분). 일시 오류 시 재시도."""
-    def _fetch():
-        return get_new_believers_ws().get_all_records()
-    return _retry_sheet_call(_fetch)
+    """새신자 시트 데이터 (스냅샷, 5분). 시트가 없으면 생성 후 빈 리스트."""
+    recs = _snapshot().records("new_believers")
+    if recs is None:
+        get_new_believers_ws()
+        return []
+    return recs
 
 
 def is_duplicate_new_believer(reg_date, name):
@@ -153,66 +1150,71 @@ def is_duplicate_new_believer(reg_date, name):
     return False
 
 
-@st.cache_data(ttl=300)
+@_reads("class")
 def get_class_data():
-    """반 정보(class) 시트 데이터 캐시 (5분). 담당선생님, 부교사 등. 시트 없으면 빈 DataFrame. 일시 오류 시 재시도."""
-    try:
-        sheet = get_sheet()
+    """반 정보(class) 시트 데이터 (스냅샷, 5분). 담당선생님, 부교사 등. 시트 없으면 빈 DataFrame."""
+    df = _snapshot().frame("class")
+    return df if df is not None else pd.DataFrame()
+
 
-        def _fetch():
-            ws = sheet.worksheet("class")
-            return pd.DataFrame(ws.get_all_records())
+def get_attendance_index() -> AttendanceIndex:
+    """출석 색인 (스냅샷과 같은 데이터, 데이터 버전마다 한 번 생성)."""
+    return _snapshot().attendance_index()
 
-        return _retry_sheet_call(_fetch)
-    except gspread.exceptions.WorksheetNotFound:
-        return pd.DataFrame()
 
+def get_snapshot_stats() -> dict:
+    """주요 시트 스냅샷 갱신 통계."""
+    return _snapshot().stats()
 
-def invalidate_sheets_cache():
-    """시트에 쓰기 후 캐시 무효화. 저장/수정 직후 호출."""
-    st.cache_data.clear()
+
+def get_attendance_sync_stats() -> dict:
+    """출석 증분 동기화 통계 (동기화 행 수, 전체/증분 갱신 횟수, 받은 행 수 등)."""
+    return _snapshot().attendance.stats()
+
+
+def invalidate_sheets_cache(*worksheets: str, source: str | None = None) -> int:
+    """시트에 쓰기 후 캐시 무효화. 저장/수정 직후 호출.
+    worksheets 를 주면 그 시트를 읽는 캐시만 비우고(다른 시트·다른 사용자의 캐시는 유지), 없으면 선언된 캐시 전부.
+    source 는 쓰기 경로 이름 (통계용). 비운 캐시 수를 반환."""
+    targets = worksheets or tuple(_CACHE_DEPENDENCIES)
+    evicted = 0
+    for ws_name in targets:
+        if ws_name in SNAPSHOT_WORKSHEETS:
+            # 스냅샷 getter 는 공용 스냅샷에서 해당 시트만 버리면 됨
+            evicted += _snapshot().invalidate(ws_name)
+            continue
+        for fn in _CACHE_DEPENDENCIES.get(ws_name, ()):
+            fn.clear()
+            evicted += 1
+    key = source or ("+".join(worksheets) if worksheets else "all")
+    with _eviction_lock:
+        _eviction_stats[key]["writes"] += 1
+        _eviction_stats[key]["evictions"] += evicted
+    return evicted
+
+
+def get_cache_eviction_stats() -> dict:
+    """쓰기 경로별 무효화 횟수·비운 캐시 수. {source: {"writes": n, "evictions": m}}"""
+    with _eviction_lock:
+        return {k: dict(v) for k, v in _eviction_stats.items()}
 
 
 def get_attendance_ws():
-    """출석 시트 반환 (세션 캐시)."""
-    if "attendance_ws" not in st.session_state:
-        st.session_state.attendance_ws = get_sheet().worksheet("attendance")
-    return st.session_state.attendance_ws
+    """출석 시트 반환 (프로세스 공용 캐시)."""
+    return _open_ws("attendance")
 
 
-def delete_attendance_rows_for_date_grade_class(ws, date_str: str, grade: str, class_name: str):
-    """해당 (날짜, 학년, 반)에 해당하는 출석 시트의 모든 행을 삭제. 수정 시 기존 데이터를 제거한 뒤 새로 저장하기 위함.
-    배치 API로 한 번에 삭제해 API 호출 횟수를 줄임."""
-    all_values = ws.get_all_values()
-    if not all_values or len(all_values) < 2:
-        return
-    header = all_values[0]
-    try:
-        col_date = header.index("날짜")
-        col_grade = header.index("학년")
-        col_class = header.index("반")
-    except ValueError:
-        return
-    max_col = max(col_date, col_grade, col_class)
-    row_indices_1based = []
-    for i in range(1, len(all_values)):
-        row = all_values[i]
-        if len(row) <= max_col:
-            row = (row + [""] * (max_col + 1))[: max_col + 1]
-        d = str(row[col_date]).strip() if col_date < len(row) else ""
-        g = str(row[col_grade]).strip() if col_grade < len(row) else ""
-        c = str(row[col_class]).strip() if col_class < len(row) else ""
-        if d == str(date_str).strip() and g == str(grade).strip() and c == str(class_name).strip():
-            row_indices_1based.append(i + 1)
-    if not row_indices_1based:
+def _delete_sheet_rows(ws, row_numbers):
+    """시트 행 번호(1-based) 목록을 배치 API 한 번으로 삭제. 아래 행부터 지워 번호가 밀리지 않게 함."""
+    if not row_numbers:
         return
     sheet_id = ws._properties.get("sheetId")
     if sheet_id is None:
-        for row_idx in sorted(row_indices_1based, reverse=True):
+        for row_idx in sorted(row_numbers, reverse=True):
             ws.delete_rows(row_idx)
         return
     requests = []
-    for row_idx in sorted(row_indices_1based, reverse=True):
+    for row_idx in sorted(row_numbers, reverse=True):
         requests.append({
             "deleteDimension": {
                 "range": {
@@ -227,126 +1229,469 @@ def delete_attendance_rows_for_date_grade_class(ws, date_str: str, grade: str, c
     spreadsheet.batch_update({"requests": requests})
 
 
+def delete_attendance_rows_for_date_grade_class(ws, date_str: str, grade: str, class_name: str):
+    """해당 (날짜, 학년, 반)에 해당하는 출석 시트의 모든 행을 삭제.
+    행 위치는 동기화된 출석 색인에서 찾고, 배치 API로 한 번에 삭제해 API 호출 횟수를 줄임."""
+    snap = _snapshot()
+    with _attendance_save_lock:
+        snap.refresh_attendance()
+        row_numbers = [row_no for _, row_no in snap.attendance_index().rows(date_str, grade, class_name)]
+        if not row_numbers:
+            return
+        _delete_sheet_rows(ws, row_numbers)
+        snap.attendance.mark_stale()
+        invalidate_sheets_cache("attendance", source="attendance_delete")
+
+
+_attendance_save_lock = threading.RLock()
+
+
+def _plain(value):
+    """numpy 스칼라 등은 JSON 으로 보낼 수 있게 파이썬 값으로."""
+    return value.item() if hasattr(value, "item") else value
+
+
+def save_attendance(date_str: str, grade, class_name, statuses) -> dict:
+    """(날짜, 학년, 반) 출석 저장. statuses 는 [(이름, 출석상태), ...] (반 명단 순서).
+    기존 행과 비교해 바뀐 출석상태 셀만 values.batchUpdate 한 번으로 고치고, 행이 없던 학생만 덧붙임.
+    같은 학생의 중복 행이나 반에서 빠진 학생의 행만 삭제 (드묾). 저장 내용은 메모리 스냅샷에 바로 반영.
+    {"updated": n, "appended": n, "deleted": n} 반환."""
+    ws = get_attendance_ws()
+    snap = _snapshot()
+    with _attendance_save_lock:
+        # 행 번호 기준으로 쓰므로 먼저 동기화 (보통 끝부분 확인 + 새 행만 받는 작은 읽기)
+        snap.refresh_attendance()
+        header = snap.attendance.header()
+        index = snap.attendance_index()
+        if not header:
+            header = ["날짜", "학년", "반", "이름", "출석상태", "비고"]
+        if "이름" not in header or "출석상태" not in header:
+            # 알 수 없는 헤더: 예전 방식(해당 행 삭제 후 다시 추가)
+            delete_attendance_rows_for_date_grade_class(ws, date_str, grade, class_name)
+            ws.append_rows([[_plain(v) for v in (date_str, grade, class_name, name, status, "")] for name, status in statuses])
+            invalidate_sheets_cache("attendance", source="attendance_save")
+            return {"updated": 0, "appended": len(statuses), "deleted": None}
+        col_status = header.index("출석상태")
+
+        by_name = {}
+        for pos, row_no in index.rows(date_str, grade, class_name):
+            rec = index.records[pos]
+            by_name.setdefault(_index_key(rec.get("이름", "")), []).append((row_no, rec))
+
+        cell_updates, to_append, to_delete = [], [], []
+        for name, status in statuses:
+            rows = by_name.pop(_index_key(name), [])
+            if not rows:
+                values = {"날짜": date_str, "학년": grade, "반": class_name, "이름": name, "출석상태": status}
+                to_append.append([_plain(values.get(h, "")) for h in header])
+                continue
+            row_no, rec = rows[0]
+            current = _index_key(rec.get("출석상태", ""))
+            if current != status:
+                cell_updates.append((row_no, col_status, status))
+            to_delete.extend(r for r, _ in rows[1:])
+        for rows in by_name.values():
+            to_delete.extend(r for r, _ in rows)
+
+        if cell_updates:
+            get_sheet().values_batch_update({
+                "valueInputOption": "RAW",
+                "data": [
+                    {"range": absolute_range_name("attendance", rowcol_to_a1(r, c + 1)), "values": [[v]]}
+                    for r, c, v in cell_updates
+                ],
+            })
+        appended_start = None
+        if to_append:
+            resp = ws.append_rows(to_append)
+            updated_range = (resp or {}).get("updates", {}).get("updatedRange", "")
+            if "!" in updated_range:
+                appended_start = a1_to_rowcol(updated_range.split("!")[-1].split(":")[0])[0]
+
+        if to_delete:
+            # 삭제는 셀 수정·추가 뒤에 (행 번호가 밀리므로) 하고, 메모리 값은 버림
+            _delete_sheet_rows(ws, to_delete)
+            snap.attendance.mark_stale()
+            invalidate_sheets_cache("attendance", source="attendance_save")
+        elif snap.attendance.write_through(cell_updates, appended_start, to_append):
+            snap.attendance_written()
+        else:
+            # 덧붙인 위치를 확인 못함 → 다음 읽기 때 증분으로 받음
+            invalidate_sheets_cache("attendance", source="attendance_save")
+    return {"updated": len(cell_updates), "appended": len(to_append), "deleted": len(to_delete)}
+
+
 def get_students_ws():
-    """students 시트 반환 (세션 캐시)."""
-    if "students_ws" not in st.session_state:
-        st.session_state.students_ws = get_sheet().worksheet("students")
-    return st.session_state.students_ws
+    """students 시트 반환 (프로세스 공용 캐시)."""
+    return _open_ws("students")
+
+
+# ------------------------
+# 단말별 마지막 탭·학년·반 (user_prefs 시트)
+# ------------------------
+USER_PREFS_HEADERS = ["fingerprint_hash", "last_tab_index", "last_grade", "last_class", "last_seen"]
+# 정리 잠금 셀과 정리 세대 셀 (헤더 오른쪽). 정리로 행 번호가 바뀌면 세대가 올라가고, 다른 프로세스는 행 번호 색인을 다시 읽음
+USER_PREFS_LOCK_CELL = "F1"
+USER_PREFS_GEN_CELL = "G1"
+_USER_PREFS_COLS = a1_to_rowcol(USER_PREFS_GEN_CELL)[1]
+_KEEP = object()
+_NO_PREFS = (None, None, None)
 
 
 def _get_user_prefs_worksheet():
-    """'user_prefs' 시트 반환 (단말별 마지막 탭·학년·반). 없으면 생성."""
-    sheet = get_sheet()
-    try:
-        return sheet.worksheet("user_prefs")
-    except gspread.exceptions.WorksheetNotFound:
-        sheet.add_worksheet(title="user_prefs", rows=2, cols=4)
-        ws = sheet.worksheet("user_prefs")
-        ws.update("A1:D1", [["fingerprint_hash", "last_tab_index", "last_grade", "last_class"]])
+    """'user_prefs' 시트 반환 (단말별 마지막 탭·학년·반·마지막 접속일). 없으면 생성."""
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="user_prefs", rows=2, cols=len(USER_PREFS_HEADERS))
+        ws.update("A1:E1", [USER_PREFS_HEADERS])
         return ws
 
+    return _open_ws("user_prefs", on_missing=_create)
+
+
+def _pref_text(value) -> str | None:
+    return (str(value).strip() if value is not None else "") or None
+
+
+def _prefs_gen(value) -> int:
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return 0
+
+
+def _prefs_lock_state(ws) -> tuple[str, int]:
+    """user_prefs 정리 (잠금 셀 값, 세대) 를 한 번에 읽음."""
+    row = (list((ws.get(f"{USER_PREFS_LOCK_CELL}:{USER_PREFS_GEN_CELL}") or [[]])[0]) + ["", ""])[:2]
+    return str(row[0] or ""), _prefs_gen(row[1])
+
+
+def _pref_line(fp: str, prefs: tuple, seen: str) -> list:
+    tab, grade, cls = prefs
+    return [fp, tab if tab is not None else 0, grade or "", cls or "", seen]
+
+
+class _UserPrefs:
+    """user_prefs 시트의 단말별 (탭, 학년, 반) (프로세스 공용). 시트는 처음 필요할 때 한 번만 읽어
+    fingerprint → 행 번호 색인을 만들고, 이후 찾기는 메모리에서 (새 단말은 append 위치로 색인에 추가).
+    쓰기는 시트에 써 둔 값과 다를 때만 모아 두었다가 PREFS_WRITE_DELAY_SEC 뒤 batchUpdate 한 번(새 단말은 append 한 번)으로 씀.
+    그 사이 같은 단말이 여러 번 바꾸면 마지막 값 하나로 합쳐짐. 마지막 접속일(last_seen)은 단말마다 하루 한 번만 같이 씀."""
+
+    def __init__(self, delay: float, keep_days: int):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._rows = None  # fp -> 시트 행 번호
+        self._gen = 0  # 색인을 만들 때 본 정리 세대
+        self._saved = {}  # fp -> 시트에 써 둔 (탭, 학년, 반)
+        self._seen = {}  # fp -> 시트에 써 둔 마지막 접속일 (YYYY-MM-DD)
+        self._pending = {}  # fp -> 아직 쓰지 않은 (탭, 학년, 반)
+        self._timer = None
+        self._compacting = False
+        self.delay = delay
+        self.keep_days = keep_days
+        self.loads = 0
+        self.writes = 0
+        self.written_rows = 0
+        self.unchanged = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.deferred = 0
+        self.compactions = 0
+        self.compacted_rows = 0
+
+    @staticmethod
+    def _parse(values) -> tuple[dict, dict, dict]:
+        """시트 행들(2행부터) → (fp -> 행 번호, fp -> (탭, 학년, 반), fp -> 마지막 접속일). 같은 fp 는 첫 행만."""
+        rows, saved, seen = {}, {}, {}
+        for i, row in enumerate(values, start=2):
+            row = (list(row) + [""] * 5)[:5]
+            fp = str(row[0]).strip()
+            if not fp or fp in rows:
+                continue
+            try:
+                tab = int(row[1])
+            except (ValueError, TypeError):
+                tab = None
+            rows[fp] = i
+            saved[fp] = (tab, _pref_text(row[2]), _pref_text(row[3]))
+            seen[fp] = str(row[4]).strip()
+        return rows, saved, seen
+
+    def _ensure_loaded(self):
+        if self._rows is not None:
+            return
+        ws = _get_user_prefs_worksheet()
+        # 예전 4열 시트: 마지막 접속일 열과 잠금·세대 셀 자리 추가
+        if ws.col_count < _USER_PREFS_COLS:
+            ws.add_cols(_USER_PREFS_COLS - ws.col_count)
+        values = ws.get_all_values("A1:G", pad_values=True)
+        if not values or values[0][4] != USER_PREFS_HEADERS[4]:
+            ws.update("A1:E1", [USER_PREFS_HEADERS])
+        self._gen = _prefs_gen(values[0][_USER_PREFS_COLS - 1]) if values else 0
+        self._rows, self._saved, self._seen = self._parse(values[1:])
+        self.loads += 1
+        cutoff = (datetime.now() - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+        if any(not d or d < cutoff for d in self._seen.values()):
+            self._compact_in_background()
+
+    def _queue(self, fp: str, prefs: tuple):
+        """쓸 값 등록 (잠금 안에서). 타이머가 없으면 시작."""
+        if fp in self._pending:
+            self.coalesced += 1
+        self._pending[fp] = prefs
+        if self._timer is None:
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _requeue(self, pending: dict):
+        """쓰지 못한 값을 다시 모아 둠 (잠금 안에서). 그사이 새로 들어온 값이 더 최신이므로 그대로 둠."""
+        for fp, v in pending.items():
+            if fp not in self._pending:
+                self._queue(fp, v)
+
+    def get(self, fp: str) -> tuple:
+        with self._lock:
+            self._ensure_loaded()
+            prefs = self._pending.get(fp) or self._saved.get(fp) or _NO_PREFS
+            if fp in self._saved and fp not in self._pending and self._seen.get(fp) != _today():
+                self._queue(fp, prefs)  # 마지막 접속일만 갱신
+            return prefs
+
+    def set(self, fp: str, tab=_KEEP, grade=_KEEP, class_val=_KEEP):
+        with self._lock:
+            self._ensure_loaded()
+            saved = self._saved.get(fp) or _NO_PREFS
+            current = self._pending.get(fp) or saved
+            new = (
+                current[0] if tab is _KEEP else tab,
+                current[1] if grade is _KEEP else _pref_text(grade),
+                current[2] if class_val is _KEEP else _pref_text(class_val),
+            )
+            if new == current:
+                self.unchanged += 1
+                return
+            if new == saved and (fp not in self._saved or self._seen.get(fp) == _today()):
+                # 시트에 써 둔 값(없는 단말은 빈 값)으로 되돌아옴 → 쓸 것 없음
+                self._pending.pop(fp, None)
+                return
+            self._queue(fp, new)
+
+    def flush(self):
+        """모아 둔 변경을 지금 씀 (타이머·정리·종료 시)."""
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            today = _today()
+            try:
+                ws = _get_user_prefs_worksheet()
+                # 다른 프로세스가 정리 중이면 미루고, 정리로 행 번호가 바뀌었으면 색인을 다시 읽은 뒤 씀
+                with api_priority(PRIORITY_BACKGROUND):
+                    lock, gen = _prefs_lock_state(ws)
+                if lock_cell_held(lock, time.time()):
+                    with self._lock:
+                        self.deferred += 1
+                        self._requeue(pending)
+                    return
+                with self._lock:
+                    if gen != self._gen:
+                        self._rows = None
+                    self._ensure_loaded()
+                    rows = dict(self._rows)
+                updates = [(rows[fp], _pref_line(fp, v, today)) for fp, v in pending.items() if fp in rows]
+                new = [fp for fp in pending if fp not in rows]
+                appended = {}
+                with api_priority(PRIORITY_BACKGROUND):
+                    if updates:
+                        ws.spreadsheet.values_batch_update({
+                            "valueInputOption": "RAW",
+                            "data": [
+                                {"range": absolute_range_name("user_prefs", f"A{r}:E{r}"), "values": [values]}
+                                for r, values in updates
+                            ],
+                        })
+                    if new:
+                        resp = ws.append_rows([_pref_line(fp, pending[fp], today) for fp in new])
+                        updated = (resp or {}).get("updates", {}).get("updatedRange", "")
+                        if "!" in updated:
+                            start = a1_to_rowcol(updated.split("!")[-1].split(":")[0])[0]
+                            appended = {fp: start + i for i, fp in enumerate(new)}
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                    self._requeue(pending)
+                return
+            with self._lock:
+                self.writes += 1
+                self.written_rows += len(pending)
+                for fp, v in pending.items():
+                    self._saved[fp] = v
+                    self._seen[fp] = today
+                if new and self._rows is not None:
+                    if len(appended) == len(new):
+                        self._rows.update(appended)
+                    else:
+                        self._rows = None  # 위치를 모르면 다음에 시트를 다시 읽음
+
+    def compact(self) -> dict:
+        """user_prefs 시트를 fingerprint 순으로 다시 쓰고 keep_days 일 넘게 접속하지 않은 단말 행은 버림.
+        접속일이 없는 예전 행은 오늘 날짜를 붙여 남김. 쓰기는 범위 하나(남는 아래 행은 빈 값)로 한 번.
+        행 번호가 바뀌므로 잠금 셀(USER_PREFS_LOCK_CELL)을 잡고, 잡기 전에 세대를 확인한 다른 프로세스의 쓰기가 끝나도록
+        PREFS_LOCK_SETTLE_SEC 기다린 뒤 다시 쓰고 세대(USER_PREFS_GEN_CELL)를 올림. 남이 잡고 있으면 {"skipped": True}."""
+        self.flush()
+        with self._flush_lock:
+            ws = _get_user_prefs_worksheet()
+            now = time.time()
+            mark = f"{secrets.token_hex(4)}:{int(now + PREFS_LOCK_SEC)}"
+            with api_priority(PRIORITY_BACKGROUND):
+                if not claim_lock_cell(ws, USER_PREFS_LOCK_CELL, mark, now):
+                    return {"skipped": True}
+            gen = None
+            try:
+                time.sleep(PREFS_LOCK_SETTLE_SEC)
+                with api_priority(PRIORITY_BACKGROUND):
+                    values = ws.get_all_values("A1:G", pad_values=True)
+                gen = _prefs_gen(values[0][_USER_PREFS_COLS - 1] if values else 0) + 1
+                values = values[1:]
+                rows, saved, seen = self._parse(values)
+                today = _today()
+                cutoff = (datetime.now() - timedelta(days=self.keep_days)).strftime("%Y-%m-%d")
+                with self._lock:
+                    saved.update({fp: v for fp, v in self._saved.items() if fp in saved})
+                keep = sorted(fp for fp in rows if (seen[fp] or today) >= cutoff)
+                body = [_pref_line(fp, saved[fp], seen[fp] or today) for fp in keep]
+                body += [[""] * 5 for _ in range(max(0, len(values) - len(body)))]
+                if body:
+                    with api_priority(PRIORITY_BACKGROUND):
+                        ws.update(f"A2:E{len(body) + 1}", body)
+            finally:
+                # 다시 썼을(썼을 수도 있을) 때만 세대를 올리고, 잠금은 항상 풂
+                with api_priority(PRIORITY_BACKGROUND):
+                    if gen is None:
+                        ws.update_acell(USER_PREFS_LOCK_CELL, "")
+                    else:
+                        ws.update(f"{USER_PREFS_LOCK_CELL}:{USER_PREFS_GEN_CELL}", [["", gen]])
+            with self._lock:
+                self._gen = gen
+                self._rows = {fp: i for i, fp in enumerate(keep, start=2)}
+                self._saved = {fp: saved[fp] for fp in keep}
+                self._seen = {fp: seen[fp] or today for fp in keep}
+                self.compactions += 1
+                self.compacted_rows += len(values) - len(keep)
+            return {"kept": len(keep), "removed": len(values) - len(keep)}
+
+    def _compact_in_background(self):
+        """오래된 행이 있으면 백그라운드 스레드에서 정리 (이미 진행 중이면 생략). 부르는 쪽이 self._lock 을 잡고 있을 수 있어 따로 잠금."""
+        with self._compact_lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+            finally:
+                with self._compact_lock:
+                    self._compacting = False
+
+        threading.Thread(target=run, name="user-prefs-compact", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "devices": len(self._rows) if self._rows is not None else None,
+                "pending": len(self._pending),
+                "loads": self.loads,
+                "writes": self.writes,
+                "written_rows": self.written_rows,
+                "unchanged": self.unchanged,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "deferred": self.deferred,
+                "compactions": self.compactions,
+                "compacted_rows": self.compacted_rows,
+            }
+
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+@st.cache_resource(show_spinner=False)
+def _user_prefs() -> _UserPrefs:
+    """프로세스 공용 단말 설정. 프로세스가 끝날 때 남은 변경을 씀."""
+    prefs = _UserPrefs(PREFS_WRITE_DELAY_SEC, PREFS_KEEP_DAYS)
+    atexit.register(prefs.flush)
+    return prefs
+
+
+def _prefs_fp(fingerprint_hash) -> str | None:
+    return str(fingerprint_hash).strip() if fingerprint_hash is not None and str(fingerprint_hash).strip() else None
+
 
 def get_last_tab_index(fingerprint_hash: str | None) -> int | None:
     """단말 fingerprint에 해당하는 마지막 탭 인덱스. 없거나 유효하지 않으면 None."""
-    if not fingerprint_hash or not str(fingerprint_hash).strip():
+    fp = _prefs_fp(fingerprint_hash)
+    if fp is None:
         return None
     try:
-        ws = _get_user_prefs_worksheet()
-        rows = _ensure_rows_list(ws.get_all_values())
-        if not rows or len(rows) < 2:
-            return None
-        fp = str(fingerprint_hash).strip()
-        for row in rows[1:]:
-            if len(row) >= 2 and str(row[0]).strip() == fp:
-                try:
-                    return int(row[1])
-                except (ValueError, TypeError):
-                    return None
-        return None
+        return _user_prefs().get(fp)[0]
     except Exception:
         return None
 
 
 def get_last_grade_class(fingerprint_hash: str | None) -> tuple[str | None, str | None]:
     """단말 fingerprint에 해당하는 마지막 학년·반. (last_grade, last_class). 없으면 (None, None)."""
-    if not fingerprint_hash or not str(fingerprint_hash).strip():
+    fp = _prefs_fp(fingerprint_hash)
+    if fp is None:
         return None, None
     try:
-        ws = _get_user_prefs_worksheet()
-        # A2:D 범위 + pad 로 C,D열이 항상 포함되도록 (used range만 쓰면 2열만 반환될 수 있음)
-        try:
-            raw = ws.get_all_values("A2:D500", pad_values=True)
-            rows = _ensure_rows_list(raw)
-        except (TypeError, Exception):
-            # 구버전 gspread: 범위 없이 읽은 뒤 4열로 패딩
-            raw = ws.get_all_values()
-            rows = _ensure_rows_list(raw)
-            rows = [((list(r) if isinstance(r, (list, tuple)) else [r]) + ["", "", "", ""])[:4] for r in (rows[1:] if len(rows) > 1 else [])]
-        if not rows or len(rows) < 1:
-            return None, None
-        fp = str(fingerprint_hash).strip()
-        for row in rows:
-            row = list(row) if isinstance(row, (list, tuple)) else [row]
-            row = (row + ["", "", "", ""])[:4]
-            if len(row) >= 1 and str(row[0]).strip() == fp:
-                grade = (str(row[2]).strip() if len(row) > 2 and row[2] not in (None, "") else None) or None
-                cls = (str(row[3]).strip() if len(row) > 3 and row[3] not in (None, "") else None) or None
-                return grade, cls
-        return None, None
+        _, grade, cls = _user_prefs().get(fp)
+        return grade, cls
     except Exception:
         return None, None
 
 
 def set_last_grade_class(fingerprint_hash: str | None, grade: str | None, class_val: str | None):
-    """단말 fingerprint에 대해 마지막 학년·반 저장. A~D열을 한 번에 써서 C,D가 반드시 반영되도록 함."""
-    if fingerprint_hash is None or not str(fingerprint_hash).strip():
+    """단말 fingerprint에 대해 마지막 학년·반 저장. 바뀐 경우에만 잠시 모았다가 씀."""
+    fp = _prefs_fp(fingerprint_hash)
+    if fp is None:
         return
     try:
-        ws = _get_user_prefs_worksheet()
-        try:
-            raw = ws.get_all_values("A2:D500", pad_values=True)
-            rows = _ensure_rows_list(raw)
-        except (TypeError, Exception):
-            raw = ws.get_all_values()
-            rows = _ensure_rows_list(raw)
-            rows = [((list(r) if isinstance(r, (list, tuple)) else [r]) + ["", "", "", ""])[:4] for r in (rows[1:] if len(rows) > 1 else [])]
-        fp = str(fingerprint_hash).strip()
-        g = (str(grade).strip() if grade is not None else "") or ""
-        c = (str(class_val).strip() if class_val is not None else "") or ""
-        if rows:
-            for i, row in enumerate(rows):
-                row = list(row) if isinstance(row, (list, tuple)) else [row]
-                row = (row + ["", "", "", ""])[:4]
-                if len(row) >= 1 and str(row[0]).strip() == fp:
-                    tab_idx = row[1] if len(row) > 1 and row[1] not in (None, "") else 0
-                    try:
-                        tab_idx = int(tab_idx)
-                    except (ValueError, TypeError):
-                        tab_idx = 0
-                    ws.update(f"A{i+2}:D{i+2}", [[fp, tab_idx, g, c]])
-                    return
-        ws.append_row([fp, 0, g, c])
+        _user_prefs().set(fp, grade=grade, class_val=class_val)
     except Exception:
         pass
 
 
 def set_last_tab_index(fingerprint_hash: str | None, index: int):
-    """단말 fingerprint에 대해 마지막 탭 인덱스 저장."""
-    if fingerprint_hash is None or not str(fingerprint_hash).strip():
+    """단말 fingerprint에 대해 마지막 탭 인덱스 저장. 바뀐 경우에만 잠시 모았다가 씀."""
+    fp = _prefs_fp(fingerprint_hash)
+    if fp is None:
         return
     try:
-        ws = _get_user_prefs_worksheet()
-        rows = _ensure_rows_list(ws.get_all_values())
-        fp = str(fingerprint_hash).strip()
-        for i in range(1, len(rows)):
-            if len(rows[i]) >= 1 and str(rows[i][0]).strip() == fp:
-                ws.update_cell(i + 1, 2, index)
-                return
-        ws.append_row([fp, index, "", ""])
+        _user_prefs().set(fp, tab=int(index))
     except Exception:
         pass
 
 
+def compact_user_prefs() -> dict:
+    """user_prefs 시트 정리 (fingerprint 순 정렬, PREFS_KEEP_DAYS 일 넘게 안 쓴 단말 삭제). {"kept", "removed"} 반환."""
+    return _user_prefs().compact()
+
+
+def get_user_prefs_stats() -> dict:
+    """단말 설정 통계 (색인된 단말 수, 대기 중인 변경, 시트 읽기·쓰기 횟수, 바뀌지 않아 건너뛴 수, 합쳐진 수, 정리 중이라 미룬 수, 정리 횟수)."""
+    return _user_prefs().stats()
+
+
 def _ensured_key(ws_name: str, suffix: str) -> str:
     return f"sheets_ensured_{ws_name}_{suffix}"
 
@@ -398,19 +1743,25 @@ def ensure_students_extra_columns(ws):
 
 
 def get_new_believers_ws():
-    """새신자 시트 반환. 없으면 생성 후 헤더 작성."""
-    if "new_believers_ws" not in st.session_state:
-        sheet = get_sheet()
-        try:
-            ws = sheet.worksheet("new_believers")
-            ensure_new_believers_photo_column(ws)
-            st.session_state.new_believers_ws = ws
-        except gspread.exceptions.WorksheetNotFound:
-            sheet.add_worksheet(title="new_believers", rows=100, cols=10)
-            ws = sheet.worksheet("new_believers")
-            ws.append_row(["등록일", "이름", "전화", "생년월일", "주소", "전도한친구이름", "학년", "반", "사진"])
-            st.session_state.new_believers_ws = ws
-    return st.session_state.new_believers_ws
+    """새신자 시트 반환 (프로세스 공용 캐시). 없으면 생성 후 헤더 작성."""
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="new_believers", rows=100, cols=10)
+        ws.append_row(["등록일", "이름", "전화", "생년월일", "주소", "전도한친구이름", "학년", "반", "사진"])
+        return ws
+
+    ws = _open_ws("new_believers", on_missing=_create)
+    ensure_new_believers_photo_column(ws)
+    return ws
+
+
+def get_photos_ws():
+    """사진 저장소('photos') 시트 반환 (프로세스 공용 캐시). 없으면 생성. 해시 | 사진(base64) | 등록일시."""
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="photos", rows=100, cols=3)
+        ws.update("A1:C1", [["해시", "사진", "등록일시"]])
+        return ws
+
+    return _open_ws("photos", on_missing=_create)
 
 
 # ------------------------
@@ -425,19 +1776,15 @@ BUDGET_CLAIM_HEADERS = [
 
 
 def get_budget_request_ws():
-    """예산청구 시트 반환. 없으면 생성 후 헤더 작성. (예산 전용 스프레드시트 사용)"""
-    if "budget_request_ws" not in st.session_state:
-        sheet = get_budget_sheet()
-        try:
-            ws = sheet.worksheet("예산청구")
-            _ensure_budget_request_headers(ws)
-            st.session_state.budget_request_ws = ws
-        except gspread.exceptions.WorksheetNotFound:
-            sheet.add_worksheet(title="예산청구", rows=200, cols=len(BUDGET_CLAIM_HEADERS) + 2)
-            ws = sheet.worksheet("예산청구")
-            ws.append_row(BUDGET_CLAIM_HEADERS)
-            st.session_state.budget_request_ws = ws
-    return st.session_state.budget_request_ws
+    """예산청구 시트 반환 (프로세스 공용 캐시). 없으면 생성 후 헤더 작성. (예산 전용 스프레드시트 사용)"""
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="예산청구", rows=200, cols=len(BUDGET_CLAIM_HEADERS) + 2)
+        ws.append_row(BUDGET_CLAIM_HEADERS)
+        return ws
+
+    ws = _open_ws("예산청구", on_missing=_create, budget=True)
+    _ensure_budget_request_headers(ws)
+    return ws
 
 
 def _ensure_budget_request_headers(ws):
@@ -455,11 +1802,23 @@ def _ensure_budget_request_headers(ws):
     st.session_state[key] = True
 
 
+def get_evidence_blobs_ws():
+    """예산 증빙 조각('evidence_blobs') 시트 반환 (프로세스 공용 캐시). 없으면 생성. 해시 | 순번 | 조각 | 등록일시.
+    청구 행의 증빙 셀에는 조각 위치만 적고, 이 시트는 상세보기에서만 읽음."""
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="evidence_blobs", rows=100, cols=4)
+        ws.update("A1:D1", [["해시", "순번", "조각", "등록일시"]])
+        return ws
+
+    return _open_ws("evidence_blobs", on_missing=_create, budget=True)
+
+
+@_reads("예산청구")
 @st.cache_data(ttl=180)
 def get_budget_requests_data():
     """예산청구 시트 전체 데이터 (캐시 1분)."""
     ws = get_budget_request_ws()
-    rows = ws.get_all_values()
+    rows = _single_flight.do("budget_requests", ws.get_all_values)
     if not rows or len(rows) < 2:
         return pd.DataFrame(columns=BUDGET_CLAIM_HEADERS)
     return pd.DataFrame(rows[1:], columns=rows[0])
@@ -508,14 +1867,12 @@ BUDGET_USER_DEFAULTS_HEADERS = ["fingerprint_hash", "입금계좌", "청구자",
 
 def _get_budget_user_defaults_ws():
     """예산청구 스프레드시트 내 'user_defaults' 시트. 단말별 입금계좌·청구자 저장."""
-    sheet = get_budget_sheet()
-    try:
-        ws = sheet.worksheet("user_defaults")
-    except gspread.exceptions.WorksheetNotFound:
-        sheet.add_worksheet(title="user_defaults", rows=2, cols=len(BUDGET_USER_DEFAULTS_HEADERS))
-        ws = sheet.worksheet("user_defaults")
+    def _create(sheet):
+        ws = sheet.add_worksheet(title="user_defaults", rows=2, cols=len(BUDGET_USER_DEFAULTS_HEADERS))
         ws.append_row(BUDGET_USER_DEFAULTS_HEADERS)
-    return ws
+        return ws
+
+    return _open_ws("user_defaults", on_missing=_create, budget=True)
 
 
 def get_budget_user_defaults(fingerprint_hash: str) -> tuple[str | None, str | None]:
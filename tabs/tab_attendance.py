@@ -7,12 +7,12 @@ import pandas as pd
 import streamlit as st
 
 from sheets import (
-    delete_attendance_rows_for_date_grade_class,
-    get_attendance_data,
-    get_attendance_ws,
+    ROSTER_COLUMNS,
+    get_attendance_index,
     get_class_data,
     get_students_data,
     invalidate_sheets_cache,
+    save_attendance,
 )
 from tabs.utils import class_display_label, get_restored_class_index, get_restored_grade_index, natural_sort_key, save_grade_class_for_restore
 
@@ -32,12 +32,12 @@ def _sunday_options(count: int = 52) -> list[date]:
 
 def render(tab):
     try:
-        students_data = get_students_data()
+        students_data = get_students_data(columns=ROSTER_COLUMNS)  # 학년·반·이름만 (사진·연락처 열은 받지 않음)
     except Exception:
         with tab:
             st.error("구글 시트에서 학생 데이터를 불러오는 중 일시 오류가 났습니다. 잠시 후 다시 시도해 주세요.")
             if st.button("🔄 다시 시도", key="att_retry_students"):
-                get_students_data.clear()
+                invalidate_sheets_cache("students", source="attendance_retry")
                 st.rerun()
         return
     sundays = _sunday_options()
@@ -86,17 +86,7 @@ def render(tab):
 
         date_str = selected_date.strftime("%Y-%m-%d")
         try:
-            attendance_all = get_attendance_data()
-            if not attendance_all.empty and "날짜" in attendance_all.columns:
-                mask = (
-                    (attendance_all["날짜"].astype(str) == date_str)
-                    & (attendance_all["학년"].astype(str) == str(selected_grade))
-                    & (attendance_all["반"].astype(str) == str(selected_class))
-                    & (attendance_all["출석상태"].astype(str) == "출석")
-                )
-                attended_names = set(attendance_all.loc[mask, "이름"].astype(str).tolist())
-            else:
-                attended_names = set()
+            attended_names = get_attendance_index().attended_names(date_str, selected_grade, selected_class)
         except Exception:
             attended_names = set()
 
@@ -118,9 +108,6 @@ def render(tab):
             })
 
         if st.button("저장"):
-            ws = get_attendance_ws()
-            delete_attendance_rows_for_date_grade_class(ws, date_str, selected_grade, selected_class)
-            df_to_save = pd.DataFrame(attendance_data)
-            ws.append_rows(df_to_save.values.tolist())
-            invalidate_sheets_cache()
+            # 바뀐 출석상태 셀만 고치고, 행이 없던 학생만 추가 (저장 내용은 캐시에 바로 반영됨)
+            save_attendance(date_str, selected_grade, selected_class, [(r["이름"], r["출석상태"]) for r in attendance_data])
             st.success("출석이 저장되었습니다!")
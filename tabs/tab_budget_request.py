@@ -2,19 +2,19 @@
 """탭: 예산청구."""
 
 import base64
-import io
 from datetime import date, datetime
 
 import pandas as pd
 import streamlit as st
-from PIL import Image
 from streamlit_cropper import st_cropper
 
 import auth
-from config import PHOTO_B64_MAX
+from evidence_store import discard_evidences, load_evidences, store_evidences
 from tabs.utils import natural_sort_key
-from photo_utils import image_to_base64_for_sheet
+from photo_jobs import open_for_crop, submit_evidence, wait
+from photo_utils import image_data_uri
 from sheets import (
+    ROSTER_COLUMNS,
     get_budget_request_ws,
     get_budget_requests_data,
     get_budget_user_defaults,
@@ -180,7 +180,7 @@ def _print_html(reg_no: str, row, ev_b64_list: list) -> str:
     if ev_b64_list:
         ev_items = []
         for i, b64 in enumerate(ev_b64_list[:6]):
-            ev_items.append(f'<div class="print-ev-item"><span class="print-ev-label">증빙 {i+1}</span><img src="data:image/jpeg;base64,{b64}" alt="증빙{i+1}" class="print-ev-img"/></div>')
+            ev_items.append(f'<div class="print-ev-item"><span class="print-ev-label">증빙 {i+1}</span><img src="{image_data_uri(b64)}" alt="증빙{i+1}" class="print-ev-img"/></div>')
         ev_html = '<div class="print-ev-section"><p class="print-ev-title">증빙</p><div class="print-ev-row">' + "".join(ev_items) + "</div></div>"
     else:
         ev_html = '<div class="print-ev-section"></div>'
@@ -269,7 +269,11 @@ def _render_detail_view(reg_no: str):
         return
     row = match.iloc[0]
     ev_labels = [f"증빙{i}" for i in range(1, MAX_EVIDENCES + 1)]
-    ev_b64_list = [row.get(lbl) for lbl in ev_labels if row.get(lbl)]
+    # 증빙 셀에는 조각 목록만 있음. 이 청구의 조각만 받아 합침 (목록 화면은 조각을 읽지 않음)
+    ev_loaded = load_evidences([row.get(lbl) for lbl in ev_labels])
+    ev_b64_list = [b64 for b64 in ev_loaded if b64]
+    if len(ev_b64_list) < len(ev_loaded):
+        st.warning(f"증빙 {len(ev_loaded) - len(ev_b64_list)}건을 불러오지 못했습니다. (evidence_blobs 시트 확인)")
 
     st.markdown(_print_html(reg_no, row, ev_b64_list), unsafe_allow_html=True)
     st.caption("**Ctrl+P** (Mac: **Cmd+P**)로 현재 화면을 인쇄하세요.")
@@ -315,8 +319,7 @@ def _do_approve(reg_no_sel: str, approve_pw: str) -> tuple[bool, str]:
                 row_num = i + 1
                 ws.update_cell(row_num, col_status, "승인")
                 ws.update_cell(row_num, col_date, datetime.now().strftime("%Y-%m-%d %H:%M"))
-                invalidate_sheets_cache()
-                get_budget_requests_data.clear()
+                invalidate_sheets_cache("예산청구", source="budget_approve")
                 return True, f"등록번호 {reg_no_sel} 건이 승인되었습니다."
         return False, "해당 등록번호를 찾을 수 없습니다."
     except Exception as e:
@@ -327,7 +330,7 @@ def render(tab):
     with tab:
         st.title("💰 예산청구")
 
-        # ----- 설정 한 번에 읽기 (API 호출 1회로 일관된 판단) -----
+        # ----- 설정 한 번에 읽기 (프로세스 캐시, 만료 시 API 호출 1회로 일관된 판단) -----
         config = auth.get_budget_config()
         need_setup = not config["year_ok"] or config["approval_password"] is None
         budget_view = st.session_state.get("budget_view")
@@ -557,7 +560,7 @@ def render(tab):
         group_name_value = ""
         if group_type == "학년/반":
             try:
-                students_data = get_students_data()
+                students_data = get_students_data(columns=ROSTER_COLUMNS)
                 grade_list = sorted(students_data["학년"].dropna().unique().tolist(), key=natural_sort_key)
                 grade_options = [str(g) for g in grade_list]
                 if not grade_options:
@@ -621,22 +624,21 @@ def render(tab):
 
                 if ev_bytes:
                     try:
-                        img = Image.open(io.BytesIO(ev_bytes))
-                        if img.mode in ("RGBA", "P"):
-                            img = img.convert("RGB")
+                        img = open_for_crop(ev_bytes)
                         st.caption("기본 크기의 사각형이 표시됩니다. 드래그로 위치와 크기를 자유롭게 조절한 뒤, 원하는 영역을 잘라내세요.")
-                        cropped = st_cropper(
+                        ev_box = st_cropper(
                             img,
                             aspect_ratio=None,
                             realtime_update=True,
                             box_color="#0066cc",
+                            return_type="box",
                         )
-                        if cropped is not None and st.button("이 증빙 목록에 추가", key="budget_ev_add_btn"):
-                            out = io.BytesIO()
-                            cropped.save(out, format="JPEG", quality=85, optimize=True)
-                            b64_new = base64.b64encode(out.getvalue()).decode("ascii")
-                            if len(b64_new) > PHOTO_B64_MAX:
-                                b64_new = image_to_base64_for_sheet(out.getvalue(), "image/jpeg")
+                        # 영역이 정해질 때마다 사진 작업 풀에서 미리 인코딩 (같은 영역이면 재사용)
+                        ev_job = submit_evidence(ev_bytes, ev_box) if ev_box else None
+                        if ev_job and st.button("이 증빙 목록에 추가", key="budget_ev_add_btn"):
+                            b64_new = wait(ev_job)
+                            if not b64_new:
+                                raise ValueError("증빙 인코딩 실패")
                             ev_list.append(b64_new)
                             for k in ("budget_ev_file", "budget_ev_camera", "budget_ev_source"):
                                 if k in st.session_state:
@@ -675,14 +677,21 @@ def render(tab):
                         "대기",
                         "",
                     ]
+                    ev_refs = store_evidences(ev_list[:MAX_EVIDENCES])
                     ev_cols = [""] * MAX_EVIDENCES
-                    for i, b64 in enumerate(ev_list):
-                        if i < MAX_EVIDENCES:
-                            ev_cols[i] = b64
+                    for i, ref in enumerate(ev_refs):
+                        ev_cols[i] = ref
                     row.extend(ev_cols)
-                    ws.append_row(row)
-                    invalidate_sheets_cache()
-                    get_budget_requests_data.clear()
+                    try:
+                        ws.append_row(row)
+                    except Exception:
+                        # 청구 행이 없으면 먼저 저장한 증빙 조각은 쓸 곳이 없음
+                        try:
+                            discard_evidences(ev_refs)
+                        except Exception:
+                            pass
+                        raise
+                    invalidate_sheets_cache("예산청구", source="budget_submit")
                     st.session_state.budget_last_account = account_stripped
                     st.session_state.budget_last_claimer = claimer_stripped
                     fp = auth.get_fingerprint_hash()
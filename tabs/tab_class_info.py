@@ -2,24 +2,31 @@
 """탭 6: 반정보 (학년/반별 학생 현황·수정·추가)."""
 
 import base64
-import io
-import time
 
 import pandas as pd
 import streamlit as st
-from PIL import Image
 from streamlit_cropper import st_cropper
 
 from config import PHOTO_HEIGHT, PHOTO_WIDTH
-from photo_utils import image_to_base64_for_sheet, resize_photo_to_final
+from photo_store import count_inline_photos, load_contact_sheet, load_photos, migrate_inline_photos, store_photo
+from photo_jobs import PREVIEW_WAIT_SEC, open_for_crop, submit_crop, wait
+from photo_utils import image_to_base64_for_sheet
 from sheets import (
     ensure_students_extra_columns,
     ensure_students_photo_column,
     get_class_data,
     get_students_data,
     get_students_ws,
+    invalidate_sheets_cache,
+)
+from tabs.utils import (
+    class_display_label,
+    get_restored_class_index,
+    get_restored_grade_index,
+    natural_sort_key,
+    render_contact_sheet,
+    save_grade_class_for_restore,
 )
-from tabs.utils import class_display_label, get_restored_class_index, get_restored_grade_index, natural_sort_key, save_grade_class_for_restore
 
 
 def _clear_class_edit_state():
@@ -30,19 +37,15 @@ def _clear_class_edit_state():
 
 
 def render(tab):
-    for attempt in range(2):
-        try:
-            students_data = get_students_data()
-            break
-        except Exception:
-            if attempt == 1:
-                with tab:
-                    st.warning("학생 데이터를 불러올 수 없습니다. 잠시 후 다시 시도해 보세요.")
-                    if st.button("다시 로드", key="class_reload_data"):
-                        get_students_data.clear()
-                        st.rerun()
-                st.stop()
-            time.sleep(0.3)
+    try:
+        students_data = get_students_data()  # 429·5xx 재시도는 sheets 의 API 조절기가 처리
+    except Exception:
+        with tab:
+            st.warning("학생 데이터를 불러올 수 없습니다. 잠시 후 다시 시도해 보세요.")
+            if st.button("다시 로드", key="class_reload_data"):
+                invalidate_sheets_cache("students", source="class_info_reload")
+                st.rerun()
+        st.stop()
 
     students_ws = get_students_ws()
     ensure_students_photo_column(students_ws)
@@ -54,7 +57,7 @@ def render(tab):
         with tab:
             st.warning("학생 데이터를 불러올 수 없습니다.")
             if st.button("다시 로드", key="class_reload_data2"):
-                get_students_data.clear()
+                invalidate_sheets_cache("students", source="class_info_reload")
                 st.rerun()
         st.stop()
 
@@ -130,19 +133,21 @@ def render(tab):
                 if add_photo_cam_c:
                     add_photo_bytes_c = add_photo_cam_c.getvalue()
                     add_photo_mime_c = add_photo_cam_c.type or "image/jpeg"
-            add_photo_cropped_c = None
+            add_photo_job_c = None
             if add_photo_bytes_c:
                 try:
-                    img_add = Image.open(io.BytesIO(add_photo_bytes_c))
-                    if img_add.mode in ("RGBA", "P"):
-                        img_add = img_add.convert("RGB")
+                    img_add = open_for_crop(add_photo_bytes_c)
                     st.caption("영역을 드래그해 잘라낼 위치와 크기를 선택하세요 (비율 3:4 고정)")
-                    cropped_add = st_cropper(img_add, aspect_ratio=(3, 4), realtime_update=True, box_color="#0066cc")
-                    if cropped_add is not None:
-                        add_photo_cropped_c = resize_photo_to_final(cropped_add)
-                        if add_photo_cropped_c:
+                    cropped_add = st_cropper(img_add, aspect_ratio=(3, 4), realtime_update=True, box_color="#0066cc", return_type="box")
+                    if cropped_add:
+                        # 자르기·리사이즈는 사진 작업 풀에서 (같은 영역이면 이전 결과 재사용)
+                        add_photo_job_c = submit_crop(add_photo_bytes_c, cropped_add)
+                        preview = wait(add_photo_job_c, PREVIEW_WAIT_SEC)
+                        if preview:
                             st.caption(f"저장될 사진 ({PHOTO_WIDTH}×{PHOTO_HEIGHT}px)")
-                            st.image(add_photo_cropped_c, width=PHOTO_WIDTH)
+                            st.image(preview, width=PHOTO_WIDTH)
+                        else:
+                            st.caption("사진 처리 중…")
                 except Exception:
                     st.caption("사진을 불러올 수 없습니다.")
             if st.button("추가", key="class_add_btn"):
@@ -151,10 +156,12 @@ def render(tab):
                 else:
                     try:
                         photo_b64_c = ""
+                        add_photo_cropped_c = wait(add_photo_job_c) if add_photo_job_c else None
                         if add_photo_cropped_c:
                             photo_b64_c = base64.b64encode(add_photo_cropped_c).decode("ascii")
                         elif add_photo_bytes_c:
                             photo_b64_c = image_to_base64_for_sheet(add_photo_bytes_c, add_photo_mime_c)
+                        photo_b64_c = store_photo(photo_b64_c)  # 명단에는 사진 저장소 참조만
                         row_map = {
                             "학년": selected_grade_class, "반": selected_class_only, "이름": add_name_c.strip(),
                             "생년월일": add_birth_c.strip() if add_birth_c else "", "성별": add_gender_c or "",
@@ -172,12 +179,21 @@ def render(tab):
                             row_map["사진URL"] = photo_b64_c
                         student_row = [str(row_map.get(h, "")) for h in class_headers]
                         students_ws.append_row(student_row)
-                        get_students_data.clear()
+                        invalidate_sheets_cache("students", source="class_info_add")
                         st.success("학생이 추가되었습니다.")
                         st.rerun()
                     except Exception as e:
                         st.error(f"추가 실패: {e}")
 
+        # 사진 모아보기에서 이름을 눌러 class_edit_row=행 이 들어온 경우 해당 학생 수정 화면으로
+        link_row_c = st.query_params.get("class_edit_row")
+        if link_row_c:
+            del st.query_params["class_edit_row"]
+            match_c = df_all[df_all["_sheet_row"].astype(str) == str(link_row_c)]
+            if not match_c.empty:
+                st.session_state["class_edit_sheet_row"] = int(link_row_c)
+                st.session_state["class_edit_data"] = match_c.iloc[0].drop(labels=["_sheet_row"], errors="ignore").to_dict()
+
         if st.session_state.get("class_edit_sheet_row") is not None:
             edit_row_c = st.session_state["class_edit_sheet_row"]
             edit_data_c = st.session_state.get("class_edit_data") or {}
@@ -217,19 +233,21 @@ def render(tab):
                 if e_photo_cam_c:
                     e_photo_bytes_c = e_photo_cam_c.getvalue()
                     e_photo_mime_c = e_photo_cam_c.type or "image/jpeg"
-            e_photo_cropped_c = None
+            e_photo_job_c = None
             if e_photo_bytes_c:
                 try:
-                    img_edit = Image.open(io.BytesIO(e_photo_bytes_c))
-                    if img_edit.mode in ("RGBA", "P"):
-                        img_edit = img_edit.convert("RGB")
+                    img_edit = open_for_crop(e_photo_bytes_c)
                     st.caption("영역을 드래그해 잘라낼 위치와 크기를 선택하세요 (비율 3:4 고정)")
-                    cropped_edit = st_cropper(img_edit, aspect_ratio=(3, 4), realtime_update=True, box_color="#0066cc")
-                    if cropped_edit is not None:
-                        e_photo_cropped_c = resize_photo_to_final(cropped_edit)
-                        if e_photo_cropped_c:
+                    cropped_edit = st_cropper(img_edit, aspect_ratio=(3, 4), realtime_update=True, box_color="#0066cc", return_type="box")
+                    if cropped_edit:
+                        # 자르기·리사이즈는 사진 작업 풀에서 (같은 영역이면 이전 결과 재사용)
+                        e_photo_job_c = submit_crop(e_photo_bytes_c, cropped_edit)
+                        preview = wait(e_photo_job_c, PREVIEW_WAIT_SEC)
+                        if preview:
                             st.caption(f"저장될 사진 ({PHOTO_WIDTH}×{PHOTO_HEIGHT}px)")
-                            st.image(e_photo_cropped_c, width=PHOTO_WIDTH)
+                            st.image(preview, width=PHOTO_WIDTH)
+                        else:
+                            st.caption("사진 처리 중…")
                 except Exception:
                     st.caption("사진을 불러올 수 없습니다.")
             col_save_c, col_cancel_c = st.columns(2)
@@ -240,10 +258,12 @@ def render(tab):
                     else:
                         try:
                             photo_b64_edit = edit_data_c.get("사진") or edit_data_c.get("사진URL") or ""
+                            e_photo_cropped_c = wait(e_photo_job_c) if e_photo_job_c else None
                             if e_photo_cropped_c:
                                 photo_b64_edit = base64.b64encode(e_photo_cropped_c).decode("ascii")
                             elif e_photo_bytes_c:
                                 photo_b64_edit = image_to_base64_for_sheet(e_photo_bytes_c, e_photo_mime_c)
+                            photo_b64_edit = store_photo(photo_b64_edit)
                             row_map_edit = {h: str(edit_data_c.get(h, "")) for h in class_headers}
                             row_map_edit["학년"] = str(e_grade_c)
                             row_map_edit["반"] = str(e_class_c)
@@ -271,7 +291,7 @@ def render(tab):
                             range_str = f"A{edit_row_c}:{col_letter}{edit_row_c}"
                             students_ws.update(range_str, [row_vals_c])
                             _clear_class_edit_state()
-                            get_students_data.clear()
+                            invalidate_sheets_cache("students", source="class_info_edit")
                             st.success("수정되었습니다.")
                             st.rerun()
                         except Exception as e:
@@ -283,8 +303,23 @@ def render(tab):
             st.divider()
 
         st.caption(f"{selected_grade_class}학년 {selected_class_only}반 · {len(df_class)}명")
+        contact_sheet_c = st.toggle("사진 모아보기", key="class_info_contact_sheet", help="반 학생 사진을 한 장으로 모아 빠르게 보여줍니다.")
         if df_class.empty:
             st.info("이 반에 등록된 학생이 없습니다. 위에서 학생을 추가해 보세요.")
+        elif contact_sheet_c:
+            photo_values_c = df_class[photo_col_class].tolist() if photo_col_class else []
+            try:
+                sheet_c = load_contact_sheet(f"class:{selected_grade_class}:{selected_class_only}", photo_values_c)
+            except Exception:
+                sheet_c = load_contact_sheet(f"class:{selected_grade_class}:{selected_class_only}", [])
+            render_contact_sheet(sheet_c, [
+                (
+                    row_c.get("이름", ""),
+                    row_c.get(phone_col) if phone_col else "",
+                    int(row_c.get("_sheet_row", 0)),
+                )
+                for _, row_c in df_class.iterrows()
+            ], "class_edit_row")
         else:
             st.markdown("""
             <style>
@@ -292,16 +327,18 @@ def render(tab):
             [data-testid="column"] { padding-top: 2px !important; padding-bottom: 2px !important; }
             </style>
             """, unsafe_allow_html=True)
+            # 이 반 학생 사진만 사진 저장소에서 한 번에 받음
+            try:
+                photos_c = load_photos(df_class[photo_col_class].tolist()) if photo_col_class else {}
+            except Exception:
+                photos_c = {}
             for i, (_, row_c) in enumerate(df_class.iterrows()):
                 col_photo_c, col_info_c, col_btn_c = st.columns([1, 4, 1])
                 with col_photo_c:
                     val_c = (row_c.get(photo_col_class) or "") if photo_col_class else ""
-                    if isinstance(val_c, str) and len(val_c) > 100 and not val_c.startswith("http"):
-                        try:
-                            raw_c = base64.b64decode(val_c)
-                            st.image(io.BytesIO(raw_c), width=PHOTO_WIDTH)
-                        except Exception:
-                            st.caption("—")
+                    thumb_c = photos_c.get(val_c) if isinstance(val_c, str) else None
+                    if thumb_c:
+                        st.image(thumb_c.data, width=PHOTO_WIDTH)
                     else:
                         st.caption("—")
                 with col_info_c:
@@ -337,3 +374,16 @@ def render(tab):
                         st.rerun()
                 if i < len(df_class) - 1:
                     st.divider()
+
+        # 예전 방식(명단 셀에 사진 base64)으로 저장된 사진이 남아 있으면 사진 저장소로 옮기는 버튼
+        inline_count = count_inline_photos(class_all_records)
+        if inline_count:
+            with st.expander(f"🗂️ 사진 저장소로 옮기기 (명단에 사진 원본이 남은 학생 {inline_count}명)", expanded=False):
+                st.caption("학생·새신자 명단 셀의 사진을 'photos' 시트로 옮기고 명단에는 짧은 참조만 남깁니다. 명단 읽기가 빨라집니다.")
+                if st.button("사진 옮기기", key="class_migrate_photos"):
+                    try:
+                        moved = migrate_inline_photos()
+                        st.success(f"옮겼습니다. (학생 {moved.get('students', 0)}칸, 새신자 {moved.get('new_believers', 0)}칸)")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"옮기기 실패: {e}")
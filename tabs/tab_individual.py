@@ -8,7 +8,7 @@ from datetime import date
 import pandas as pd
 import streamlit as st
 
-from sheets import get_attendance_data, get_class_data, get_students_data
+from sheets import ROSTER_COLUMNS, get_attendance_index, get_class_data, get_students_data
 from tabs.utils import class_display_label, get_restored_class_index, get_restored_grade_index, natural_sort_key, save_grade_class_for_restore
 
 
@@ -24,8 +24,11 @@ def _tel_href_from_phone(phone: str) -> str:
     return digits
 
 
+PHONE_COLUMNS = ("전화번호", "휴대전화", "연락처")
+
+
 def render(tab):
-    students_data = get_students_data()
+    students_data = get_students_data(columns=ROSTER_COLUMNS + PHONE_COLUMNS)
     try:
         class_data = get_class_data()
     except Exception:
@@ -62,7 +65,7 @@ def render(tab):
         student_names = class_students_t3["이름"].tolist()
 
         phone_col = None
-        for c in ["전화번호", "휴대전화", "연락처"]:
+        for c in PHONE_COLUMNS:
             if c in class_students_t3.columns:
                 phone_col = c
                 break
@@ -75,33 +78,19 @@ def render(tab):
             st.info("해당 반에 등록된 학생이 없습니다.")
         else:
             try:
-                att_all = get_attendance_data()
+                att_index = get_attendance_index()
             except Exception:
-                att_all = pd.DataFrame()
+                att_index = None
 
             this_year = date.today().year
-            att_all["날짜"] = pd.to_datetime(att_all["날짜"], errors="coerce")
-            att_all = att_all.dropna(subset=["날짜"])
-            att_all = att_all[
-                (att_all["날짜"].dt.year == this_year)
-                & (att_all["학년"].astype(str) == str(selected_grade_t3))
-                & (att_all["반"].astype(str) == str(selected_class_t3))
-            ]
-            if not att_all.empty:
-                att_all["주일_기준"] = att_all["날짜"].dt.to_period("W-SUN")
-
             sundays = pd.date_range(start=f"{this_year}-01-01", end=f"{this_year}-12-31", freq="W-SUN")
             all_weeks = [pd.Period(d, freq="W-SUN") for d in sundays]
 
+            # 학생별 올해 출석한 주 (색인 조회, 표 전체를 거르지 않음)
             attended_by_week = {}
-            for _, row in att_all.iterrows():
-                if row["출석상태"] != "출석":
-                    continue
-                name = str(row["이름"])
-                w = row["주일_기준"]
-                if name not in attended_by_week:
-                    attended_by_week[name] = set()
-                attended_by_week[name].add(w)
+            if att_index is not None:
+                for name in student_names:
+                    attended_by_week[str(name)] = att_index.attended_weeks(selected_grade_t3, selected_class_t3, name, this_year)
 
             today = date.today()
             past_weeks = [p for p in all_weeks if p.end_time.date() <= today]
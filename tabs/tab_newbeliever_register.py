@@ -2,18 +2,19 @@
 """탭 4: 새신자 등록."""
 
 import base64
-import io
 from datetime import date
 
 import pandas as pd
-from PIL import Image
 import streamlit as st
 from streamlit_cropper import st_cropper
 
 from config import PHOTO_HEIGHT, PHOTO_WIDTH
-from photo_utils import image_to_base64_for_sheet, resize_photo_to_final
+from photo_store import store_photo
+from photo_jobs import PREVIEW_WAIT_SEC, open_for_crop, submit_crop, wait
+from photo_utils import image_to_base64_for_sheet
 from tabs.utils import natural_sort_key
 from sheets import (
+    ROSTER_COLUMNS,
     ensure_students_photo_column,
     get_new_believers_ws,
     get_students_data,
@@ -24,7 +25,7 @@ from sheets import (
 
 
 def render(tab):
-    students_data = get_students_data()
+    students_data = get_students_data(columns=ROSTER_COLUMNS)
     new_grade_list = sorted(students_data["학년"].dropna().unique().tolist(), key=natural_sort_key)
     grade_options = ["(미배정)"] + [str(x) for x in new_grade_list]
     new_class_options_by_grade = {}
@@ -56,19 +57,21 @@ def render(tab):
                 new_photo_bytes = camera_photo.getvalue()
                 new_photo_mime = camera_photo.type or "image/jpeg"
 
-        new_photo_cropped_bytes = None
+        new_photo_job = None
         if new_photo_bytes:
             try:
-                img = Image.open(io.BytesIO(new_photo_bytes))
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
+                img = open_for_crop(new_photo_bytes)
                 st.caption("영역을 드래그해 잘라낼 위치와 크기를 선택하세요 (비율 3:4 고정)")
-                cropped_img = st_cropper(img, aspect_ratio=(3, 4), realtime_update=True, box_color="#0066cc")
-                if cropped_img is not None:
-                    new_photo_cropped_bytes = resize_photo_to_final(cropped_img)
-                    if new_photo_cropped_bytes:
+                crop_box = st_cropper(img, aspect_ratio=(3, 4), realtime_update=True, box_color="#0066cc", return_type="box")
+                if crop_box:
+                    # 자르기·리사이즈는 사진 작업 풀에서 (같은 영역이면 이전 결과 재사용)
+                    new_photo_job = submit_crop(new_photo_bytes, crop_box)
+                    preview = wait(new_photo_job, PREVIEW_WAIT_SEC)
+                    if preview:
                         st.caption(f"저장될 사진 ({PHOTO_WIDTH}×{PHOTO_HEIGHT}px)")
-                        st.image(new_photo_cropped_bytes, width=PHOTO_WIDTH)
+                        st.image(preview, width=PHOTO_WIDTH)
+                    else:
+                        st.caption("사진 처리 중…")
             except Exception:
                 st.caption("사진을 불러올 수 없습니다.")
 
@@ -91,10 +94,12 @@ def render(tab):
             else:
                 try:
                     photo_b64 = ""
+                    new_photo_cropped_bytes = wait(new_photo_job) if new_photo_job else None
                     if new_photo_cropped_bytes:
                         photo_b64 = base64.b64encode(new_photo_cropped_bytes).decode("ascii")
                     elif new_photo_bytes:
                         photo_b64 = image_to_base64_for_sheet(new_photo_bytes, new_photo_mime)
+                    photo_b64 = store_photo(photo_b64)  # 명단에는 사진 저장소 참조만
                     nb_ws = get_new_believers_ws()
                     row = [
                         reg_date.strftime("%Y-%m-%d"), new_name.strip(),
@@ -104,6 +109,7 @@ def render(tab):
                         photo_b64,
                     ]
                     nb_ws.append_row(row)
+                    touched = ["new_believers"]
                     if selected_new_grade is not None and selected_new_class is not None:
                         students_ws = get_students_ws()
                         ensure_students_photo_column(students_ws)
@@ -123,7 +129,8 @@ def render(tab):
                                     break
                             student_row = [str(row_map.get(h, "")) for h in headers]
                             students_ws.append_row(student_row)
-                        invalidate_sheets_cache()
+                            touched.append("students")
+                    invalidate_sheets_cache(*touched, source="new_believer_register")
                     st.success("새신자가 등록되었습니다." + (" 해당 반에 추가되어 출석 관리됩니다." if selected_new_grade and selected_new_class else ""))
                     for key in ("new_reg_date", "new_name", "new_phone", "new_birth", "new_address", "new_friend", "new_grade", "new_class", "new_photo_source", "new_photo_file", "new_photo_camera"):
                         if key in st.session_state:
@@ -1,17 +1,17 @@
 # -*- coding: utf-8 -*-
 """탭 5: 새신자 현황 (조회·추가·수정)."""
 
-import base64
-import io
 from datetime import date
 
 import pandas as pd
 import streamlit as st
 
 from config import PHOTO_WIDTH
-from photo_utils import image_to_base64_for_sheet
-from tabs.utils import natural_sort_key
+from photo_store import load_contact_sheet, load_photos, store_photo
+from photo_jobs import submit_sheet_encode, wait
+from tabs.utils import natural_sort_key, render_contact_sheet
 from sheets import (
+    ROSTER_COLUMNS,
     ensure_students_photo_column,
     get_new_believers_data,
     get_new_believers_ws,
@@ -34,7 +34,7 @@ def _parse_date(v):
 
 
 def render(tab):
-    students_data = get_students_data()
+    students_data = get_students_data(columns=ROSTER_COLUMNS)
     try:
         nb_ws = get_new_believers_ws()
         nb_records = get_new_believers_data()
@@ -60,6 +60,8 @@ def render(tab):
             add_address = st.text_input("주소", key="nb_add_address", placeholder="주소를 입력하세요")
             add_friend = st.text_input("전도한 친구 이름", key="nb_add_friend", placeholder="전도한 분 이름")
             add_photo_file = st.file_uploader("사진 (선택)", type=["png", "jpg", "jpeg", "webp"], key="nb_add_photo")
+            # 올리자마자 사진 작업 풀에서 인코딩 시작 (나머지 칸 입력하는 동안 끝남)
+            add_photo_job = submit_sheet_encode(add_photo_file.getvalue(), add_photo_file.type or "image/jpeg") if add_photo_file else None
             add_sel_grade_idx = st.selectbox("학년", range(len(nb_grade_options)), format_func=lambda i: str(nb_grade_options[i]), key="nb_add_grade")
             add_selected_grade = None if nb_grade_options[add_sel_grade_idx] == "(미배정)" else nb_grade_options[add_sel_grade_idx]
             add_class_list = nb_class_options_by_grade.get(str(add_selected_grade), ["(미배정)"]) if add_selected_grade else ["(미배정)"]
@@ -73,8 +75,8 @@ def render(tab):
                 else:
                     try:
                         photo_b64 = ""
-                        if add_photo_file:
-                            photo_b64 = image_to_base64_for_sheet(add_photo_file.getvalue(), add_photo_file.type or "image/jpeg")
+                        if add_photo_job:
+                            photo_b64 = store_photo(wait(add_photo_job) or "")
                         row = [
                             add_reg_date.strftime("%Y-%m-%d"), add_name.strip(),
                             add_phone.strip() if add_phone else "", add_birth.strip() if add_birth else "",
@@ -83,6 +85,7 @@ def render(tab):
                             photo_b64,
                         ]
                         nb_ws.append_row(row)
+                        touched = ["new_believers"]
                         if add_selected_grade and add_selected_class:
                             students_ws = get_students_ws()
                             ensure_students_photo_column(students_ws)
@@ -101,12 +104,25 @@ def render(tab):
                                         break
                                 student_row = [str(row_map.get(h, "")) for h in headers]
                                 students_ws.append_row(student_row)
-                        invalidate_sheets_cache()
+                                touched.append("students")
+                        invalidate_sheets_cache(*touched, source="new_believer_add")
                         st.success("새신자가 등록되었습니다.")
                         st.rerun()
                     except Exception as e:
                         st.error(f"등록 실패: {e}")
 
+        # 사진 모아보기에서 이름을 눌러 nb_edit_row=행 이 들어온 경우 해당 새신자 수정 화면으로
+        link_row = st.query_params.get("nb_edit_row")
+        if link_row:
+            del st.query_params["nb_edit_row"]
+            try:
+                link_idx = int(link_row) - 2
+            except ValueError:
+                link_idx = -1
+            if 0 <= link_idx < len(nb_records):
+                st.session_state["nb_edit_sheet_row"] = link_idx + 2
+                st.session_state["nb_edit_data"] = dict(nb_records[link_idx])
+
         if st.session_state.get("nb_edit_sheet_row") is not None:
             edit_row = st.session_state["nb_edit_sheet_row"]
             edit_data = st.session_state.get("nb_edit_data") or {}
@@ -118,6 +134,7 @@ def render(tab):
             e_address = st.text_input("주소", value=str(edit_data.get("주소") or ""), key="nb_edit_address")
             e_friend = st.text_input("전도한 친구 이름", value=str(edit_data.get("전도한친구이름") or ""), key="nb_edit_friend")
             e_photo_file = st.file_uploader("사진 변경 (선택, 비우면 기존 유지)", type=["png", "jpg", "jpeg", "webp"], key="nb_edit_photo")
+            e_photo_job = submit_sheet_encode(e_photo_file.getvalue(), e_photo_file.type or "image/jpeg") if e_photo_file else None
             g_val = str(edit_data.get("학년") or "")
             c_val = str(edit_data.get("반") or "")
             try:
@@ -141,8 +158,8 @@ def render(tab):
                     else:
                         try:
                             photo_b64 = (edit_data.get("사진") or edit_data.get("사진URL") or "")
-                            if e_photo_file:
-                                photo_b64 = image_to_base64_for_sheet(e_photo_file.getvalue(), e_photo_file.type or "image/jpeg")
+                            if e_photo_job:
+                                photo_b64 = store_photo(wait(e_photo_job) or "")
                             row_vals = [
                                 e_reg_date.strftime("%Y-%m-%d"), e_name.strip(),
                                 e_phone.strip() if e_phone else "", e_birth.strip() if e_birth else "",
@@ -151,7 +168,7 @@ def render(tab):
                                 photo_b64,
                             ]
                             nb_ws.update(f"A{edit_row}:I{edit_row}", [row_vals])
-                            invalidate_sheets_cache()
+                            invalidate_sheets_cache("new_believers", source="new_believer_edit")
                             for key in ("nb_edit_sheet_row", "nb_edit_data"):
                                 if key in st.session_state:
                                     del st.session_state[key]
@@ -169,7 +186,7 @@ def render(tab):
                 if st.button("🗑️ 삭제", key="nb_edit_delete", type="secondary"):
                     try:
                         nb_ws.delete_rows(edit_row)
-                        invalidate_sheets_cache()
+                        invalidate_sheets_cache("new_believers", source="new_believer_delete")
                         for key in ("nb_edit_sheet_row", "nb_edit_data"):
                             if key in st.session_state:
                                 del st.session_state[key]
@@ -194,6 +211,7 @@ def render(tab):
                 df_nb = df_nb.sort_values("등록일", ascending=True).reset_index(drop=True)
                 photo_col = "사진" if "사진" in df_nb.columns else ("사진URL" if "사진URL" in df_nb.columns else None)
                 st.caption(f"올해({this_year}년) 등록된 새신자 {len(df_nb)}명 (등록일 순)")
+                contact_sheet = st.toggle("사진 모아보기", key="nb_contact_sheet", help="새신자 사진을 한 장으로 모아 빠르게 보여줍니다.")
                 st.markdown("""
                 <style>
                 hr { margin: 2px 0 !important; border: none; border-top: 1px solid rgba(49,51,63,0.2); }
@@ -201,41 +219,58 @@ def render(tab):
                 [data-testid="column"] { padding-top: 2px !important; padding-bottom: 2px !important; }
                 </style>
                 """, unsafe_allow_html=True)
-                for i, (_, row) in enumerate(df_nb.iterrows()):
-                    col_photo, col_info, col_btn = st.columns([1, 4, 1])
-                    with col_photo:
-                        val = (row.get(photo_col) or "") if photo_col else ""
-                        if isinstance(val, str) and len(val) > 100 and not val.startswith("http"):
-                            try:
-                                raw = base64.b64decode(val)
-                                st.image(io.BytesIO(raw), width=PHOTO_WIDTH)
-                            except Exception:
+                if contact_sheet:
+                    photo_values = df_nb[photo_col].tolist() if photo_col else []
+                    try:
+                        sheet = load_contact_sheet(f"new_believers:{this_year}", photo_values)
+                    except Exception:
+                        sheet = load_contact_sheet(f"new_believers:{this_year}", [])
+                    render_contact_sheet(sheet, [
+                        (
+                            row.get("이름", ""),
+                            row["등록일"].strftime("%m-%d") if hasattr(row.get("등록일"), "strftime") else "",
+                            int(row.get("_sheet_row", 0)),
+                        )
+                        for _, row in df_nb.iterrows()
+                    ], "nb_edit_row")
+                else:
+                    # 목록에 보이는 새신자 사진만 사진 저장소에서 한 번에 받음
+                    try:
+                        photos = load_photos(df_nb[photo_col].tolist()) if photo_col else {}
+                    except Exception:
+                        photos = {}
+                    for i, (_, row) in enumerate(df_nb.iterrows()):
+                        col_photo, col_info, col_btn = st.columns([1, 4, 1])
+                        with col_photo:
+                            val = (row.get(photo_col) or "") if photo_col else ""
+                            thumb = photos.get(val) if isinstance(val, str) else None
+                            if thumb:
+                                st.image(thumb.data, width=PHOTO_WIDTH)
+                            else:
                                 st.caption("—")
-                        else:
-                            st.caption("—")
-                    with col_info:
-                        reg_d = row.get("등록일")
-                        reg_d = reg_d.strftime("%Y-%m-%d") if hasattr(reg_d, "strftime") else str(reg_d or "")[:10]
-                        st.markdown(f"**{row.get('이름', '')}** · {reg_d}")
-                        parts = []
-                        if row.get("전화"):
-                            parts.append(f"전화 {row.get('전화')}")
-                        if row.get("생년월일"):
-                            parts.append(f"생년 {row.get('생년월일')}")
-                        if row.get("주소"):
-                            parts.append(f"주소 {row.get('주소')}")
-                        if row.get("전도한친구이름"):
-                            parts.append(f"전도한 친구 {row.get('전도한친구이름')}")
-                        g, c = row.get("학년"), row.get("반")
-                        if g or c:
-                            parts.append(f"{g or ''}학년 {c or ''}반".strip())
-                        if parts:
-                            st.caption(" · ".join(parts))
-                    with col_btn:
-                        sheet_row = int(row.get("_sheet_row", 0))
-                        if st.button("수정", key=f"nb_edit_btn_{sheet_row}"):
-                            st.session_state["nb_edit_sheet_row"] = sheet_row
-                            st.session_state["nb_edit_data"] = row.drop(labels=["_sheet_row"], errors="ignore").to_dict()
-                            st.rerun()
-                    if i < len(df_nb) - 1:
-                        st.divider()
+                        with col_info:
+                            reg_d = row.get("등록일")
+                            reg_d = reg_d.strftime("%Y-%m-%d") if hasattr(reg_d, "strftime") else str(reg_d or "")[:10]
+                            st.markdown(f"**{row.get('이름', '')}** · {reg_d}")
+                            parts = []
+                            if row.get("전화"):
+                                parts.append(f"전화 {row.get('전화')}")
+                            if row.get("생년월일"):
+                                parts.append(f"생년 {row.get('생년월일')}")
+                            if row.get("주소"):
+                                parts.append(f"주소 {row.get('주소')}")
+                            if row.get("전도한친구이름"):
+                                parts.append(f"전도한 친구 {row.get('전도한친구이름')}")
+                            g, c = row.get("학년"), row.get("반")
+                            if g or c:
+                                parts.append(f"{g or ''}학년 {c or ''}반".strip())
+                            if parts:
+                                st.caption(" · ".join(parts))
+                        with col_btn:
+                            sheet_row = int(row.get("_sheet_row", 0))
+                            if st.button("수정", key=f"nb_edit_btn_{sheet_row}"):
+                                st.session_state["nb_edit_sheet_row"] = sheet_row
+                                st.session_state["nb_edit_data"] = row.drop(labels=["_sheet_row"], errors="ignore").to_dict()
+                                st.rerun()
+                        if i < len(df_nb) - 1:
+                            st.divider()
@@ -79,8 +79,38 @@ def get_restored_class_index(classes: list) -> int:
 
 
 def save_grade_class_for_restore(grade: str | None, class_val: str | None):
-    """선택한 학년·반을 저장해 다음 접속 시 복원되도록 함."""
+    """선택한 학년·반을 저장해 다음 접속 시 복원되도록 함. 렌더링마다 불리므로 바뀐 경우에만 저장 요청
+    (시트 쓰기는 sheets 의 단말 설정이 모았다가 한 번에)."""
+    g = (str(grade).strip() if grade is not None else "") or None
+    c = (str(class_val).strip() if class_val is not None else "") or None
+    if st.session_state.get("app_last_grade") == g and st.session_state.get("app_last_class") == c:
+        return
     fp = auth.get_fingerprint_hash()
-    sheets.set_last_grade_class(fp, grade, class_val)
-    st.session_state["app_last_grade"] = (str(grade).strip() if grade is not None else "") or None
-    st.session_state["app_last_class"] = (str(class_val).strip() if class_val is not None else "") or None
+    sheets.set_last_grade_class(fp, g, c)
+    st.session_state["app_last_grade"] = g
+    st.session_state["app_last_class"] = c
+
+
+def _select_card(param: str, value):
+    """모아보기 카드 버튼 콜백: 수정할 행을 query param 으로 넘김 (다시 그릴 때 탭이 읽고 지움). 세션 상태는 그대로."""
+    st.query_params[param] = str(value)
+
+
+def render_contact_sheet(sheet, cards: list, edit_param: str):
+    """사진 모아보기: 줄마다 스프라이트 한 장(st.image 에 bytes 로 넘겨 미디어 URL 로 받음)과 그 아래 같은 칸 수의 이름 버튼.
+
+    sheet는 photo_store.load_contact_sheet 결과(카드와 같은 순서의 사진 셀 값으로 만든 것),
+    cards는 (이름, 보조 설명, 시트 행 번호) 목록. 이름을 누르면 edit_param 에 행 번호를 넣어 수정 화면으로.
+    """
+    for line, start in enumerate(range(0, len(cards), sheet.columns)):
+        if line < len(sheet.rows):
+            st.image(sheet.rows[line], width="stretch")
+        # 좁은 화면에서도 사진 칸과 같은 줄에 있도록 열을 접지 않음
+        for col, (name, sub, row_no) in zip(st.columns(sheet.columns, gap=None, wrap=False), cards[start:start + sheet.columns]):
+            with col:
+                st.button(
+                    str(name), key=f"{edit_param}_{row_no}", type="tertiary", width="stretch",
+                    on_click=_select_card, args=(edit_param, row_no),
+                )
+                if sub:
+                    st.caption(str(sub))
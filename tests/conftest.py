@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+import sys
+from pathlib import Path
+
+# 앱 모듈(auth, sheets ...)은 저장소 최상위에 있음
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""이 단말 접속 해제(revoke_current_device) 뒤 다시 로그인하는 흐름. 구글 시트·Streamlit 서버 없이 흉내 냄."""
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+import auth
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (iPhone)", "Accept-Language": "ko-KR"}
+
+
+class _Clock(datetime):
+    """auth 안의 datetime.now() 를 테스트에서 움직이는 시계."""
+
+    t = datetime(2026, 3, 1, 9, 0, 0).timestamp()
+
+    @classmethod
+    def now(cls, tz=None):
+        return datetime.fromtimestamp(cls.t)
+
+
+class _Cell:
+    def __init__(self, value):
+        self.value = value
+
+
+class _ConfigSheet:
+    def __init__(self):
+        self.cells = {}
+
+    def acell(self, a1):
+        return _Cell(self.cells.get(a1))
+
+    def update_acell(self, a1, value):
+        self.cells[a1] = value
+
+
+class _SessionsSheet:
+    col_count = 4
+
+    def __init__(self):
+        self.rows = [["sid", "exp", "typ"]]
+
+    def get_all_values(self):
+        return [list(r) for r in self.rows]
+
+    def append_row(self, row):
+        self.rows.append(list(row))
+
+
+@pytest.fixture
+def browser(monkeypatch):
+    st = SimpleNamespace(secrets={"encryption_key": "test-key"}, session_state={}, query_params={})
+    config_ws, sessions_ws = _ConfigSheet(), _SessionsSheet()
+    registry, revocations = auth._SessionRegistry(), auth._Revocations()
+    monkeypatch.setattr(auth, "st", st)
+    monkeypatch.setattr(auth, "_request_headers", lambda: HEADERS)
+    monkeypatch.setattr(_Clock, "t", _Clock.t)
+    monkeypatch.setattr(auth, "datetime", _Clock)
+    monkeypatch.setattr(auth, "_get_config_worksheet", lambda: config_ws)
+    monkeypatch.setattr(auth, "_get_sessions_worksheet", lambda: sessions_ws)
+    monkeypatch.setattr(auth, "_sessions", lambda: registry)
+    monkeypatch.setattr(auth, "_revocations", lambda: revocations)
+    return st
+
+
+def _password_login():
+    """check_password 에서 비밀번호가 맞았을 때와 같음."""
+    auth._issue_session((auth.datetime.now() + timedelta(days=auth.SESSION_DAYS)).timestamp())
+
+
+def _reload(st) -> dict:
+    """새로고침: 세션 상태는 비고 URL 토큰만 남음. 자동 로그인 두 경로의 결과."""
+    st.session_state = {}
+    parsed = auth._validate_session_token(st.query_params.get("session"))
+    token_ok = bool(parsed) and auth._is_token_valid(*parsed)
+    if token_ok:
+        st.session_state["auth_session_id"] = parsed[0]
+    fp_hash = auth.get_fingerprint_hash()
+    return {"token": token_ok, "fingerprint": bool(fp_hash) and auth._is_fingerprint_valid_in_sheet(fp_hash)}
+
+
+def test_revoke_then_password_login_is_accepted_on_reload(browser):
+    _password_login()
+    old_token = browser.query_params["session"]
+    assert _reload(browser) == {"token": True, "fingerprint": True}
+
+    _Clock.t += 60
+    auth.revoke_current_device()
+    assert _reload(browser) == {"token": False, "fingerprint": False}
+
+    _Clock.t += 60
+    _password_login()
+    assert _reload(browser) == {"token": True, "fingerprint": True}
+
+    # 해제 전에 발급된 토큰은 계속 막힘
+    browser.query_params["session"] = old_token
+    assert _reload(browser)["token"] is False
+
+
+def test_other_process_reads_revocation_cell(browser, monkeypatch):
+    _password_login()
+    _Clock.t += 60
+    auth.revoke_current_device()
+    _Clock.t += 60
+    _password_login()
+
+    # 셀을 새로 읽는 다른 프로세스도 새 로그인은 통과
+    monkeypatch.setattr(auth, "_revocations", lambda: auth._Revocations())
+    assert _reload(browser) == {"token": True, "fingerprint": True}
+